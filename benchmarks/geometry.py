@@ -0,0 +1,65 @@
+""" Measures time and allocations for placing the sample sheets (no drawing) """
+from __future__ import annotations
+
+import gc
+import logging
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from layout import PDF
+from layout.layout_containers import place_sheet
+from structure import reader
+from util import Margins, Rect, configure_logging
+
+CHARACTERS = Path(__file__).parent.parent.joinpath('_characters')
+
+
+def sample_sheets() -> [Path]:
+    return sorted(f for f in CHARACTERS.glob('*/*.rst') if not f.name.startswith('_'))
+
+
+def place(file: Path):
+    sheet = reader.read_sheet(file)
+    pdf = PDF(Path('/dev/null'), sheet.pagesize)
+    pdf.base_dir = file.parent
+    outer = Rect.make(left=0, top=0, right=sheet.pagesize[0], bottom=sheet.pagesize[1]) \
+            - Margins.balanced(sheet.spacing.margin)
+    return place_sheet(sheet, outer, pdf)
+
+
+def measure(file: Path, repeats: int = 3) -> (float, int, int):
+    """ Returns best time, peak traced memory and number of traced allocation blocks still alive """
+    best = None
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        place(file)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    gc.collect()
+    tracemalloc.start()
+    top = place(file)
+    snapshot = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    blocks = sum(stat.count for stat in snapshot.statistics('filename'))
+    del top
+    return best, peak, blocks
+
+
+if __name__ == '__main__':
+    configure_logging()
+    logging.disable(logging.WARNING)
+    print("%-32s %10s %12s %12s" % ('sheet', 'time (s)', 'peak (KiB)', 'live blocks'))
+    for f in sample_sheets():
+        try:
+            t, peak, blocks = measure(f)
+        except Exception as ex:
+            print("%-32s skipped: %s" % (f.name, str(ex).strip().splitlines()[-1]))
+            continue
+        print("%-32s %10.3f %12d %12d" % (f.name, t, peak // 1024, blocks))
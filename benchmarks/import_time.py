@@ -0,0 +1,67 @@
+"""
+    Measures how long the packages take to import, and which heavy dependencies importing them pulls in
+
+    Usage: python benchmarks/import_time.py [--repeats N]
+
+    Each import is timed in a fresh process, keeping the fastest of the repeats. Heavy dependencies should only be
+    imported when they are used: scipy when an optimizer searches, numpy when lines are roughened, docutils when a
+    sheet needs the full parser and yaml when a program sets up logging
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).parent.parent
+
+# What is imported, and what each program run needs
+TARGETS = ['util', 'structure', 'layout', 'zeesheet --help']
+
+HEAVY = ('scipy', 'numpy', 'docutils', 'yaml', 'reportlab.platypus', 'PIL.Image', 'colour')
+
+MEASURE = """
+import json, sys, time
+start = time.perf_counter()
+%s
+elapsed = time.perf_counter() - start
+print(json.dumps(dict(time=elapsed, heavy=[m for m in %r if m in sys.modules])))
+"""
+
+
+def _statement(target: str) -> str:
+    if target == 'zeesheet --help':
+        return "sys.argv = ['zeesheet.py', '--help']\n" \
+               "try:\n    import runpy; runpy.run_path('zeesheet.py', run_name='__main__')\n" \
+               "except SystemExit:\n    pass"
+    return 'import ' + target
+
+
+def measure(target: str, repeats: int) -> Dict:
+    best = None
+    for _ in range(repeats):
+        result = subprocess.run([sys.executable, '-c', MEASURE % (_statement(target), HEAVY)], cwd=ROOT,
+                                capture_output=True, text=True, check=True)
+        measured = json.loads(result.stdout.strip().splitlines()[-1])
+        if best is None or measured['time'] < best['time']:
+            best = measured
+    return best
+
+
+def main(args: List[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeats', type=int, default=5, help='times to import each target, keeping the fastest')
+    options = parser.parse_args(args)
+
+    print("%-20s %10s  %s" % ('import', 'time (ms)', 'heavy dependencies imported'))
+    for target in TARGETS:
+        measured = measure(target, options.repeats)
+        print("%-20s %10.1f  %s" % (target, 1000 * measured['time'], ', '.join(measured['heavy']) or '-'))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,21 @@
+"""
+    Summarizes optimizer traces, as written by 'zeesheet.py --trace'
+
+    For each optimizer it shows the runs and evaluations made, how many evaluations repeated a division already
+    evaluated in the same run, and the time taken, both in total and excluding evaluations nested within
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from util import trace
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Usage: python benchmarks/optimizer_trace.py TRACE ...")
+        sys.exit(1)
+    for name in sys.argv[1:]:
+        print(name)
+        print(trace.summarize(list(trace.read(Path(name)))))
+        print()
@@ -0,0 +1,315 @@
+"""
+    Measures each stage of making a sheet -- reading, placing and drawing -- for the samples and synthetic sheets
+
+    Usage
+    -----
+
+    python benchmarks/pipeline.py run [--repeats N] [--output FILE] [--no-synthetic] [--log-level LEVEL] [NAME ...]
+        Measure the sheets whose file names contain any of the names (all by default) and write the results as JSON;
+        keep a copy of a run as the baseline to compare later runs against. Only messages at the log level (WARNING
+        by default) or above are logged; DEBUG or FINE show what more detailed logging costs
+    python benchmarks/pipeline.py compare BASELINE [RESULTS] [--threshold FRACTION]
+        Report the differences between two runs, exiting with an error if any measure got worse by more than the
+        threshold (10% by default)
+    python benchmarks/pipeline.py scale [--output FILE] [--log-level LEVEL] [PARAMETER=VALUE,VALUE,... ...]
+        Measure synthetic sheets (see synthetic.py), changing one parameter of a base sheet at a time, and report how
+        time, evaluations and memory grow with each. Without arguments a default series is run for each parameter
+
+    Each sheet is measured in its own process, so the peak memory reported for a stage is the most that process
+    has used up to the end of that stage. Every cache is emptied between repeats, so each is timed from cold. The
+    results also hold the counts for each cache after the last repeat
+"""
+from __future__ import annotations
+
+import argparse
+import datetime
+import json
+import logging
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import math
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from synthetic import SheetSpec, write_sheet
+
+ROOT = Path(__file__).parent.parent
+CHARACTERS = ROOT.joinpath('_characters')
+DEFAULT_OUTPUT = ROOT.joinpath('_tmp', 'benchmarks', 'pipeline.json')
+DEFAULT_SCALING_OUTPUT = ROOT.joinpath('_tmp', 'benchmarks', 'scaling.json')
+
+STAGES = ('read', 'place', 'draw')
+
+# Synthetic sheets measured along with the samples
+SYNTHETIC = {
+    'synthetic-20': SheetSpec(columns=3, blocks=20, table_columns=3, spacers=True, styles=3),
+    'synthetic-40': SheetSpec(columns=3, blocks=40, table_columns=3, spacers=True, styles=3),
+}
+
+# The sheet the scaling series start from, and the values each parameter takes in turn
+SCALING_BASE = SheetSpec(columns=2, blocks=8, lines=3, thermometers=7, styles=2)
+SCALING_SERIES = {
+    'blocks': (4, 8, 16, 32),
+    'sections': (1, 2, 4, 8),
+    'columns': (1, 2, 3, 4),
+    'lines': (2, 4, 8),
+    'table_columns': (2, 4, 8),
+    'styles': (1, 4, 16),
+}
+
+# Time differences smaller than this are noise, whatever the ratio
+MIN_TIME_DIFFERENCE = 0.02
+
+
+def sample_sheets() -> List[Path]:
+    return sorted(f for f in CHARACTERS.glob('*/*.rst') if not f.name.startswith('_'))
+
+
+def _peak_rss_kib() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def measure(file: Path, repeats: int, log_level: str) -> Dict:
+    """ Run the pipeline on a sheet in this process, returning the measures for each stage """
+    from layout import PDF
+    from layout.layout_containers import draw_sheet, place_sheet
+    from structure import reader
+    from util import Margins, Optimizer, Rect, caches, configure_logging
+
+    configure_logging(level=logging.getLevelName(log_level))
+
+    evaluations = [0]
+    score_params = Optimizer.score_params
+
+    def counted(self, p):
+        evaluations[0] += 1
+        return score_params(self, p)
+
+    Optimizer.score_params = counted
+
+    data = file.read_text()
+    stages = {name: dict(time=None) for name in STAGES}
+    pdf_bytes = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for repeat in range(repeats):
+            out = Path(tmp).joinpath('%d.pdf' % repeat)
+
+            def timed(name, action):
+                evaluations[0] = 0
+                start = time.perf_counter()
+                result = action()
+                elapsed = time.perf_counter() - start
+                stage = stages[name]
+                stage['time'] = elapsed if stage['time'] is None else min(stage['time'], elapsed)
+                if repeat == 0:
+                    stage['evaluations'] = evaluations[0]
+                    stage['rss_kib'] = _peak_rss_kib()
+                return result
+
+            sheet = timed('read', lambda: reader.build_sheet(data))
+            pdf = PDF(out, sheet.pagesize)
+            pdf.base_dir = file.parent
+            outer = Rect.make(left=0, top=0, right=sheet.pagesize[0], bottom=sheet.pagesize[1]) \
+                    - Margins.balanced(sheet.spacing.margin)
+            top = timed('place', lambda: place_sheet(sheet, outer, pdf))
+            timed('draw', lambda: draw_sheet(sheet, top.group, pdf))
+            pdf_bytes = out.stat().st_size
+            # The page number has moved on past the last page
+            pages = pdf.getPageNumber() - 1
+            statistics = caches.statistics()
+            # Every repeat starts cold, so the fastest is not just the one that found everything cached
+            caches.clear()
+
+    return dict(stages=stages, pdf_bytes=pdf_bytes, pages=pages, caches=statistics)
+
+
+def _measure_in_process(file: Path, repeats: int, log_level: str) -> Dict:
+    command = [sys.executable, __file__, 'measure', str(file), str(repeats), log_level]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode:
+        lines = result.stderr.strip().splitlines() or ['exit code %d' % result.returncode]
+        return dict(error=lines[-1])
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run(names: List[str], repeats: int, synthetic: bool, output: Path, log_level: str):
+    sheets = [(f.stem, f) for f in sample_sheets() if not names or any(n in f.name for n in names)]
+    with tempfile.TemporaryDirectory() as tmp:
+        if synthetic:
+            for name, spec in SYNTHETIC.items():
+                if not names or any(n in name for n in names):
+                    sheets.append((name, write_sheet(spec, Path(tmp), name)))
+
+        results = dict()
+        print("%-24s %8s %8s %8s %12s %10s %10s" % ('sheet', 'read', 'place', 'draw', 'evaluations', 'rss (MiB)',
+                                                      'pdf (KiB)'))
+        for name, path in sheets:
+            results[name] = measured = _measure_in_process(path, repeats, log_level)
+            if 'error' in measured:
+                print("%-24s failed: %s" % (name, measured['error']))
+                continue
+            stages = measured['stages']
+            print("%-24s %8.3f %8.3f %8.3f %12d %10.1f %10d" % (
+                name, *(stages[s]['time'] for s in STAGES), sum(stages[s]['evaluations'] for s in STAGES),
+                stages['draw']['rss_kib'] / 1024, measured['pdf_bytes'] // 1024))
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(dict(created=datetime.datetime.now().isoformat(timespec='seconds'),
+                                      python=platform.python_version(), machine=platform.platform(),
+                                      repeats=repeats, log_level=log_level, sheets=results), indent=2))
+    print("Results written to %s" % output)
+
+
+def _measures(results: Dict) -> Dict[Tuple[str, str], float]:
+    """ Every measure in a set of results, keyed by sheet and a description of the measure """
+    measures = dict()
+    for name, measured in results['sheets'].items():
+        for stage, values in measured.get('stages', {}).items():
+            for key, value in values.items():
+                measures[(name, stage + ' ' + key)] = value
+        if 'pdf_bytes' in measured:
+            measures[(name, 'pdf_bytes')] = measured['pdf_bytes']
+    return measures
+
+
+def _format(value: float) -> str:
+    return str(value) if isinstance(value, int) else '%.4g' % value
+
+
+def compare(baseline: Dict, results: Dict, threshold: float) -> List[str]:
+    """ Print the changes between two runs and return descriptions of the regressions """
+    before, after = _measures(baseline), _measures(results)
+    regressions = []
+    print("%-24s %-20s %12s %12s %8s" % ('sheet', 'measure', 'baseline', 'now', 'change'))
+    for key in sorted(before.keys() & after.keys()):
+        old, new = before[key], after[key]
+        if old is None or new is None:
+            continue
+        change = (new - old) / old if old else (0.0 if new == old else float('inf'))
+        worse = change > threshold and not (key[1].endswith('time') and new - old < MIN_TIME_DIFFERENCE)
+        flag = '  <-- worse' if worse else ''
+        print("%-24s %-20s %12s %12s %+7.1f%%%s" % (*key, _format(old), _format(new), 100 * change, flag))
+        if worse:
+            regressions.append("%s %s: %.4g -> %.4g" % (*key, old, new))
+    for name in sorted(set(baseline['sheets']) - set(results['sheets'])):
+        print("%-24s missing from results" % name)
+    for name, measured in sorted(results['sheets'].items()):
+        if 'error' in measured and 'error' not in baseline['sheets'].get(name, {'error': None}):
+            regressions.append("%s failed: %s" % (name, measured['error']))
+    return regressions
+
+
+def _growth(values: List[float], measures: List[float]) -> float:
+    """ The exponent k of the best fit of measure ~ value^k, or NaN if it cannot be fitted """
+    points = [(math.log(v), math.log(m)) for v, m in zip(values, measures) if v > 0 and m > 0]
+    if len(points) < 2:
+        return math.nan
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    spread = sum((x - mean_x) ** 2 for x, _ in points)
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / spread if spread else math.nan
+
+
+def _parse_series(args: List[str]) -> Dict[str, Tuple[int, ...]]:
+    series = dict()
+    for arg in args:
+        name, _, values = arg.partition('=')
+        if name not in SheetSpec._fields or not values:
+            raise SystemExit("Expected PARAMETER=VALUE,VALUE,... with a parameter from: " + ', '.join(SheetSpec._fields))
+        series[name] = tuple(int(v) for v in values.split(','))
+    return series
+
+
+def scale(series: Dict[str, Tuple[int, ...]], output: Path, log_level: str):
+    """ Measure the base synthetic sheet with each parameter changed in turn, and report how the measures grow """
+    results = dict()
+    with tempfile.TemporaryDirectory() as tmp:
+        for parameter, values in series.items():
+            print("\n%-14s %8s %8s %8s %12s %10s %6s" % (parameter, 'place', 'draw', 'total', 'evaluations',
+                                                       'rss (MiB)', 'pages'))
+            rows = results[parameter] = []
+            for value in values:
+                spec = SCALING_BASE._replace(**{parameter: value})
+                path = write_sheet(spec, Path(tmp).joinpath('%s-%d' % (parameter, value)))
+                measured = _measure_in_process(path, 1, log_level)
+                rows.append(dict(value=value, **measured))
+                if 'error' in measured:
+                    print("%-14d failed: %s" % (value, measured['error']))
+                    continue
+                stages = measured['stages']
+                print("%-14d %8.3f %8.3f %8.3f %12d %10.1f %6d" % (
+                    value, stages['place']['time'], stages['draw']['time'], sum(stages[s]['time'] for s in STAGES),
+                    sum(stages[s]['evaluations'] for s in STAGES), stages['draw']['rss_kib'] / 1024,
+                    measured['pages']))
+
+            measured = [r for r in rows if 'error' not in r]
+            values = [r['value'] for r in measured]
+            times = [sum(r['stages'][s]['time'] for s in STAGES) for r in measured]
+            evaluations = [sum(r['stages'][s]['evaluations'] for s in STAGES) for r in measured]
+            memory = [r['stages']['draw']['rss_kib'] / 1024 for r in measured]
+            if len(measured) > 1:
+                print("growth: time ~ %s^%.2f, evaluations ~ %s^%.2f, memory %+.1f MiB from %d to %d" % (
+                    parameter, _growth(values, times), parameter, _growth(values, evaluations),
+                    memory[-1] - memory[0], values[0], values[-1]))
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(dict(created=datetime.datetime.now().isoformat(timespec='seconds'),
+                                      python=platform.python_version(), machine=platform.platform(),
+                                      log_level=log_level, base=SCALING_BASE._asdict(), series=results), indent=2))
+    print("\nResults written to %s" % output)
+
+
+def main(args: List[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='measure sheets and write the results')
+    run_parser.add_argument('names', nargs='*', help='only measure sheets whose names contain one of these')
+    run_parser.add_argument('--repeats', type=int, default=1, help='times to run each stage, keeping the fastest')
+    run_parser.add_argument('--output', type=Path, default=DEFAULT_OUTPUT)
+    run_parser.add_argument('--no-synthetic', action='store_true', help='only measure the sample sheets')
+    run_parser.add_argument('--log-level', default='WARNING', choices=['FINE', 'DEBUG', 'INFO', 'WARNING'],
+                            help='log messages at this level and above while measuring')
+
+    compare_parser = commands.add_parser('compare', help='compare results against a baseline')
+    compare_parser.add_argument('baseline', type=Path)
+    compare_parser.add_argument('results', type=Path, nargs='?', default=DEFAULT_OUTPUT)
+    compare_parser.add_argument('--threshold', type=float, default=0.1, help='fraction a measure may get worse by')
+
+    scale_parser = commands.add_parser('scale', help='report how measures grow with the size of synthetic sheets')
+    scale_parser.add_argument('series', nargs='*', metavar='PARAMETER=VALUE,VALUE,...',
+                              help='parameters to change and their values (a default series for each if none)')
+    scale_parser.add_argument('--output', type=Path, default=DEFAULT_SCALING_OUTPUT)
+    scale_parser.add_argument('--log-level', default='WARNING', choices=['FINE', 'DEBUG', 'INFO', 'WARNING'],
+                              help='log messages at this level and above while measuring')
+
+    measure_parser = commands.add_parser('measure', help=argparse.SUPPRESS)
+    measure_parser.add_argument('file', type=Path)
+    measure_parser.add_argument('repeats', type=int)
+    measure_parser.add_argument('log_level')
+
+    options = parser.parse_args(args)
+    if options.command == 'measure':
+        print(json.dumps(measure(options.file, options.repeats, options.log_level)))
+    elif options.command == 'run':
+        run(options.names, options.repeats, not options.no_synthetic, options.output, options.log_level)
+    elif options.command == 'scale':
+        scale(_parse_series(options.series) or SCALING_SERIES, options.output, options.log_level)
+    else:
+        regressions = compare(json.loads(options.baseline.read_text()), json.loads(options.results.read_text()),
+                              options.threshold)
+        if regressions:
+            print("\n%d regressions:\n  %s" % (len(regressions), "\n  ".join(regressions)))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
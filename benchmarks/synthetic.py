@@ -0,0 +1,147 @@
+"""
+    Synthetic sheets of any size, for finding out how layout scales before real sheets get that big
+
+    A 'SheetSpec' describes the sheet: how many sections and blocks, how many columns, how long and wide the blocks
+    are, and how often the special kinds of block (images, thermometers and badges) appear. The text is varied but
+    deterministic, so the same spec always gives the same sheet.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import NamedTuple
+
+import PIL.Image
+
+IMAGE_NAME = 'synthetic.png'
+
+WORDS = ('sword shield arcane blessing shadow ember frost journey ancient whisper valiant cunning mighty'
+         ' silver thunder wander oath relic harbor lantern').split()
+
+
+class SheetSpec(NamedTuple):
+    """
+        What a synthetic sheet contains
+
+        Fields
+        ------
+
+        sections
+            Number of sections, separated by transitions
+        columns
+            Columns in each section
+        blocks
+            Blocks in each section
+        lines
+            Items in each block
+        table_columns
+            Cells in each item, separated by dividers; zero for items of plain, wrapping text
+        spacers
+            Whether table items have a spacer before their last cell
+        images, thermometers, badges
+            Every n-th block is an image, thermometer or badge block; zero for none
+        styles
+            Number of styles the plain blocks cycle through
+        page_breaks
+            Whether each section starts a new page
+    """
+    sections: int = 1
+    columns: int = 2
+    blocks: int = 8
+    lines: int = 3
+    table_columns: int = 0
+    spacers: bool = False
+    images: int = 0
+    thermometers: int = 0
+    badges: int = 0
+    styles: int = 1
+    page_breaks: bool = False
+
+
+def sheet_text(spec: SheetSpec) -> str:
+    """ The ReStructuredText for a sheet; image blocks refer to IMAGE_NAME in the same directory """
+    parts = []
+    for s in range(spec.sections):
+        parts.append('.. section:: stack stack:columns=%d\n' % spec.columns)
+        for b in range(spec.blocks):
+            parts.append(_block(spec, s * spec.blocks + b))
+        last = s == spec.sections - 1
+        parts.append(('=' if spec.page_breaks and not last else '-') * 40 + '\n')
+    parts.append(_styles(spec))
+    return '\n'.join(parts)
+
+
+def write_sheet(spec: SheetSpec, directory: Path, name: str = 'synthetic') -> Path:
+    """ Write the sheet, and the image it uses, into the directory, returning the path of the sheet """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    if spec.images:
+        _write_image(directory.joinpath(IMAGE_NAME))
+    path = directory.joinpath(name + '.rst')
+    path.write_text(sheet_text(spec))
+    return path
+
+
+def _every(n: int, i: int) -> bool:
+    return n > 0 and i % n == n - 1
+
+
+def _words(i: int, count: int) -> str:
+    return ' '.join(WORDS[(i * 7 + k * 3) % len(WORDS)] for k in range(count))
+
+
+def _block(spec: SheetSpec, i: int) -> str:
+    if _every(spec.thermometers, i):
+        items = ['%s %d | **%d** | %+d' % (_words(i + j, 1).title(), j, 8 + (i + j) % 11, (i + j) % 7 - 2)
+                 for j in range(spec.lines)]
+        return _format('.. block:: thermometer thermometer:rows=3 thermometer:style=therm style=stat',
+                       'Attributes %d' % i, items)
+    if _every(spec.badges, i):
+        items = ['%s %d | | **%d** | %d' % (_words(i + j, 1).title(), j, 10 + (i + j) % 15, (i + j) % 4)
+                 for j in range(max(1, min(spec.lines, 4)))]
+        return _format('.. block:: badge badge:shape=oval badge:tags=Pool,Edge badge:shape-style=badge padding=8',
+                       'Pools %d' % i, items)
+
+    # Directives last until replaced, so plain blocks always need one after a special block
+    directive = '.. block:: style=style%d' % (i % spec.styles) if spec.styles > 1 else '.. block:: style=default'
+    if spec.table_columns:
+        items = []
+        for j in range(spec.lines):
+            cells = ['%s %d' % (_words(i + j + c, 1 + (i + c) % 3), c) for c in range(spec.table_columns)]
+            if spec.spacers and len(cells) > 1:
+                cells[-1] = '-- ' + cells[-1]
+                items.append(' | '.join(cells[:-1]) + ' ' + cells[-1])
+            else:
+                items.append(' | '.join(cells))
+    else:
+        items = ['%s **%s** *%s* [ ]' % (_words(i + j, 4 + (i * 5 + j * 3) % 23), _words(j, 1), _words(i, 2))
+                 for j in range(spec.lines)]
+    text = _format(directive, '%s %d' % (_words(i, 2).title(), i), items)
+    if _every(spec.images, i):
+        text += '\n   .. image:: %s\n' % IMAGE_NAME
+    return text
+
+
+def _format(directive: str, title: str, items) -> str:
+    lines = [directive, '', title]
+    lines += [' - ' + item for item in items]
+    return '\n'.join(lines) + '\n'
+
+
+def _styles(spec: SheetSpec) -> str:
+    families = ('Baskerville', 'Gotham', 'Helvetica', 'Courier')
+    colors = ('#004', '#400', '#040', '#444')
+    lines = ['Styles', '------', '',
+             'default', '    family=Baskerville size=9',
+             'stat', '    color=white family=Helvetica size=10',
+             'therm', '    color=white background=green roughness=0.33',
+             'badge', '    borderWidth=2 borderColor=#020 color=#8a8 background=#efe size=14 font=Gotham']
+    for k in range(spec.styles if spec.styles > 1 else 0):
+        lines += ['style%d' % k, '    family=%s size=%d color=%s' % (families[k % len(families)], 8 + k % 4,
+                                                                     colors[k % len(colors)])]
+    return '\n'.join(lines) + '\n'
+
+
+def _write_image(path: Path):
+    """ A photo-sized gradient, big enough to need downsampling """
+    image = PIL.Image.linear_gradient('L').resize((1200, 800)).convert('RGB')
+    image.save(path)
@@ -1,2 +1,4 @@
 from .pdf import PDF
-from .layout_containers import layout_sheet
\ No newline at end of file
+from .layout_cache import LayoutCache
+from .layout_containers import layout_book, layout_sheet
+from .book import make_book, make_sheet
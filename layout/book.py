@@ -0,0 +1,110 @@
+"""
+    Sheets laid out using several processes: a sheet holding several characters, or a book of several sheets
+
+    A sheet divides into units that each start on a new page (see 'Sheet.units'), so lay out independently. The
+    units are first laid out in parallel, each by a process of its own drawing into a PDF that is thrown away, so
+    that the choices the optimizers make are stored in a layout cache. Drawing everything in order then only
+    replays those choices, which takes a fraction of the time the searching did.
+"""
+from __future__ import annotations
+
+import concurrent.futures
+import contextlib
+import os
+import tempfile
+import time
+from itertools import repeat
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from structure import reader
+from util import configured_logger
+from .layout_cache import LayoutCache
+from .layout_containers import layout_book, layout_sheet
+from .pdf import PDF
+
+LOGGER = configured_logger(__name__)
+
+
+def make_sheet(file: Path, out: Path, layout_cache: LayoutCache = None, cache_dir: Path = None, debug: bool = False,
+               draft: bool = False, workers: int = None) -> Path:
+    """
+        Make a PDF from the sheet in the file, laying out the units of a sheet with several characters in parallel
+
+        Without a layout cache, one is used just for making this sheet. 'cache_dir' stores sheets once read, as for
+        'reader.read_sheet', and 'workers' limits the number of units laid out at once (by default, one per CPU)
+    """
+    file = Path(file)
+    sheet = reader.read_sheet(file, cache_dir=cache_dir)
+    units = [(file, i) for i in range(len(sheet.units()))]
+    with _laid_out_in_parallel(units, layout_cache, cache_dir, draft, workers) as cache:
+        pdf = PDF(Path(out), sheet.pagesize, debug=debug, draft=draft, layout_cache=cache)
+        pdf.base_dir = file.parent
+        layout_sheet(sheet, pdf)
+    return Path(out)
+
+
+def make_book(files: List[Path], out: Path, layout_cache: LayoutCache = None, cache_dir: Path = None,
+              draft: bool = False, workers: int = None) -> Path:
+    """
+        Make one PDF from the sheets in the files, with a bookmark for each named after the directory it is in
+
+        The units of all the sheets are laid out in parallel; the arguments are as for 'make_sheet'
+    """
+    files = [Path(f) for f in files]
+    chapters = [(f.parent.name, reader.read_sheet(f, cache_dir=cache_dir), f.parent) for f in files]
+    units = [(f, i) for f, (_, sheet, _) in zip(files, chapters) for i in range(len(sheet.units()))]
+    with _laid_out_in_parallel(units, layout_cache, cache_dir, draft, workers) as cache:
+        start = time.perf_counter()
+        pdf = PDF(Path(out), chapters[0][1].pagesize, draft=draft, layout_cache=cache)
+        layout_book(chapters, pdf)
+        LOGGER.info("Made book of %d sheets in %1.1fs", len(chapters), time.perf_counter() - start)
+    return Path(out)
+
+
+@contextlib.contextmanager
+def _laid_out_in_parallel(units: List[Tuple[Path, int]], layout_cache: Optional[LayoutCache], cache_dir: Path,
+                          draft: bool, workers: Optional[int]) -> Iterator[Optional[LayoutCache]]:
+    """
+        Lay out the units, each given by a file and its index in the sheet, yielding the cache holding their layouts
+
+        Nothing is laid out for draft layouts, which do not optimize, or with only one process to use, which would
+        do the same work twice; the given cache is yielded as it is
+    """
+    workers = min(len(units), workers or os.cpu_count() or 1)
+    if draft or workers < 2:
+        yield layout_cache
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # An empty cache is false, so test for None
+        cache = layout_cache if layout_cache is not None else LayoutCache(Path(tmp).joinpath('layouts.sqlite'))
+        try:
+            start = time.perf_counter()
+            files, indices = zip(*units)
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+                for (file, index), elapsed in zip(units, pool.map(_lay_out_alone, files, indices,
+                                                                  repeat(cache.path), repeat(cache_dir))):
+                    LOGGER.info("Laid out unit %d of '%s' in %1.1fs", index + 1, file.name, elapsed)
+            LOGGER.info("Laid out %d units using %d processes in %1.1fs", len(units), workers,
+                        time.perf_counter() - start)
+            yield cache
+        finally:
+            if cache is not layout_cache:
+                cache.close()
+
+
+def _lay_out_alone(file: Path, index: int, cache_path: Path, cache_dir: Path) -> float:
+    """ Lay out a unit of a sheet on its own, storing the choices made in the layout cache; returns the time taken """
+    start = time.perf_counter()
+    # Sheets hold colors, which cannot be sent between processes, so each process reads the sheet itself
+    unit = reader.read_sheet(file, cache_dir=cache_dir).units()[index]
+    cache = LayoutCache(cache_path)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            pdf = PDF(Path(tmp).joinpath(file.stem + '.pdf'), unit.pagesize, layout_cache=cache)
+            pdf.base_dir = file.parent
+            layout_sheet(unit, pdf)
+    finally:
+        cache.close()
+    return time.perf_counter() - start
@@ -2,17 +2,16 @@
 from __future__ import annotations
 
 import abc
+import functools
 import math
-from copy import copy
-from typing import List
+from typing import Hashable, List, Tuple
 
 from reportlab.lib.enums import TA_JUSTIFY
 from reportlab.pdfgen.pathobject import PDFPathObject
-from reportlab.platypus import Image
 
 from structure import Style
 from util import Rect, configured_logger
-from .flowables import Paragraph, Table
+from .flowables import Image, Paragraph, Table
 from .pdf import DrawMethod, PDF, line_info
 
 LOGGER = configured_logger(__name__)
@@ -31,12 +30,17 @@ class Content(abc.ABC):
             Required bounds -- where we wanted to fit
         actual
             The actual bounds that we were placed into
+
+            Both bounds are in the coordinate system of the containing group (see GroupContent.offset)
         page_break_before
             Only used for top-level sections, True => page break before this
         ignore_when_fitting
             Don't consider this when evluating how well an item fits its space
 
     """
+    __slots__ = ('pdf', 'requested', 'actual', 'unused_width', 'ok_breaks', 'bad_breaks', 'internal_variance',
+                 'page_break_before', 'ignore_when_fitting')
+
     pdf: PDF
     requested: Rect
     actual: Rect
@@ -64,6 +68,16 @@ class Content(abc.ABC):
         """ Item placed on screen"""
         raise NotImplementedError()
 
+    def __copy__(self):
+        cls = self.__class__
+        result = cls.__new__(cls)
+        for name in _slot_names(cls):
+            try:
+                setattr(result, name, getattr(self, name))
+            except AttributeError:
+                pass
+        return result
+
     def move(self, dx=0, dy=0) -> Content:
         self.actual = self.actual.move(dx=dx, dy=dy)
         self.requested = self.requested.move(dx=dx, dy=dy)
@@ -95,6 +109,8 @@ class Content(abc.ABC):
 
 
 class ParagraphContent(Content):
+    __slots__ = ('paragraph',)
+
     paragraph: Paragraph
 
     def __init__(self, paragraph: Paragraph, requested: Rect, pdf: PDF):
@@ -124,6 +140,7 @@ class ParagraphContent(Content):
 
 
 class ImageContent(Content):
+    __slots__ = ('style', 'image')
 
     def __init__(self, image: Image, requested: Rect, style: Style, pdf: PDF):
         super().__init__(requested, requested, pdf)
@@ -149,6 +166,8 @@ class ImageContent(Content):
 
 
 class TableContent(Content):
+    __slots__ = ('table',)
+
     table: Table
 
     def __init__(self, table: Table, requested: Rect, pdf: PDF):
@@ -178,6 +197,7 @@ class TableContent(Content):
 
 
 class RectContent(Content):
+    __slots__ = ('method', 'style', 'rounded')
 
     def __init__(self, bounds: Rect, style: Style, method: DrawMethod, pdf: PDF, rounded=None):
         super().__init__(bounds, bounds, pdf)
@@ -194,6 +214,7 @@ class RectContent(Content):
 
 
 class PathContent(Content):
+    __slots__ = ('method', 'style', 'path')
 
     def __init__(self, path: PDFPathObject, bounds: Rect, style: Style, method: DrawMethod, pdf: PDF):
         super().__init__(bounds, bounds, pdf)
@@ -210,6 +231,7 @@ class PathContent(Content):
 
 
 class ClipContent(Content):
+    __slots__ = ('style',)
 
     def __init__(self, bounds: Rect, style:Style, pdf: PDF):
         super().__init__(bounds, bounds, pdf)
@@ -229,6 +251,7 @@ class ClipContent(Content):
 
 
 class ErrorContent(RectContent):
+    __slots__ = ()
 
     def __init__(self, bounds: Rect, pdf: PDF):
         super().__init__(bounds, Style('err'), PDF.FILL, pdf)
@@ -241,9 +264,22 @@ class ErrorContent(RectContent):
 
 
 class GroupContent(Content):
+    """
+        A collection of content items
+
+        The children are positioned relative to the group; 'offset' translates them into the coordinate
+        system the group itself is placed in. When a group is created its offset is zero, so the children
+        and the group share coordinates. Moving a group only changes its offset and its own bounds, and copying
+        it shares the children, so both are independent of the size of the subtree. Groups can be weakly
+        referenced, so it can be checked that placed content is let go once drawn.
+    """
+    __slots__ = ('toc', 'group', 'offset', '__weakref__')
+
+    offset: Tuple[float, float]
 
     def __init__(self, children: List[Content], requested: Rect):
         self.toc = None
+        self.offset = (0, 0)
         self.group = [p for p in children if p] if children else []
         if not self.group:
             return
@@ -264,6 +300,10 @@ class GroupContent(Content):
         self.toc = (level, name)
 
     def draw(self):
+        # Bookmarks are in page coordinates, so find where the top is before we apply our offset
+        if self.toc:
+            _, top = self.pdf.absolutePosition(0, self.pdf.page_height - self.actual.top)
+
         self.pdf.saveState()
         if self.pdf.debug:
             self.pdf.setFillColorRGB(0, 0, 1, 0.05)
@@ -271,19 +311,20 @@ class GroupContent(Content):
             self.pdf.setLineWidth(2)
             self.pdf.rect(self.actual.left, self.pdf.page_height - self.actual.bottom,
                           self.actual.width, self.actual.height, fill=1, stroke=1)
+        dx, dy = self.offset
+        if dx or dy:
+            # Our y axis runs down the page; the PDF one runs up
+            self.pdf.translate(dx, -dy)
         for p in self.group:
             p.draw()
         self.pdf.restoreState()
 
         if self.toc:
-            key = "toc_{}".format(id(self))
-            self.pdf.bookmarkPage(key, top=self.pdf.page_height-self.actual.top)
-            self.pdf.addOutlineEntry(self.toc[1], key, self.toc[0])
+            self.pdf.add_bookmark(self.toc[1], self.toc[0], top)
 
     def move(self, dx=0, dy=0) -> GroupContent:
         super().move(dx, dy)
-        for p in self.group:
-            p.move(dx, dy)
+        self.offset = (self.offset[0] + dx, self.offset[1] + dy)
         return self
 
     def __getitem__(self, item):
@@ -301,16 +342,51 @@ class GroupContent(Content):
         return len(self.group)
 
     def __copy__(self):
-        # Create a new instance and copy the __dict__ items in
-        cls = self.__class__
-        pgc = cls.__new__(cls)
-        pgc.__dict__.update(self.__dict__)
+        pgc = super().__copy__()
 
-        # Deep copy the group
-        pgc.group = [copy(child) for child in self.group]
+        # Children are positioned relative to us, so they can be shared; only the list itself is copied
+        pgc.group = list(self.group)
         return pgc
 
 
+class FormContent(GroupContent):
+    """
+        A group of items that is drawn many times with exactly the same appearance
+
+        The items are drawn once into a PDF form, identified by 'key', and every placement of any form
+        content with that key just refers to that form
+    """
+    __slots__ = ('key',)
+
+    key: Hashable
+
+    def __init__(self, children: List[Content], requested: Rect, key: Hashable):
+        super().__init__(children, requested)
+        self.key = key
+
+    def draw(self):
+        self.pdf.saveState()
+        dx, dy = self.offset
+        if dx or dy:
+            self.pdf.translate(dx, -dy)
+        # The children are drawn in our own coordinates, before the offset, so the form's bounds must be too
+        self.pdf.draw_form(self.key, self.actual.move(dx=-dx, dy=-dy), self._draw_children)
+        self.pdf.restoreState()
+
+    def _draw_children(self):
+        for p in self.group:
+            p.draw()
+
+    def __str__(self, depth: int = 1) -> str:
+        return "Form" + super().__str__(depth)
+
+
+@functools.lru_cache(maxsize=None)
+def _slot_names(cls) -> Tuple[str]:
+    """ All the slots defined for a content class and its superclasses """
+    return tuple(name for c in cls.__mro__ for name in c.__dict__.get('__slots__', ()))
+
+
 def _unused_horizontal_strip(group: List[Content], bounds: Rect):
     """ Unused space, assuming items horizontally laid out, more or less"""
     ox = bounds.left
@@ -6,6 +6,8 @@ from reportlab.platypus import Flowable
 
 from structure import Element, ElementType, Run, Style
 from util import configured_logger
+from util.fonts import ensure_font
+from .images import ImageAsset
 from .pdf import PDF, _CHECKED_BOX, _TEXTFIELD, _UNCHECKED_BOX, line_info, make_paragraph_style
 
 LOGGER = configured_logger(__name__)
@@ -103,13 +105,36 @@ class Table(Flowable):
         return "T(%dx%x • %s • %s)" % (self.ncols, len(self.cells), self.colWidths, contents)
 
 
+class Image(Flowable):
+    """ An image drawn at a fixed size, embedded at the resolution needed for that size """
+    asset: ImageAsset
+
+    def __init__(self, asset: ImageAsset, width: float = None, height: float = None):
+        super().__init__()
+        self.asset = asset
+        self.imageWidth = asset.width
+        self.imageHeight = asset.height
+        self.drawWidth = width or asset.width
+        self.drawHeight = height or asset.height
+
+    def wrap(self, availWidth, availHeight):
+        return self.drawWidth, self.drawHeight
+
+    def draw(self):
+        # The PDF embeds the asset at the resolution needed, once per document
+        self.canv.drawImage(self.asset, 0, 0, self.drawWidth, self.drawHeight, mask='auto')
+
+    def __str__(self):
+        return "I(%s @ %dx%d)" % (self.asset.path.name, self.drawWidth, self.drawHeight)
+
+
 class Paragraph(reportlab.platypus.Paragraph):
 
     def __init__(self, run: Run, style: Style, pdf: PDF):
         self.run = run
         self.pdf = PDF
         leading = pdf.paragraph_leading_for(run)
-        pStyle = make_paragraph_style(style.align, style.font, style.size, leading, style.opacity, style.color.rgb)
+        pStyle = make_paragraph_style(style, leading)
 
         # Add spaces between check boxes and other items
         items = []
@@ -160,7 +185,7 @@ def _element_to_html(e: Element, pdf: PDF, base_style: Style):
         size = ''
 
     if style.font and style.font != base_style.font:
-        face = " face='%s'" % style.font
+        face = " face='%s'" % ensure_font(style.font)
     else:
         face = ''
 
@@ -185,7 +210,7 @@ def _element_to_html(e: Element, pdf: PDF, base_style: Style):
             width = round(0.6 * style.size * (len(e.value)))
         return "<img height=%d width=%s src='%s'/>" % (style.size + 2, width, _TEXTFIELD)
     if e.which != ElementType.TEXT:
-        face = " face='Symbola'"
+        face = " face='%s'" % ensure_font('Symbola')
     if face or size or color:
         return "<font %s%s%s>%s</font>" % (face, size, color, txt)
     else:
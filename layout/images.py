@@ -0,0 +1,122 @@
+""" Image files used in sheets, read once and scaled to the resolution they are drawn at """
+from __future__ import annotations
+
+import hashlib
+import io
+import math
+import os
+from pathlib import Path
+from typing import Dict, Tuple, Union
+
+import PIL.Image
+from reportlab.lib.utils import ImageReader
+
+from util import caches, configured_logger
+
+LOGGER = configured_logger(__name__)
+
+# Resolution at which images are embedded; larger images are downsampled to this before embedding
+TARGET_DPI = 300
+
+# Assets are let go, least recently used first, once their decoded pixels and scaled copies take more than this
+MAX_ASSET_BYTES = 256 * 1024 * 1024
+
+
+class ImageAsset:
+    """
+        An image file
+
+        The size is read from the file header when the asset is created; pixels are only decoded when a
+        scaled copy is needed, and then only once.
+
+        Fields
+        ------
+
+        path
+            The image file
+        width, height
+            Size in pixels
+    """
+    path: Path
+    width: int
+    height: int
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        with PIL.Image.open(path) as im:
+            # Opening only parses the header
+            self.width, self.height = im.size
+            self.format = im.format
+        self._pixels = None
+        self._digest = None
+        self._scaled: Dict[Tuple[int, int], ImageReader] = dict()
+        self._scaled_bytes = 0
+
+    @property
+    def digest(self) -> str:
+        """ Hash of the file contents, so identical files in different places can be recognized """
+        if self._digest is None:
+            self._digest = hashlib.sha1(self.path.read_bytes()).hexdigest()
+        return self._digest
+
+    @property
+    def nbytes(self) -> int:
+        """ Roughly how much memory the decoded pixels and scaled copies take """
+        pixels = len(self._pixels.getbands()) * self.width * self.height if self._pixels is not None else 0
+        return pixels + self._scaled_bytes
+
+    def pixels(self) -> PIL.Image.Image:
+        """ The decoded image """
+        if self._pixels is None:
+            with PIL.Image.open(self.path) as im:
+                im.load()
+                self._pixels = im
+        return self._pixels
+
+    def pixel_size_for(self, draw_width: float, draw_height: float, dpi: int = TARGET_DPI) -> Tuple[int, int]:
+        """ The size of the image embedded when drawing at the given size (in points) """
+        w = math.ceil(draw_width * dpi / 72)
+        h = math.ceil(draw_height * dpi / 72)
+        if w >= self.width or h >= self.height:
+            return self.width, self.height
+        else:
+            return w, h
+
+    def source_for(self, draw_width: float, draw_height: float, dpi: int = TARGET_DPI) -> Union[str, ImageReader]:
+        """
+            The image to embed when drawing at the given size (in points)
+
+            If the file has more pixels than needed at the target resolution, a downsampled copy is returned;
+            otherwise the file is used as-is
+        """
+        key = self.pixel_size_for(draw_width, draw_height, dpi)
+        if key == (self.width, self.height):
+            return str(self.path)
+
+        w, h = key
+        if key not in self._scaled:
+            LOGGER.debug("Downsampling '%s' from %dx%d to %dx%d", self.path.name, self.width, self.height, w, h)
+            scaled = self.pixels().resize(key, PIL.Image.LANCZOS)
+            buffer = io.BytesIO()
+            if self.format == 'JPEG' and scaled.mode in {'RGB', 'L', 'CMYK'}:
+                # Keep photos as JPEG so they are embedded compressed
+                scaled.save(buffer, 'JPEG', quality=90)
+            else:
+                scaled.save(buffer, 'PNG')
+            buffer.seek(0)
+            self._scaled_bytes += buffer.getbuffer().nbytes
+            self._scaled[key] = ImageReader(buffer)
+        return self._scaled[key]
+
+    def __str__(self):
+        return "Image('%s', %dx%d)" % (self.path.name, self.width, self.height)
+
+
+def image_asset(path: Path) -> ImageAsset:
+    """ The asset for a file, shared while the file is unchanged """
+    return _asset(Path(path), os.stat(path).st_mtime_ns)
+
+
+@caches.cached('image_assets', maxsize=64, max_bytes=MAX_ASSET_BYTES, sizer=lambda asset: asset.nbytes)
+def _asset(path: Path, modified: int) -> ImageAsset:
+    return ImageAsset(path)
@@ -0,0 +1,162 @@
+""" Block and section layouts stored between runs, so only new or changed content needs to be optimized """
+from __future__ import annotations
+
+import contextlib
+import functools
+import hashlib
+import pickle
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import structure
+import util
+from structure import Block, Section
+from util import configured_logger, fonts
+from util import Rect
+from util.optimize import Solution, Solutions, recording
+
+LOGGER = configured_logger(__name__)
+
+# Stored layouts are evicted, least recently used first, once they take up more than this
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Eviction goes this far below the limit, so a full cache is not searched again for every layout stored
+EVICT_TO = 0.9
+
+# When layouts were last used is written in batches of this many, so reading layouts does not lock the file
+USED_BATCH = 256
+
+
+class LayoutCache:
+    """
+        Stores the choices the optimizers made when laying out a block at a given width, or a section in given bounds
+
+        Content holds drawing objects tied to a single PDF, so rather than the content itself the cache stores the
+        solutions the optimizers found. Making content again from them needs no searching, and as the content is
+        always made afresh a stale entry can only give a less than optimal layout, never a wrong one.
+
+        Several processes may use the same file at once, each storing what it lays out for the others to use.
+        Reading a layout does not write to the file: when layouts were used is written in batches, and on closing
+    """
+
+    def __init__(self, path: Path, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.path), isolation_level=None, check_same_thread=False, timeout=60)
+        self.db.execute('CREATE TABLE IF NOT EXISTS layouts '
+                        '(key TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL)')
+        self.hits = 0
+        self.misses = 0
+        # Keys of the layouts read, with when they were read, that have not been written yet
+        self._used: Dict[str, float] = dict()
+        # The total size of the stored layouts, as far as this process knows
+        self._bytes = self._total()
+
+    def key(self, block: Block, width: int) -> str:
+        """ The key for a block laid out at this width, with the current fonts and code """
+        return hashlib.sha1(('%s:%d:%s:%s' % (block.fingerprint, width, fonts.version(), _code_version()))
+                            .encode()).hexdigest()
+
+    def section_key(self, section: Section, bounds: Rect, page: Rect) -> str:
+        """ The key for a section placed starting in the bounds, continuing onto pages of the given size """
+        return hashlib.sha1(('%s:%r:%r:%s:%s' % (section.fingerprint, tuple(bounds), tuple(page), fonts.version(),
+                                                _code_version())).encode()).hexdigest()
+
+    @contextlib.contextmanager
+    def replaying(self, key: str) -> Iterator[Solutions]:
+        """ Replay the solutions stored for the key to the optimizers run in this context, storing any changes """
+        known = self.get(key)
+        with recording(Solutions(known or ())) as solutions:
+            yield solutions
+        if solutions.found != known:
+            self.put(key, solutions.found)
+
+    def get(self, key: str) -> Optional[List[Solution]]:
+        row = self.db.execute('SELECT data FROM layouts WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        try:
+            solutions = pickle.loads(row[0])
+        except Exception as ex:
+            LOGGER.warning("Ignoring unreadable stored layout: %s", ex)
+            self.misses += 1
+            return None
+        self._used[key] = time.time()
+        if len(self._used) >= USED_BATCH:
+            self.flush()
+        self.hits += 1
+        return solutions
+
+    def put(self, key: str, solutions: List[Solution]):
+        data = pickle.dumps(solutions, protocol=pickle.HIGHEST_PROTOCOL)
+        self.db.execute('INSERT OR REPLACE INTO layouts VALUES (?, ?, ?, ?)', (key, data, len(data), time.time()))
+        self._used.pop(key, None)
+        self._bytes += len(data)
+        if self._bytes > self.max_bytes:
+            self.evict()
+
+    def flush(self):
+        """ Write when the layouts read since the last flush were used, all in one transaction """
+        if not self._used:
+            return
+        used, self._used = self._used, dict()
+        with self._transaction():
+            self.db.executemany('UPDATE layouts SET used = ? WHERE key = ?', [(t, k) for k, t in used.items()])
+
+    def evict(self):
+        """ Remove the least recently used layouts once the total size is over the limit """
+        self.flush()
+        total = self._bytes = self._total()
+        if total <= self.max_bytes:
+            return
+        removed = 0
+        with self._transaction():
+            for key, size in self.db.execute('SELECT key, size FROM layouts ORDER BY used').fetchall():
+                if total <= self.max_bytes * EVICT_TO:
+                    break
+                self.db.execute('DELETE FROM layouts WHERE key = ?', (key,))
+                total -= size
+                removed += 1
+        self._bytes = total
+        LOGGER.info("Evicted %d stored layouts", removed)
+
+    def clear(self):
+        self._used.clear()
+        self.db.execute('DELETE FROM layouts')
+        self.db.execute('VACUUM')
+        self._bytes = 0
+
+    def close(self):
+        self.evict()
+        LOGGER.info("Stored layouts: %d used, %d made", self.hits, self.misses)
+        self.db.close()
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM layouts').fetchone()[0]
+
+    def _total(self) -> int:
+        return self.db.execute('SELECT COALESCE(SUM(size), 0) FROM layouts').fetchone()[0]
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        self.db.execute('COMMIT')
+
+
+@functools.lru_cache(maxsize=None)
+def _code_version() -> str:
+    """ A hash of the code that lays out blocks, so changing it invalidates stored layouts """
+    digest = hashlib.sha1()
+    for package in (Path(__file__).parent, Path(structure.__file__).parent, Path(util.__file__).parent):
+        for path in sorted(package.glob('*.py')):
+            digest.update(path.read_bytes())
+    return digest.hexdigest()
@@ -1,89 +1,141 @@
 from __future__ import annotations
 
+import contextlib
 import functools
 import math
 import statistics
 import time
 import warnings
-from typing import List, Optional, Tuple
-
-from reportlab.platypus import Image
-
-from structure import Sheet
-from util import FINE, Margins, Optimizer, Rect, configured_logger, divide_space
-from .layout_content import make_block_layout, place_block
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from structure import Section, Sheet
+from util import FINE, Margins, Optimizer, Rect, caches, configured_logger, divide_space
+from .flowables import Image
+from .images import image_asset
+from .layout_content import place_block
 from .pdf import PDF
 from .content import Content, GroupContent
 
 LOGGER = configured_logger(__name__)
 
 
-def place_sheet(sheet: Sheet, outer: Rect, pdf: PDF) -> GroupContent:
-    children = []
+def place_in_parts(sheet: Sheet, outer: Rect, pdf: PDF) -> Iterator[GroupContent]:
+    """
+        The placed content of the sheet, one section's part of a page at a time, in the order it is drawn
+
+        Nothing placed later changes a part already made, so each can be drawn and let go as soon as it is made
+    """
     bounds = outer
     page_break = False
     for section in sheet.content:
         blocks = [functools.partial(place_block, block=block, pdf=pdf) for block in section.content]
 
-        # Add all pages creatd by stacking in columns
-        placed_pages = stack_in_columns(bounds, outer, blocks, section.spacing.padding, section.method.options, page_break)
-        children += placed_pages
+        bottom = None
+        with _stored_solutions(section, bounds, outer, page_break, pdf):
+            for part in stack_in_columns(bounds, outer, blocks, section.spacing.padding, section.method.options,
+                                         page_break, pdf.draft):
+                bottom = part.actual.bottom
+                yield part
 
         # Set bounds top for the next section
-        bounds = Rect.make(left=bounds.left, right=bounds.right,
-                           top=placed_pages[-1].actual.bottom + sheet.spacing.padding, bottom=bounds.bottom)
+        bounds = Rect.make(left=bounds.left, right=bounds.right, top=bottom + sheet.spacing.padding,
+                           bottom=bounds.bottom)
 
         LOGGER.info("Placed %s", section)
-        if hasattr(make_block_layout, 'cache_info'):
-            LOGGER.debug("Block Layout Cache info = %s", make_block_layout.cache_info())
-            make_block_layout.cache_clear()
         page_break = section.page_break_after
 
-    return GroupContent(children, outer)
+        # The layouts made for this section's blocks are not needed again, and would keep its content alive
+        caches.clear(caches.SECTION)
+
+
+def _stored_solutions(section: Section, bounds: Rect, page: Rect, break_before: bool, pdf: PDF):
+    """ Replays the column choices stored for the section, if there is a layout cache to store them in """
+    cache = pdf.layout_cache
+    if cache is None or pdf.draft or not section.fingerprint:
+        return contextlib.nullcontext()
+    # A section after a page break starts at the top of a page wherever the previous one ended, so it is stored
+    # the same way as one laid out on its own
+    return cache.replaying(cache.section_key(section, page if break_before else bounds, page))
+
+
+def place_sheet(sheet: Sheet, outer: Rect, pdf: PDF) -> GroupContent:
+    return GroupContent(list(place_in_parts(sheet, outer, pdf)), outer)
 
 
 def draw_watermark(sheet: Sheet, pdf: PDF):
-    image = sheet.watermark
-    if not image:
+    if not sheet.watermark:
         return
-    if not hasattr(image, 'imageHeight'):
-        # replace it with a real image, not the name fo the file
-        file = pdf.base_dir.joinpath(sheet.watermark)
-        image = Image(file)
-        scale = max(sheet.pagesize[0] / image.imageWidth, sheet.pagesize[1] / image.imageHeight)
-        sheet.watermark = Image(file, width=scale * image.imageWidth, height=scale * image.imageHeight)
-        sheet.watermark.wrapOn(pdf, sheet.pagesize[0], sheet.pagesize[1])
+
+    # The image data is embedded once; every page after the first only references it
+    asset = image_asset(pdf.base_dir.joinpath(sheet.watermark))
+    scale = max(sheet.pagesize[0] / asset.width, sheet.pagesize[1] / asset.height)
+    image = Image(asset, width=scale * asset.width, height=scale * asset.height)
+    image.wrapOn(pdf, sheet.pagesize[0], sheet.pagesize[1])
 
     pdf.saveState()
     pdf.resetTransforms()
-    sheet.watermark.drawOn(pdf, 0, 0)
+    image.drawOn(pdf, 0, 0)
     pdf.restoreState()
 
 
+def draw_part(sheet: Sheet, part: Content, pdf: PDF):
+    """ Draw placed content, starting a new page first if it needs one """
+    if part.page_break_before:
+        pdf.showPage()
+        draw_watermark(sheet, pdf)
+    part.draw()
+
+
 def draw_sheet(sheet: Sheet, sections: List[Content], pdf):
     draw_watermark(sheet, pdf)
     for section in sections:
-        if section.page_break_before:
-            pdf.showPage()
-            draw_watermark(sheet, pdf)
-        section.draw()
+        draw_part(sheet, section, pdf)
 
     pdf.showPage()
     pdf.save()
 
 
 def layout_sheet(sheet: Sheet, pdf: PDF):
-    margins = Margins.balanced(sheet.spacing.margin)
-    outer = Rect.make(left=0, top=0, right=sheet.pagesize[0], bottom=sheet.pagesize[1]) - margins
+    """ Place and draw the sheet, drawing each part as soon as it is placed so the content is not all kept """
     with warnings.catch_warnings(record=True) as warns:
-        top = place_sheet(sheet, outer, pdf)
+        _place_and_draw(sheet, pdf)
+        pdf.showPage()
+        pdf.save()
         for w in warns:
-            LOGGER.warning("[%s:%s] While placing: %s" % (w.filename, w.lineno, w.message))
+            LOGGER.warning("[%s:%s] While laying out: %s" % (w.filename, w.lineno, w.message))
+
+    LOGGER.debug("Caches after rendering:\n%s", caches.report())
+
+
+def layout_book(chapters: List[Tuple[str, Sheet, Path]], pdf: PDF):
+    """
+        Place and draw several sheets into one PDF, each starting on a new page under a bookmark of its own
+
+        Each chapter is the title for the bookmark, the sheet, and the directory its images are found in. Fonts,
+        images and shapes used by several sheets are stored in the PDF only once.
+    """
+    for i, (title, sheet, base_dir) in enumerate(chapters):
+        with warnings.catch_warnings(record=True) as warns:
+            if i:
+                pdf.showPage()
+            pdf.start_sheet(title, sheet.pagesize, base_dir)
+            _place_and_draw(sheet, pdf)
+            for w in warns:
+                LOGGER.warning("[%s:%s] While laying out '%s': %s" % (w.filename, w.lineno, title, w.message))
+        LOGGER.info("Laid out '%s'", title)
+    pdf.showPage()
+    pdf.save()
 
-    with warnings.catch_warnings(record=True) as warns:
-        draw_sheet(sheet, top.group, pdf)
-        for w in warns:
-            LOGGER.warning("[%s:%s] While drawing: %s" % (w.filename, w.lineno, w.message))
+    LOGGER.debug("Caches after rendering:\n%s", caches.report())
+
+
+def _place_and_draw(sheet: Sheet, pdf: PDF):
+    margins = Margins.balanced(sheet.spacing.margin)
+    outer = Rect.make(left=0, top=0, right=sheet.pagesize[0], bottom=sheet.pagesize[1]) - margins
+    draw_watermark(sheet, pdf)
+    for part in place_in_parts(sheet, outer, pdf):
+        draw_part(sheet, part, pdf)
 
 
 MIN_COLUMN_WIDTH = 40
@@ -130,13 +182,6 @@ class ColumnOptimizer(Optimizer):
 
         breaks = sum(c.error_from_breaks(30, 3) for c in columns)
         fit = sum(c.error_from_size(10, 0.01) for c in columns)
-        var = sum(c.error_from_variance(0.1) for c in columns)
-
-        if LOGGER.getEffectiveLevel() <= FINE:
-            for i, c in enumerate(columns):
-                LOGGER.fine("[%d] n=%d width=%d height=%d breaks=%1.3f fit=%1.3f", i,
-                            len(c.group), c.actual.width, c.actual.height,
-                            c.error_from_breaks(30, 3), c.error_from_size(10, 0.01))
 
         score = max_height + breaks + fit + stddev
 
@@ -145,8 +190,14 @@ class ColumnOptimizer(Optimizer):
         missed = len(self.placeables) - placed_count
         score += 1e6 * missed
 
-        LOGGER.debug("Score: %1.3f -- max_ht=%1.1f, breaks=%1.3f, fit=%1.3f, stddev=%1.3f, var=%1.3f",
-                     score, max_height, breaks, fit, stddev, var)
+        if LOGGER.isEnabledFor(FINE):
+            for i, c in enumerate(columns):
+                LOGGER.fine("[%d] n=%d width=%d height=%d breaks=%1.3f fit=%1.3f", i,
+                            len(c.group), c.actual.width, c.actual.height,
+                            c.error_from_breaks(30, 3), c.error_from_size(10, 0.01))
+            var = sum(c.error_from_variance(0.1) for c in columns)
+            LOGGER.fine("Score: %1.3f -- max_ht=%1.1f, breaks=%1.3f, fit=%1.3f, stddev=%1.3f, var=%1.3f",
+                        score, max_height, breaks, fit, stddev, var)
         return score
 
     def place_all(self, widths: Tuple[int], counts: Tuple[int]) -> List[Content]:
@@ -209,6 +260,42 @@ class ColumnWidthOptimizer(ColumnOptimizer):
         even = tuple([1 / self.k] * self.k)
         return self.make(even)
 
+    def make_sequentially(self) -> List[Content]:
+        """ Equal width columns, filled in order with the items balanced across them """
+        widths = self.vector_to_widths(tuple([1 / self.k] * self.k))
+        # Rounding can make the columns differ slightly; measure in the narrowest so everything fits
+        counts = self.sequential_counts(min(widths))
+        LOGGER.info("Draft layout for widths=%s, counts=%s", widths, counts)
+        return self.place_all(widths, counts)
+
+    def sequential_counts(self, width: int) -> List[int]:
+        """ Counts for the columns that keep the items in order and make the tallest column as short as possible """
+        column = self.outer.make_column(left=self.outer.left, width=width)
+        heights = [place(column).actual.height + self.padding for place in self.placeables]
+        n = len(heights)
+        total = [0]
+        for h in heights:
+            total.append(total[-1] + h)
+
+        # tallest[j][i] is the best height of the tallest column when putting the first i items into j columns
+        tallest = [[math.inf] * (n + 1) for _ in range(self.k + 1)]
+        split = [[0] * (n + 1) for _ in range(self.k + 1)]
+        tallest[0][0] = 0
+        for j in range(1, self.k + 1):
+            for i in range(j, n + 1):
+                for s in range(j - 1, i):
+                    t = max(tallest[j - 1][s], total[i] - total[s])
+                    if t < tallest[j][i]:
+                        tallest[j][i] = t
+                        split[j][i] = s
+
+        counts = []
+        i = n
+        for j in range(self.k, 0, -1):
+            counts.insert(0, i - split[j][i])
+            i = split[j][i]
+        return counts
+
     def brute_allocation(self, widths: Tuple[int]) -> (List[Content], float, List[int]):
         k = self.k
         N = len(self.placeables)
@@ -223,7 +310,7 @@ class ColumnWidthOptimizer(ColumnOptimizer):
             if s < best[1]:
                 best = columns, s, alloc
 
-        LOGGER.debug("Brute force allocation widths=%s: %s -> %1.3f", widths, best[2], best[1])
+        LOGGER.fine("Brute force allocation widths=%s: %s -> %1.3f", widths, best[2], best[1])
         return best
 
     def make(self, x: Tuple[float]) -> Optional[List[Content]]:
@@ -231,22 +318,22 @@ class ColumnWidthOptimizer(ColumnOptimizer):
 
         if len(self.placeables) < 10:
             result, score, div = self.brute_allocation(widths)
-            LOGGER.info("For widths=%s, best counts=%s -> %1.3f", widths, div, score)
+            LOGGER.fine("For widths=%s, best counts=%s -> %1.3f", widths, div, score)
             return result
         else:
             alloc = ColumnAllocationOptimizer(self.k, self.placeables, self.outer, widths, self.padding)
             result, (score, div) = alloc.run()
             if result is None:
-                LOGGER.info("No solution for widths=%s", widths)
-            else:
-                LOGGER.info("For widths=%s, best counts=%s -> %1.3f", widths, alloc.vector_to_counts(div), score)
+                LOGGER.fine("No solution for widths=%s", widths)
+            elif LOGGER.isEnabledFor(FINE):
+                LOGGER.fine("For widths=%s, best counts=%s -> %1.3f", widths, alloc.vector_to_counts(div), score)
             return result
 
     def vector_to_widths(self, x):
         return divide_space(x, self.available_width, MIN_COLUMN_WIDTH, granularity=5)
 
 
-def stack_together(bounds, columns, equal, padding, placeables):
+def stack_together(bounds, columns, equal, padding, placeables, draft=False):
     padding = int(padding)
     columns = int(columns)
     # Limit column count to child count -- no empty columns
@@ -260,7 +347,10 @@ def stack_together(bounds, columns, equal, padding, placeables):
         return place_in_column(placeables, bounds, padding)
     columns_optimizer = ColumnWidthOptimizer(k, placeables, bounds, padding)
     equal = equal in {True, 'True', 'true', 'yes', 'y', '1'}
-    if equal:
+    if draft:
+        LOGGER.info("Draft allocation of %d items in %d columns: %s", len(placeables), k, bounds)
+        return GroupContent(columns_optimizer.make_sequentially(), bounds)
+    elif equal:
         LOGGER.info("Allocating %d items in %d equal columns: %s", len(placeables), k, bounds)
         columns = columns_optimizer.make_for_known_widths()
         return GroupContent(columns, bounds)
@@ -277,12 +367,35 @@ def _fits(together: Content, bounds: Rect) -> int:
     return together.actual.bottom <= bounds.bottom
 
 
-def stack_in_columns(bounds: Rect, page: Rect, placeables: List, padding, options: dict, break_before:bool) -> List[GroupContent]:
-    if break_before:
-        on_next_page = stack_in_columns(page, page, placeables, padding, options, False)
-        on_next_page[0].page_break_before = True
-        return on_next_page
-
+def stack_in_columns(bounds: Rect, page: Rect, placeables: List, padding, options: dict, break_before: bool,
+                     draft: bool = False) -> Iterator[GroupContent]:
+    """ The placeables stacked into as many pages as they need, each page made only when the previous is used """
+    new_page = break_before
+    while True:
+        if new_page:
+            bounds = page
+        placed, count = _stack_on_page(bounds, page, placeables, padding, options, draft)
+        if placed is None:
+            # Set the bounds to a full page and try that
+            new_page = True
+            continue
+        if new_page:
+            placed.page_break_before = True
+        yield placed
+        if count == len(placeables):
+            return
+        # Now try the rest on a new page
+        placeables = placeables[count:]
+        new_page = True
+
+
+def _stack_on_page(bounds: Rect, page: Rect, placeables: List, padding, options: dict,
+                   draft: bool) -> Tuple[Optional[GroupContent], int]:
+    """
+        As many of the placeables as fit in the bounds, and how many that is
+
+        Returns no content when not even the first row fits and the bounds are not a full page
+    """
     equal = bool(options.get('equal', False))
     columns = int(options.get('columns', 1))
 
@@ -290,24 +403,20 @@ def stack_in_columns(bounds: Rect, page: Rect, placeables: List, padding, option
     k = min(int(columns), len(placeables))
 
     # If it fits completely, we are done
-    all = stack_together(bounds, columns, equal, padding, placeables)
+    all = stack_together(bounds, columns, equal, padding, placeables, draft)
     LOGGER.debug("Binary Search: Trying to fit all (%d), result = %s", len(placeables), _fits(all, bounds))
     if _fits(all, bounds):
-        return [all]
+        return all, len(placeables)
 
     # Try k items
-    one = stack_together(bounds, columns, equal, padding, placeables[:k])
+    one = stack_together(bounds, columns, equal, padding, placeables[:k], draft)
     if not _fits(one, bounds):
         # They don't fit, so this section will not fit on the page
         if bounds == page:
             # This section will not fit even on a full page
             warnings.warn("Even on an empty page, a section will not fit even one row of blocks")
-            return [all]
-        else:
-            # Set the bounds to a full page and try that
-            on_next_page = stack_in_columns(page, page, placeables, padding, options, False)
-            on_next_page[0].page_break_before = True
-            return on_next_page
+            return all, len(placeables)
+        return None, 0
 
     # Do binary search to see what fits. We know 'lo' fits and 'hi' does not
 
@@ -331,7 +440,7 @@ def stack_in_columns(bounds: Rect, page: Rect, placeables: List, padding, option
         if mid >= hi:
             mid = hi - 1
 
-        trial = stack_together(bounds, columns, equal, padding, placeables[:mid])
+        trial = stack_together(bounds, columns, equal, padding, placeables[:mid], draft)
         LOGGER.info("Binary Search: Trying %d of %d items, result = %s", mid, len(placeables), _fits(trial, bounds))
         if _fits(trial, bounds):
             lo = mid
@@ -342,10 +451,4 @@ def stack_in_columns(bounds: Rect, page: Rect, placeables: List, padding, option
             hi_bottom = trial.actual.bottom
 
     # assert sum(len(c.group) for c in best.group) == lo
-
-    # Now try the rest on a new page, inserting the section we just made before it
-    all = stack_in_columns(page, page, placeables[lo:], padding, options, False)
-    all[0].page_break_before = True
-    all.insert(0, best)
-
-    return all
\ No newline at end of file
+    return best, lo
\ No newline at end of file
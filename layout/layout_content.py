@@ -1,17 +1,17 @@
-import functools
 import warnings
 from copy import copy
-from functools import lru_cache
 from typing import Callable, List, Optional, Sequence, Tuple, Union
 
 from reportlab.pdfbase import pdfmetrics
-from reportlab.platypus import Flowable, Image, Paragraph
+from reportlab.platypus import Flowable
 
 from structure import Block, Element, ElementType, Run, Spacing, Style
-from util import BadParametersError, Margins, Optimizer, Rect, configured_logger, divide_space
-from .content import ClipContent, Content, ErrorContent, GroupContent, ImageContent, ParagraphContent, PathContent, \
-    RectContent, TableContent
-from .flowables import Paragraph, Table
+from util import FINE, BadParametersError, Margins, Optimizer, Rect, caches, configured_logger, divide_space
+from util.optimize import recording
+from .content import ClipContent, Content, ErrorContent, FormContent, GroupContent, ImageContent, ParagraphContent, \
+    PathContent, RectContent, TableContent
+from .flowables import Image, Paragraph, Table
+from .images import image_asset
 from .pdf import PDF
 
 LOGGER = configured_logger(__name__)
@@ -19,7 +19,7 @@ LOGGER = configured_logger(__name__)
 
 # Patch with more efficient versions
 
-@lru_cache
+@caches.cached('string_width', maxsize=4096)
 def stringWidth(text, fontName, fontSize, encoding='utf8'):
     return pdfmetrics.getFont(fontName).stringWidth(text, fontSize, encoding=encoding)
 
@@ -63,8 +63,14 @@ def _make_cells_from_run(run: Run, pdf: PDF) -> (List[Paragraph], int):
     return row, divider_count
 
 
-@lru_cache(maxsize=2048)
 def make_row_from_run(run: Run, pdf: PDF, bounds: Rect) -> [Flowable]:
+    # Flowables keep the state of their last wrap and tables track cells by object, so identical runs must not
+    # share them; only the same run gets the same flowables
+    return _make_row_from_run(run, id(run), pdf, bounds)
+
+
+@caches.cached('row_flowables', caches.SECTION, maxsize=2048)
+def _make_row_from_run(run: Run, run_id: int, pdf: PDF, bounds: Rect) -> [Flowable]:
     row, dividers = _make_cells_from_run(run, pdf)
     if not dividers:
         # Make a sub-table just for this line
@@ -105,6 +111,13 @@ class TableColumnsOptimizer(Optimizer[TableContent]):
         widths = divide_space(x, self.available_width, 10, granularity=5)
         return self._make(widths)
 
+    def make_from_content(self) -> TableContent:
+        """ Table with column widths proportional to the widest content in each column """
+        natural = [_col_width(self.cells, i, self.pdf) for i in range(self.k)]
+        widths = divide_space(natural, self.available_width, 10, granularity=5)
+        LOGGER.debug("Draft table widths = %s for content widths %s", widths, natural)
+        return self._make(widths)
+
     def _make(self, widths):
         table = Table(self.cells, self.padding, widths, self.pdf)
         return TableContent(table, self.bounds, self.pdf)
@@ -130,7 +143,10 @@ def as_table(cells, bounds: Rect, pdf: PDF, padding: int, return_as_placed=False
             return table
     else:
         optimizer = TableColumnsOptimizer(cells, padding, bounds, pdf)
-        placed, _ = optimizer.run()
+        if pdf.draft:
+            placed = optimizer.make_from_content()
+        else:
+            placed, _ = optimizer.run()
         if not placed:
             LOGGER.debug("Cannot make optimized fit for %d columns into a table of width %d", ncols, width)
             raise BadParametersError("Optimize fail: Columns likely too small for table", 100 / (1 + width))
@@ -220,6 +236,16 @@ def thermometer_layout(block: Block, bounds: Rect, pdf: PDF) -> Content:
 
     contents = []
 
+    # The shapes are the same for every row, so are defined once with the top left at the origin
+    r2 = Rect.make(left=0, top=0, height=H2, width=W2)
+    r1 = Rect.make(left=r2.right, top=(H2 - H1) / 2, width=W1 + W3, height=H1)
+
+    # Extend under the other rectangle to hide joins of 'round edges'
+    box = r1.move(dx=-H1).resize(width=r1.width + H1)
+    shapes = repeated_shapes([RectContent(box, thermo_style, PDF.FILL, pdf, rounded=rounded),
+                              RectContent(r2, thermo_style, PDF.FILL, pdf, rounded=rounded)],
+                             Rect.union([box, r2]), thermo_style, ('thermometer', box, r2, rounded))
+
     top = bounds.top
     left = bounds.left
     for i, cell in enumerate(items):
@@ -229,11 +255,7 @@ def thermometer_layout(block: Block, bounds: Rect, pdf: PDF) -> Content:
 
         r2 = Rect.make(left=left, top=top, height=H2, width=W2)
         r1 = Rect.make(left=r2.right, top=top + (H2 - H1) / 2, width=W1 + W3, height=H1)
-
-        # Extend under the other rectangle to hide joins of 'round edges'
-        box = r1.move(dx=-H1).resize(width=r1.width + H1)
-        contents.append(RectContent(box, thermo_style, PDF.FILL, pdf, rounded=rounded))
-        contents.append(RectContent(r2, thermo_style, PDF.FILL, pdf, rounded=rounded))
+        contents.append(copy(shapes).move(dx=left, dy=top))
 
         placed0 = align_vertically_within(cell[0], r1.resize(width=r1.width - W3), pdf,
                                           metrics_adjust=-0.2)
@@ -295,6 +317,7 @@ def badge_template(width: int, y: Tuple[int], shape: str, tags: List[str],
 
     inner_shape = PathContent(path, b, shape_style, PDF.STROKE, pdf)
     group = [outer_shape, inner_shape]
+    key = ('badge', shape, width, y, tuple(tags), tag_style)
 
     # tags
     if len(tags) > 0 and tags[0]:
@@ -308,7 +331,20 @@ def badge_template(width: int, y: Tuple[int], shape: str, tags: List[str],
         tag = align_vertically_within(p, r, pdf, posY=1)
         group.append(tag)
 
-    return GroupContent(group, b)
+    return GroupContent([repeated_shapes(group, b, shape_style, key)], b)
+
+
+def repeated_shapes(contents: List[Content], bounds: Rect, style: Style, key: Tuple) -> GroupContent:
+    """
+        Group shapes that will be placed many times with the same appearance
+
+        They are drawn once as a form, unless roughening is used, as that makes every copy look different
+        :param key: identifies the shapes apart from the style, which is added to it
+    """
+    if style.roughness or style.teeth:
+        return GroupContent(contents, bounds)
+    else:
+        return FormContent(contents, bounds, key + (style,))
 
 
 def badge_vertical_layout(width: int, tags: List[str], style: Style, tag_style: Style, lineWidth: float) -> Tuple[int]:
@@ -405,7 +441,7 @@ def inset_for_content_style(style: Style, spacing: Spacing):
     return round(inset)
 
 
-@lru_cache
+@caches.cached('block_layout', caches.SECTION, maxsize=256)
 def layout_block(block: Block, outer: Rect, pdf: PDF):
     has_title = block.title and block.title_method.name not in {'hidden', 'none'}
 
@@ -475,6 +511,10 @@ def content_layout(block, inner: Rect, pdf: PDF):
         return content_layout(block, inner, pdf)
 
 
+# Fraction of the width given to an image when a draft layout does not optimize it
+DRAFT_IMAGE_FRACTION = 0.3
+
+
 class ImagePlacement(Optimizer):
 
     def __init__(self, block: Block, bounds: Rect, pdf: PDF, other_layout: Callable, style) -> None:
@@ -512,8 +552,9 @@ class ImagePlacement(Optimizer):
         # Want them about the same height if possible
         size_diff = (placed[0].actual.height - placed[1].actual.height) ** 2
         score = size_diff + placed.error_from_breaks(50, 1) + placed.error_from_variance(1) - placed[0].actual.width
-        LOGGER.fine("Score: %13f (diff=%1.3f, breaks=%1.3f, var=%1.3f", score, size_diff,
-                    placed.error_from_breaks(50, 1), placed.error_from_variance(1))
+        if LOGGER.isEnabledFor(FINE):
+            LOGGER.fine("Score: %13f (diff=%1.3f, breaks=%1.3f, var=%1.3f", score, size_diff,
+                        placed.error_from_breaks(50, 1), placed.error_from_variance(1))
         return score
 
     def place_image(self, bounds: Rect):
@@ -522,22 +563,21 @@ class ImagePlacement(Optimizer):
 
     def make_image(self, bounds) -> Image:
         im_info = self.block.image
-        file = self.pdf.base_dir.joinpath(im_info['uri'])
+        asset = image_asset(self.pdf.base_dir.joinpath(im_info['uri']))
         width = int(im_info['width']) if 'width' in im_info else None
         height = int(im_info['height']) if 'height' in im_info else None
+        w, h = asset.width, asset.height
         if width and height:
-            im = Image(file, width=width, height=height, lazy=0)
+            return Image(asset, width=width, height=height)
+        elif width:
+            return Image(asset, width=width, height=h * width / w)
+        elif height:
+            return Image(asset, height=height, width=w * height / h)
+        elif w > bounds.width:
+            # Fit to the column's width
+            return Image(asset, width=bounds.width, height=h * bounds.width / w)
         else:
-            im = Image(file, lazy=0)
-            w, h = im.imageWidth, im.imageHeight
-            if width:
-                im = Image(file, width=width, height=h * width / w, lazy=0)
-            elif height:
-                im = Image(file, height=height, width=w * height / h, lazy=0)
-            elif w > bounds.width:
-                # Fit to the column's width
-                im = Image(file, width=bounds.width, height=h * bounds.width / w, lazy=0)
-        return im
+            return Image(asset)
 
 
 def image_layout(block: Block, bounds: Rect, pdf: PDF, other_layout: Callable) -> Content:
@@ -553,6 +593,12 @@ def image_layout(block: Block, bounds: Rect, pdf: PDF, other_layout: Callable) -
                 obounds = bounds.make_column(left=image.actual.right + block.spacing.padding, right=bounds.right)
             other = other_layout(block, obounds, pdf)
             return GroupContent([image, other], bounds)
+        elif pdf.draft:
+            try:
+                return placer.make((DRAFT_IMAGE_FRACTION, 1 - DRAFT_IMAGE_FRACTION))
+            except BadParametersError as ex:
+                LOGGER.debug("Draft image placement failed: %s", ex)
+                return ErrorContent(bounds, pdf)
         else:
             # Must optimize to find best image size
             placed, (score, div) = placer.run()
@@ -733,10 +779,18 @@ def make_paragraph(run: Run, pdf: PDF, align=None, size_factor=None) -> Optional
     return Paragraph(run, style, pdf)
 
 
-@functools.lru_cache(maxsize=1024)
+@caches.cached('block_layout_at_width', caches.SECTION, maxsize=1024)
 def make_block_layout(target: Block, width: int, pdf: PDF) -> Content:
     rect = Rect.make(left=0, top=0, width=width, height=1000)
-    return layout_block(target, rect, pdf)
+    cache = pdf.layout_cache
+    if cache is None or pdf.draft or not target.fingerprint:
+        # Not part of any stored solutions for the section being placed
+        with recording(None):
+            return layout_block(target, rect, pdf)
+
+    # Lay out without the in-memory cache, so the optimizers really run and their solutions are recorded
+    with cache.replaying(cache.key(target, width)):
+        return layout_block.__wrapped__(target, rect, pdf)
 
 
 def place_block(bounds: Rect, block: Block, pdf: PDF) -> Content:
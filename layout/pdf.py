@@ -1,17 +1,14 @@
 import contextlib
-import io
-from collections import defaultdict, namedtuple
-from functools import lru_cache
+from collections import namedtuple
 from pathlib import Path
 from textwrap import dedent
-from typing import Optional
+from typing import Callable, Dict, Hashable, Optional, TYPE_CHECKING
 
 import reportlab
 import reportlab.lib.colors
 from reportlab.lib import colors
 from reportlab.lib.styles import ParagraphStyle
 from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfgen import canvas
 from reportlab.pdfgen.pathobject import PDFPathObject
 from reportlab.platypus import Flowable
@@ -19,38 +16,55 @@ from reportlab.platypus.paragraph import _SplitFrag, _SplitWord
 
 from structure.model import Run
 from structure.style import DEFAULT, Style
-from util.common import Rect, configured_logger
-from util.roughen import LineModifier
+from util import caches
+from util.common import FINE, Rect, configured_logger
+from util.fonts import ensure_font, font_names, leading_for, multiplier_for
+from .images import ImageAsset
+from .layout_cache import LayoutCache
+
+if TYPE_CHECKING:
+    from util.roughen import LineModifier
 
 LOGGER = configured_logger(__name__)
 
-_CHECKED_BOX = '../resources/images/checked.png'
-_UNCHECKED_BOX = '../resources/images/unchecked.png'
-_TEXTFIELD = '../resources/images/blank.png'
-_LEADING_MAP = defaultdict(lambda: 1.2)
-_MULTIPLIER_MAP = defaultdict(lambda: 1)
+# Markers for form fields in paragraphs; anchored to the package so sheets can be made from any directory
+_IMAGES = Path(__file__).parent.parent.joinpath('resources', 'images')
+_CHECKED_BOX = str(_IMAGES.joinpath('checked.png'))
+_UNCHECKED_BOX = str(_IMAGES.joinpath('unchecked.png'))
+_TEXTFIELD = str(_IMAGES.joinpath('blank.png'))
 
 DrawMethod = namedtuple('DrawMethod', 'fill stroke')
 
+# Room around the bounds of a form for strokes drawn along its edges
+_FORM_BLEED = 20
+
 
 class PDF(canvas.Canvas):
     FILL = DrawMethod(True, False)
     STROKE = DrawMethod(False, True)
     BOTH = DrawMethod(True, True)
 
-    def __init__(self, output_file: Path, pagesize: (int, int), debug: bool = False) -> None:
+    def __init__(self, output_file: Path, pagesize: (int, int), debug: bool = False, draft: bool = False,
+                 layout_cache: LayoutCache = None) -> None:
         super().__init__(str(output_file.absolute()), pagesize=pagesize)
         self.setLineJoin(1)
         self.setLineCap(1)
-        fonts = install_fonts()
-
 
-        LOGGER.info("Installed fonts = %s", fonts)
-        # self._fonts_for_documentation(fonts)
+        # Fonts are registered when first used; see util.fonts
+        # self._fonts_for_documentation(font_names())
         self.base_dir = output_file.parent
         self.page_height = int(pagesize[1])
         self.debug = debug
+        # Draft layouts use simple rules instead of optimizing, for speed
+        self.draft = draft
+        # Block layouts stored between runs; see layout_cache
+        self.layout_cache = layout_cache
+        # Added to the level of every bookmark; see start_sheet
+        self.outline_level = 0
         self._name_index = 0
+        self._bookmark_index = 0
+        self._shared_images = dict()
+        self._forms: Dict[Hashable, str] = dict()
         self.style = None
 
     def _fonts_for_documentation(self, fonts):
@@ -70,6 +84,29 @@ class PDF(canvas.Canvas):
             print(sample.format(i))
             print()
 
+    def start_sheet(self, title: str, pagesize: (int, int), base_dir: Path):
+        """
+            Start another sheet on a new page, for documents holding several sheets
+
+            The sheet gets a top-level bookmark, and the bookmarks of its blocks go beneath it
+        """
+        self.setPageSize(pagesize)
+        # As set for the first page of every PDF, so each sheet looks the same as when made on its own
+        self.setLineJoin(1)
+        self.setLineCap(1)
+        self.page_height = int(pagesize[1])
+        self.base_dir = base_dir
+        self.outline_level = 0
+        self.add_bookmark(title, 0)
+        self.outline_level = 1
+
+    def add_bookmark(self, title: str, level: int, top: float = None):
+        """ Add an outline entry for the current page, at the given height or the top of the page """
+        self._bookmark_index += 1
+        key = 'toc_%d' % self._bookmark_index
+        self.bookmarkPage(key, top=top)
+        self.addOutlineEntry(title, key, level + self.outline_level)
+
     @contextlib.contextmanager
     def using_style(self, style: Style):
         old_style = self.style
@@ -92,11 +129,64 @@ class PDF(canvas.Canvas):
             if roughener:
                 clip = roughener.rect_to_path(x, y, width, height, inset=True)
                 self.clipPath(clip, 0, 0)
-            tup = super().drawImage(image, x, y, width, height, mask, preserveAspectRatio, anchor, anchorAtXY,
-                                    showBoundary)
+            if isinstance(image, ImageAsset):
+                tup = self._draw_shared_image(image, x, y, width, height)
+            else:
+                tup = super().drawImage(image, x, y, width, height, mask, preserveAspectRatio, anchor, anchorAtXY,
+                                        showBoundary)
             self.restoreState()
             return tup
 
+    def _draw_shared_image(self, asset: ImageAsset, x, y, width, height) -> (int, int):
+        """
+            Draw an image, embedding its data once per document
+
+            Images are identified by the contents of their file and the resolution they are embedded at, so the
+            same file drawn on every page, or copies of the same file in different places, are stored once. The
+            image is drawn into a form the size of a unit square, and each drawing scales a reference to the form
+        """
+        pixels = asset.pixel_size_for(width, height)
+        name = 'Img_%s_%dx%d' % (asset.digest[:16], *pixels)
+        if name not in self._shared_images:
+            LOGGER.debug("Embedding %s as %s", asset, name)
+            self.beginForm(name, lowerx=0, lowery=0, upperx=1, uppery=1)
+            super().drawImage(asset.source_for(width, height), 0, 0, 1, 1, mask='auto')
+            self.endForm()
+            self._shared_images[name] = asset
+
+        self.saveState()
+        self.translate(x, y)
+        self.scale(width, height)
+        self.doForm(name)
+        self.restoreState()
+        return pixels
+
+    def draw_form(self, key: Hashable, bounds: Rect, draw: Callable[[], None]):
+        """
+            Draw items that are repeated with the same appearance
+
+            The first time a key is seen, 'draw' is called to draw the items into a form; after that, and for the
+            first use too, the form is placed at the current origin
+        """
+        # Forms are drawn in page coordinates, so differ between sheets of different heights
+        key = (key, self.page_height)
+        name = self._forms.get(key)
+        if name is None:
+            name = 'Shape%d' % (len(self._forms) + 1)
+            LOGGER.debug("Creating form %s for %s", name, key[0][0] if isinstance(key[0], tuple) else key[0])
+            # Forms start with the default graphics state, so copy over the settings we changed for the page
+            line_join, line_cap = self._lineJoin, self._lineCap
+            self.beginForm(name,
+                           lowerx=bounds.left - _FORM_BLEED, upperx=bounds.right + _FORM_BLEED,
+                           lowery=self.page_height - bounds.bottom - _FORM_BLEED,
+                           uppery=self.page_height - bounds.top + _FORM_BLEED)
+            self.setLineJoin(line_join)
+            self.setLineCap(line_cap)
+            draw()
+            self.endForm()
+            self._forms[key] = name
+        self.doForm(name)
+
     def _add_checkbox(self, rx, ry, width, height, state) -> (int, int):
         x, y = self.absolutePosition(rx, ry)
         self._name_index += 1
@@ -185,26 +275,27 @@ class PDF(canvas.Canvas):
 
     def descender(self, style) -> float:
         try:
-            return -pdfmetrics.getDescent(style.font, style.size)
+            return -pdfmetrics.getDescent(ensure_font(style.font), style.size)
         except:
             return -pdfmetrics.getDescent(style.fontName, style.fontSize)
 
     def leading_for(self, item) -> float:
         try:
-            return _LEADING_MAP[item.font.lower()] * item.size
+            return leading_for(item.font) * item.size
         except AttributeError:
-            return _LEADING_MAP[item.fontName.lower()] * item.fontSize
+            return leading_for(item.fontName) * item.fontSize
 
     def __hash__(self):
         return id(self)
 
-    def _make_roughener(self, style=None) -> Optional[LineModifier]:
+    def _make_roughener(self, style=None) -> Optional['LineModifier']:
         style = style or self.style
-        if style:
+        if style and (style.roughness or style.teeth):
+            # Roughening needs numpy, so is only imported by sheets that use it
+            from util.roughen import LineModifier
             if style.roughness:
                 return LineModifier(self, 'rough', style.roughness)
-            if style.teeth:
-                return LineModifier(self, 'teeth', style.teeth)
+            return LineModifier(self, 'teeth', style.teeth)
         return None
 
     def rect_to_path(self, b: Rect, style: Style):
@@ -225,69 +316,6 @@ class PDF(canvas.Canvas):
         return path
 
 
-def install_fonts() -> [str]:
-    user_fonts = []
-    install_font('Gotham', 'Gotham', user_fonts, multiplier=0.9)
-    install_font('Baskerville', 'Baskerville', user_fonts)
-
-    install_font('Adventure', 'Adventure', user_fonts, leading=1.0)
-    install_font('Steampunk', 'Zalora', user_fonts, leading=1.1, multiplier=0.95)
-    install_font('Steamship', 'Starship', user_fonts, leading=1.15)
-    install_font('LoveYou', 'I Love What You Do', user_fonts, leading=1.1, multiplier=1.2)
-    install_font('Comics', 'back-issues-bb', user_fonts, multiplier=0.9)
-    install_font('Tech', 'oceanicdrift', user_fonts, leading=0.8, multiplier=1.2)
-    install_font('Space', 'Starjedi', user_fonts,  leading=1.1)
-    install_font('Western', 'Carnevalee Freakshow', user_fonts, leading=1.0, multiplier=1.15)
-    install_font('ArtDeco', 'CaviarDreams', user_fonts, leading=1.1)
-    install_font('Radioactive', '28 Days Later', user_fonts, leading=1.1)
-    install_font('Typewriter', 'SpecialElite', user_fonts)
-    install_font('Monster', 'mrsmonster', user_fonts, leading=1.1)
-    install_font('Script', 'Parisienne', user_fonts, leading=1.1)
-    install_font('Medieval', 'Seagram', user_fonts, leading=1.25, multiplier=1.1)
-
-    install_font('MotionPicture', 'MotionPicture', user_fonts, leading=1.0, multiplier=1.2)
-    install_font('Symbola', 'Symbola', user_fonts)
-
-    # Leading adjustments to standard fonts
-    _LEADING_MAP['courier'] = 1.1
-
-    return sorted(base_fonts() + user_fonts)
-
-
-def base_fonts():
-    cv = canvas.Canvas(io.BytesIO())
-    fonts = cv.getAvailableFonts()
-    fonts.remove('ZapfDingbats')
-    fonts.remove('Symbol')
-    return fonts
-
-
-def create_single_font(name, resource_name, default_font_name, user_fonts):
-    loc = Path(__file__).parent.parent.joinpath('resources/fonts/', resource_name + ".ttf")
-    if loc.exists():
-        font = TTFont(name, loc)
-        pdfmetrics.registerFont(font)
-        user_fonts.append(name)
-        return name
-    else:
-        return default_font_name
-
-
-def install_font(name, resource_name, user_fonts, leading: float = None, multiplier=None):
-    try:
-        pdfmetrics.getFont(name)
-    except:
-        regular = create_single_font(name, resource_name + "-Regular", None, user_fonts)
-        bold = create_single_font(name + "-Bold", resource_name + "-Bold", regular, user_fonts)
-        italic = create_single_font(name + "-Italic", resource_name + "-Italic", regular, user_fonts)
-        bold_italic = create_single_font(name + "-BoldItalic", resource_name + "-BoldItalic", bold, user_fonts)
-        pdfmetrics.registerFontFamily(name, normal=name, bold=bold, italic=italic, boldItalic=bold_italic)
-        if leading:
-            _LEADING_MAP[name.lower()] = leading
-        if multiplier:
-            _MULTIPLIER_MAP[name.lower()] = multiplier
-
-
 def line_info(p):
     """ Calculate line break info for a paragraph"""
     frags = p.blPara
@@ -295,26 +323,29 @@ def line_info(p):
         unused = min(entry[0] for entry in frags.lines)
         bad_breaks = sum(type(c) == _SplitWord for entry in frags.lines for c in entry[1])
         ok_breaks = len(frags.lines) - 1 - bad_breaks
-        LOGGER.fine("Fragments = " + " | ".join(str(c) + ":" + type(c).__name__
-                                                for entry in frags.lines for c in entry[1]))
+        if LOGGER.isEnabledFor(FINE):
+            LOGGER.fine("Fragments = %s", " | ".join(str(c) + ":" + type(c).__name__
+                                                    for entry in frags.lines for c in entry[1]))
     elif frags.kind == 1:
         unused = min(entry.extraSpace for entry in frags.lines)
         bad_breaks = sum(type(frag) == _SplitFrag for frag in p.frags)
         specified_breaks = sum(item.lineBreak for item in frags.lines)
         ok_breaks = len(frags.lines) - 1 - bad_breaks - specified_breaks
-        LOGGER.fine("Fragments = " + " | ".join((c[1][1] + ":" + type(c).__name__) for c in p.frags))
+        if LOGGER.isEnabledFor(FINE):
+            LOGGER.fine("Fragments = %s", " | ".join((c[1][1] + ":" + type(c).__name__) for c in p.frags))
     else:
         raise NotImplementedError()
     return bad_breaks, ok_breaks, unused
 
 
-@lru_cache
-def make_paragraph_style(align, font, size, leading, opacity, rgb):
-    alignment = {'left': 0, 'center': 1, 'right': 2, 'fill': 4, 'justify': 4}[align]
-    opacity = float(opacity) if opacity is not None else 1.0
-    color = reportlab.lib.colors.Color(*rgb, alpha=opacity)
-    leading *= _MULTIPLIER_MAP[font.lower()]
-    size *= _MULTIPLIER_MAP[font.lower()]
+@caches.cached('paragraph_style', maxsize=512)
+def make_paragraph_style(style: Style, leading: float) -> ParagraphStyle:
+    alignment = {'left': 0, 'center': 1, 'right': 2, 'fill': 4, 'justify': 4}[style.align]
+    opacity = float(style.opacity) if style.opacity is not None else 1.0
+    color = reportlab.lib.colors.Color(*style.color.rgb, alpha=opacity)
+    font = ensure_font(style.font)
+    leading *= multiplier_for(font)
+    size = style.size * multiplier_for(font)
     return ParagraphStyle(name='_tmp', spaceShrinkage=0.1,
                           fontName=font, fontSize=size, leading=leading,
                           allowWidows=0, embeddedHyphenation=1, alignment=alignment,
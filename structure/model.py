@@ -1,22 +1,19 @@
 from __future__ import annotations
 
+import hashlib
 import re
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 from enum import Enum
-from typing import Dict, List, NamedTuple, Optional, Union
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Union
 
 from colour import Color
 from reportlab.lib.pagesizes import letter
-from reportlab.lib.rl_accel import unicode2T1
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.pdfmetrics import Font
 
+from util import fonts
 from .style import Style
 
 BLACK = Color('black')
 
-HELVETICA: Font = pdfmetrics.getFont('Helvetica')
-
 """
     Directives
     ----------
@@ -36,6 +33,10 @@ HELVETICA: Font = pdfmetrics.getFont('Helvetica')
     title:
         method (banner, hidden)
         options: margin(dim), padding(dim), style(style), emphasis(style), strong(style)
+
+    character:
+        name (optional)
+        starts a new character on a new page; the sheet's page settings and styles apply to every character
         
 
     The margin from the lower level defaults to the padding from the level above
@@ -103,6 +104,8 @@ class Element:
 @dataclass
 class Run:
     items: List[Element] = field(default_factory=list)
+    # Identifies the content, once it is complete; see 'fixup'
+    fingerprint: Optional[str] = field(default=None, compare=False, repr=False)
 
     def __str__(self):
         return " ".join(str(e) for e in self.items)
@@ -141,9 +144,10 @@ class Run:
         # A single nbsp; is a spacer, so just use the paddign to space this out
         if len(self.items) == 1 and self.items[0].value == '&nbsp;':
             self.items[0].style =  self.items[0].style.clone(size=0)
+        self.fingerprint = _fingerprint(self.items)
 
     def __hash__(self):
-        return id(self)
+        return hash(self.fingerprint) if self.fingerprint else id(self)
 
     def with_style(self, style: Style):
         return Run([e.with_style(style) for e in self.items])
@@ -163,6 +167,7 @@ class Block:
     title_method: Method = field(default_factory=lambda: Method('banner', dict()))
     style: Style = None
     title_style: Style = None
+    fingerprint: Optional[str] = field(default=None, compare=False, repr=False)
 
     def add_title(self):
         self.title = Run()
@@ -188,7 +193,7 @@ class Block:
         return any(e.which in {ElementType.SPACER, ElementType.DIVIDER} for run in self.content for e in run.items)
 
     def __hash__(self):
-        return id(self)
+        return hash(self.fingerprint) if self.fingerprint else id(self)
 
     def fixup(self, parent: Section):
         if not self.title and not self.content and not self.image:
@@ -202,6 +207,10 @@ class Block:
                 r.fixup()
         elif not self.image:
             self.content = [ Run([Element(ElementType.TEXT, '&nbsp;', self.title.style())])]
+            self.content[0].fingerprint = _fingerprint(self.content[0].items)
+        self.fingerprint = _fingerprint(self.title and self.title.fingerprint, [r.fingerprint for r in self.content],
+                                        self.image, self.spacing, self.method, self.title_method,
+                                        self.style, self.title_style)
 
     def base_style(self) -> Optional[Style]:
         #  Lazy, just use the first
@@ -225,6 +234,9 @@ class Section:
     spacing: Spacing = Spacing(4, 4)
     style: Style = None
     page_break_after: bool = False
+    # Set on the first section of a character started by a 'character' directive; the name may be empty
+    character: Optional[str] = None
+    fingerprint: Optional[str] = field(default=None, compare=False, repr=False)
 
     def add_block(self, block: Block):
         self.content.append(block)
@@ -242,6 +254,11 @@ class Section:
             c.fixup(self)
         if not self.content:
             parent.content.remove(self)
+        self.fingerprint = _fingerprint([b.fingerprint for b in self.content], self.method, self.spacing,
+                                        self.style, self.page_break_after)
+
+    def __hash__(self):
+        return hash(self.fingerprint) if self.fingerprint else id(self)
 
     def __len__(self):
         return len(self.content)
@@ -265,6 +282,20 @@ class Sheet:
         for c in self.content:
             c.fixup(self)
 
+    def units(self) -> List[Sheet]:
+        """
+            The parts of the sheet that lay out independently of each other, in order
+
+            Each part starts on a new page, so its layout does not depend on what comes before it. Parts start at
+            each 'character' directive, or if there are none, after each hard page break
+        """
+        if any(s.character is not None for s in self.content):
+            starts = [i for i, s in enumerate(self.content) if i == 0 or s.character is not None]
+        else:
+            starts = [0] + [i + 1 for i, s in enumerate(self.content[:-1]) if s.page_break_after]
+        ends = starts[1:] + [len(self.content)]
+        return [replace(self, content=self.content[a:b]) for a, b in zip(starts, ends)]
+
     def __len__(self):
         return len(self.content)
 
@@ -272,26 +303,61 @@ class Sheet:
         return self.content[item]
 
 
-def _exists_in_helvetica(text):
-    """ If it is not substituted, it exists """
-    return unicode2T1(text, [HELVETICA])[0][0] == HELVETICA
+def _fingerprint(*parts) -> str:
+    """ A digest of the parts, which is the same in every process, so can identify content in stored results """
+    return hashlib.sha1(repr(_describe(parts)).encode()).hexdigest()
+
 
+def _describe(value):
+    """ The value, with any parts that do not have a stable representation replaced by ones that do """
+    if isinstance(value, Style):
+        return value.fingerprint
+    if isinstance(value, Color):
+        return value.rgb
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, Element):
+        return value.which.value, value.value, _describe(value.style)
+    if isinstance(value, dict):
+        return tuple((k, _describe(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(_describe(v) for v in value)
+    return value
 
-def _ensure_representable(items: List[Element]) -> List[Element]:
+
+def _ensure_representable(items: List[Element], font: str = 'Helvetica') -> List[Element]:
+    """
+        Split text so characters its font cannot draw become symbols of their own
+
+        Each item is checked against the font its style draws it in; items with no font in their style use the
+        font given
+    """
     result = []
     for item in items:
-        if item.which == ElementType.TEXT:
-            run_start = 0
-            for i, c in enumerate(item.value):
-                # If helvetica doesn't support it, call it special
-                if not _exists_in_helvetica(c):
-                    if i > run_start:
-                        result.append(Element(ElementType.TEXT, item.value[run_start:i], item.style))
-                    result.append(Element(ElementType.SYMBOL, c, item.style))
-                    run_start = i + 1
-            if len(item.value) > run_start:
-                result.append(Element(ElementType.TEXT, item.value[run_start:], item.style))
-        else:
+        if item.which != ElementType.TEXT:
             result.append(item)
-
+            continue
+        covered = _coverage(item.style, font)
+        if item.value and covered.issuperset(item.value):
+            result.append(item)
+            continue
+        run_start = 0
+        for i, c in enumerate(item.value):
+            if c not in covered:
+                if i > run_start:
+                    result.append(Element(ElementType.TEXT, item.value[run_start:i], item.style))
+                result.append(Element(ElementType.SYMBOL, c, item.style))
+                run_start = i + 1
+        if len(item.value) > run_start:
+            result.append(Element(ElementType.TEXT, item.value[run_start:], item.style))
     return result
+
+
+def _coverage(style: Optional[Style], default: str) -> FrozenSet[str]:
+    if not style or not style.font:
+        return fonts.coverage(default)
+    try:
+        return fonts.coverage(fonts.face(style.font, style.bold, style.italic))
+    except KeyError:
+        # A font that is not registered cannot be checked, so the default stands in for it
+        return fonts.coverage(default)
@@ -1,44 +1,84 @@
+import functools
 import logging
 import warnings
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional, OrderedDict, Union
+from pathlib import Path
+from typing import Dict, List, Optional, OrderedDict, Tuple, Union
 
-import docutils.frontend
-import docutils.nodes
-import docutils.parsers.rst
-import docutils.utils
-from docutils.parsers.rst import Directive, directives
 from reportlab.lib.units import cm, inch, mm
 
-from util import configured_logger, parse_options
+from util import FINE, configured_logger, parse_options
+from . import rst_subset, sheet_cache
 from .model import Block, Method, Run, Section, Sheet, Spacing
 from .style import Style, Stylesheet
 
+# The traversal of the document is traced node by node at level FINE
 LOGGER = configured_logger(__name__)
 
-LOG_UNHANDLED = True
 
+@functools.lru_cache(maxsize=None)
+def _docutils():
+    """ Docutils, set up for our directives; only imported when a sheet needs the full parser """
+    import docutils.frontend
+    import docutils.nodes
+    import docutils.parsers.rst
+    import docutils.utils
+    from docutils.parsers.rst import Directive, directives
 
-class Command(docutils.nodes.important):
-    def __init__(self, name: str, options: str):
-        super().__init__()
-        self.name = name
-        self.options = options
+    class Command(docutils.nodes.important):
+        def __init__(self, name: str, options: str):
+            super().__init__()
+            self.name = name
+            self.options = options
 
+    class DirectiveHandler(Directive):
+        required_arguments = 0
+        optional_arguments = rst_subset.MAX_ARGUMENTS
+        has_content = False
 
-class DirectiveHandler(Directive):
-    required_arguments = 0
-    optional_arguments = 100
-    has_content = False
+        def run(self):
+            return [Command(self.name, self.arguments)]
 
-    def run(self):
-        return [Command(self.name, self.arguments)]
+    for name in rst_subset.COMMANDS:
+        directives.register_directive(name, DirectiveHandler)
 
+    components = (docutils.parsers.rst.Parser,)
+    settings = docutils.frontend.OptionParser(components=components).get_default_values()
+    return docutils, settings
+
+
+class SkipChildren(Exception):
+    """ Raised by a visitor to skip the children of the node it is visiting """
+    pass
+
+
+class StopTraversal(Exception):
+    """ Raised by a visitor to stop the walk; nodes already entered are still departed """
+    pass
 
-directives.register_directive('page', DirectiveHandler)
-directives.register_directive('section', DirectiveHandler)
-directives.register_directive('block', DirectiveHandler)
-directives.register_directive('title', DirectiveHandler)
+
+def walkabout(node, visitor) -> bool:
+    """
+        Walk the tree, calling 'visit_<name>' before and 'depart_<name>' after each node's children
+
+        This works the same way for docutils trees and those built by 'rst_subset', as both name their
+        node classes the same way.
+        :return: True if the traversal was stopped
+    """
+    name = node.__class__.__name__
+    stop = False
+    try:
+        getattr(visitor, 'visit_' + name, visitor.unknown_visit)(node)
+        for child in node.children:
+            if walkabout(child, visitor):
+                stop = True
+                break
+    except SkipChildren:
+        pass
+    except StopTraversal:
+        stop = True
+    getattr(visitor, 'depart_' + name, visitor.unknown_departure)(node)
+    return stop
 
 
 def _to_size(txt: str) -> int:
@@ -58,6 +98,8 @@ class Status:
     block: Optional[Block] = None
     run: Optional[Run] = None
     directives: Dict = field(default_factory=OrderedDict)
+    # The name from a 'character' directive, until the character's first section is created
+    character: Optional[str] = None
 
     stack: List[str] = field(default_factory=list)
 
@@ -67,17 +109,18 @@ class Status:
     def _report(self) -> str:
         return " < ".join(self.stack[::-1])
 
-    def enter(self, node: docutils.nodes.Node) -> str:
+    def enter(self, node):
         self.stack.append(self._name(node))
-        return self._report()
+        if LOGGER.isEnabledFor(FINE):
+            LOGGER.fine("Entering '%s'", self._report())
 
-    def depart(self, node: docutils.nodes.Node) -> str:
-        report = self._report()
+    def depart(self, node):
+        if LOGGER.isEnabledFor(FINE):
+            LOGGER.fine("Departing '%s'", self._report())
         last = self.stack.pop()
         if last is not self._name(node):
             raise ValueError("Inconsistent departure: expected '%s', but was '%s'"
                              % (last, self._name(node)))
-        return report
 
     def within(self, name):
         return name in self.stack
@@ -86,15 +129,15 @@ class Status:
         return self.stack[-2]
 
     def target_block_title(self):
-        LOGGER.info("... Text target set to block title")
+        LOGGER.fine("... Text target set to block title")
         self.run = self.block.title
 
     def target_block_content(self):
-        LOGGER.info("... Text target set to block content")
+        LOGGER.fine("... Text target set to block content")
         self.run = self.block.content[-1]
 
     def target_nothing(self):
-        LOGGER.info("... Clearing text target")
+        LOGGER.fine("... Clearing text target")
         self.run = None
 
     def add_to_run(self, txt):
@@ -120,76 +163,87 @@ class FormatError(RuntimeError):
     pass
 
 
-def parse_rst(text: str) -> docutils.nodes.document:
+def parse_rst(text: str):
+    docutils, settings = _docutils()
     parser = docutils.parsers.rst.Parser()
-    components = (docutils.parsers.rst.Parser,)
-    settings = docutils.frontend.OptionParser(components=components).get_default_values()
     document = docutils.utils.new_document('<rst-doc>', settings=settings)
     parser.parse(text, document)
     return document
 
 
-def line_of(node: docutils.nodes.Node):
+def line_of(node):
     if node.line is None:
         return line_of(node.parent)
     else:
         return node.line
 
-class FindLastTransitionVisitor(docutils.nodes.SparseNodeVisitor):
-    last_transition: docutils.nodes.transition
-
-    def __init__(self, visitor):
-        super().__init__(visitor)
-        self.last_transition = None
-
-    def unknown_visit(self, node):
-        pass
-
-    def visit_transition(self, node: docutils.nodes.transition) -> None:
-        self.last_transition = node
-
-
-class StyleVisitor(docutils.nodes.NodeVisitor):
-
-    def __init__(self, document, last_transition):
-        super().__init__(document)
-        self.last_transition = last_transition
+def _style_section(node) -> Tuple[Optional[object], List, Optional[str]]:
+    """
+        Find the style definitions that follow the last transition, searching back from the end
+
+        Transitions are only found directly in the document or its sections, so only those are searched.
+        :return: The last transition, the nodes after it, and the title before it, which names the style that
+         definitions before the first style name modify
+    """
+    children = node.children
+    for k in range(len(children) - 1, -1, -1):
+        child = children[k]
+        name = child.__class__.__name__
+        if name == 'transition':
+            return child, list(children[k + 1:]), _last_title(children[:k])
+        if name == 'section':
+            transition, after, title = _style_section(child)
+            if transition is not None:
+                if title is None:
+                    title = _last_title(children[:k])
+                return transition, after + list(children[k + 1:]), title
+    return None, [], None
+
+
+def _last_title(nodes) -> Optional[str]:
+    for node in reversed(nodes):
+        name = node.__class__.__name__
+        if name == 'title':
+            return node.astext()
+        if name == 'section':
+            title = _last_title(node.children)
+            if title is not None:
+                return title
+    return None
+
+
+class StyleVisitor:
+    """ Defines styles from the nodes of the style section """
+
+    def __init__(self, style_name: str = None):
         self.styles = Stylesheet()
-        self.style_name = None
-        self.active = False
+        self.style_name = style_name
 
-    def visit_title(self, node: docutils.nodes.title) -> None:
+    def visit_title(self, node) -> None:
         self.style_name = node.astext()
-        raise docutils.nodes.SkipChildren
-
-    def visit_transition(self, node: docutils.nodes.transition) -> None:
-        if node == self.last_transition:
-            self.active = True
+        raise SkipChildren
 
-    def unknown_visit(self, node: docutils.nodes.Node) -> None:
+    def unknown_visit(self, node) -> None:
         pass
 
-    def unknown_departure(self, node: docutils.nodes.Node) -> None:
+    def unknown_departure(self, node) -> None:
         pass
 
     def visit_term(self, node) -> None:
-        if self.active:
-            self.style_name = node.astext()
-            LOGGER.debug("Style - Defining style '%s' using '%s'", self.style_name, node.__class__.__name__)
-        raise docutils.nodes.SkipChildren
+        self.style_name = node.astext()
+        LOGGER.debug("Style - Defining style '%s' using '%s'", self.style_name, node.__class__.__name__)
+        raise SkipChildren
 
-    def visit_Text(self, node: docutils.nodes.Text) -> None:
-        if self.active:
-            txt = node.astext().replace('\n', ' ')
-            LOGGER.debug("Style - modifying '%s' with '%s'", self.style_name, txt)
-            self.styles.define(self.style_name, **parse_options(txt))
-        raise docutils.nodes.SkipChildren
+    def visit_Text(self, node) -> None:
+        txt = node.astext().replace('\n', ' ')
+        LOGGER.debug("Style - modifying '%s' with '%s'", self.style_name, txt)
+        self.styles.define(self.style_name, **parse_options(txt))
+        raise SkipChildren
 
 
-class SheetVisitor(docutils.nodes.NodeVisitor):
+class SheetVisitor:
 
-    def __init__(self, document, styles: Stylesheet, last_transition):
-        super().__init__(document)
+    def __init__(self, styles: Stylesheet, last_transition):
         self.last_transition = last_transition
         self.styles = styles
         self.status = Status()
@@ -221,7 +275,7 @@ class SheetVisitor(docutils.nodes.NodeVisitor):
             if key in {'strong', 'emphasis'}:
                 # set the substyle for this style
                 style = getattr(item, prefix + 'style')
-                style.sub_styles[key] = self.styles.items[value]
+                setattr(item, prefix + 'style', style.with_sub_style(key, self.styles.items[value]))
             elif hasattr(item, key):
                 setattr(item, prefix + key, value)
             else:
@@ -256,56 +310,68 @@ class SheetVisitor(docutils.nodes.NodeVisitor):
 
         return opts
 
-    def visit_Command(self, node: Command):
-        LOGGER.debug("Entering '%s'", self.status.enter(node))
+    def visit_Command(self, node):
+        self.status.enter(node)
+        if node.name == 'character':
+            self.start_character(' '.join(node.options))
+            return
         LOGGER.debug("Setting directive '%s' <- %s", node.name, node.options)
         self.status.directives[node.name] = node.options
 
-    def visit_comment(self, node: docutils.nodes.comment) -> None:
-        LOGGER.debug("Entering '%s'", self.status.enter(node))
-        raise docutils.nodes.SkipChildren
+    def start_character(self, name: str):
+        """ Start a new character on a new page, keeping the directives in force """
+        LOGGER.debug("... Starting character '%s'", name)
+        if self.sheet.content:
+            self.sheet.content[-1].page_break_after = True
+        self.status.block = None
+        self.status.section = None
+        self.status.character = name
+
+    def visit_comment(self, node) -> None:
+        self.status.enter(node)
+        raise SkipChildren
 
     def visit_definition_list_item(self, node) -> None:
-        LOGGER.debug("Entering '%s'", self.status.enter(node))
+        self.status.enter(node)
         self.status.block = None
         self.create_block()
 
     def depart_definition_list_item(self, node) -> None:
-        LOGGER.debug("Departing '%s'", self.status.depart(node))
+        self.status.depart(node)
         assert self.status.block is not None
         self.status.block = None
 
     def visit_term(self, node) -> None:
-        LOGGER.debug("Entering '%s'", self.status.enter(node))
+        self.status.enter(node)
         self.status.block.add_title()
         self.status.target_block_title()
 
     def depart_term(self, node) -> None:
-        LOGGER.debug("Departing '%s'", self.status.depart(node))
+        self.status.depart(node)
         self.status.target_nothing()
 
-    def visit_title(self, node: docutils.nodes.title) -> None:
-        LOGGER.debug("Entering '%s'", self.status.enter(node))
+    def visit_title(self, node) -> None:
+        self.status.enter(node)
         self.create_block()
         self.status.block.add_title()
         self.status.target_block_title()
 
     def depart_title(self, node) -> None:
-        LOGGER.debug("Departing '%s'", self.status.depart(node))
+        self.status.depart(node)
         self.status.target_nothing()
 
     def depart_paragraph(self, node) -> None:
-        LOGGER.debug("Departing '%s'", self.status.depart(node))
+        self.status.depart(node)
         self.status.target_nothing()
 
-    def visit_transition(self, node: docutils.nodes.transition) -> None:
-        LOGGER.debug("Entering '%s'", self.status.enter(node))
+    def visit_transition(self, node) -> None:
+        self.status.enter(node)
         LOGGER.debug("... Finishing Current Section")
 
         # Check to see if we are about to process style definitions
         if node == self.last_transition:
             LOGGER.info("***** Style Sheet enocuntered: aborting regular processing")
-            raise docutils.nodes.StopTraversal
+            raise StopTraversal
         else:
             if node.rawsource.startswith('===') and self.status.section:
                 self.status.section.page_break_after = True
@@ -313,21 +379,21 @@ class SheetVisitor(docutils.nodes.NodeVisitor):
             self.status.section = None
 
 
-    def visit_list_item(self, node: docutils.nodes.list_item) -> None:
-        LOGGER.debug("Entering '%s'", self.status.enter(node))
+    def visit_list_item(self, node) -> None:
+        self.status.enter(node)
         LOGGER.info("... Creating new content in %s", self.status.block)
         self.status.block.add_content()
         self.status.target_block_content()
 
-    def depart_list_item(self, node: docutils.nodes.list_item) -> None:
-        LOGGER.debug("Departing '%s'", self.status.depart(node))
+    def depart_list_item(self, node) -> None:
+        self.status.depart(node)
         if self.status.run is not None and not self.status.run.valid():
             LOGGER.debug("Adding blank text to empty run")
             self.status.add_to_run('&nbsp;')
         self.status.target_nothing()
 
-    def visit_Text(self, node: docutils.nodes.Text) -> None:
-        LOGGER.debug("Entering '%s'", self.status.enter(node))
+    def visit_Text(self, node) -> None:
+        self.status.enter(node)
         txt = node.astext().replace('\n', ' ')
 
         if self.status.run is None:
@@ -341,8 +407,8 @@ class SheetVisitor(docutils.nodes.NodeVisitor):
 
         self.status.add_to_run(txt)
 
-    def visit_image(self, node: docutils.nodes.image) -> None:
-        LOGGER.debug("Entering '%s'", self.status.enter(node))
+    def visit_image(self, node) -> None:
+        self.status.enter(node)
 
         if self.status.block is None:
             # New block for the image
@@ -350,27 +416,24 @@ class SheetVisitor(docutils.nodes.NodeVisitor):
         LOGGER.info("... Adding image '%s'", node)
         self.status.block.image = node.attributes
 
-    def visit_system_message(self, node: docutils.nodes.system_message) -> None:
-        LOGGER.debug("Entering '%s'", self.status.enter(node))
+    def visit_system_message(self, node) -> None:
+        self.status.enter(node)
         LOGGER.debug("System warning: %s", node.astext())
-        raise docutils.nodes.SkipChildren
+        raise SkipChildren
 
-    def depart_document(self, node: docutils.nodes.document):
-        LOGGER.debug("Departing '%s'", self.status.depart(node))
+    def depart_document(self, node):
+        self.status.depart(node)
         sheet = self.status.directives_for('page')
         LOGGER.info("... Applying sheet directives and fixing structure: %s", sheet)
         self.apply_options(self.sheet, sheet)
         self.sheet.fixup()
 
-    def unknown_visit(self, node: docutils.nodes.Node) -> None:
-        txt = self.status.enter(node)
-        if LOG_UNHANDLED:
-            LOGGER.debug("Entering '%s' (no special handling)", txt)
+    def unknown_visit(self, node) -> None:
+        self.status.enter(node)
+        LOGGER.fine("... No special handling for '%s'", node.__class__.__name__)
 
-    def unknown_departure(self, node: docutils.nodes.Node) -> None:
-        txt = self.status.depart(node)
-        if LOG_UNHANDLED:
-            LOGGER.debug("Departing '%s'", txt)
+    def unknown_departure(self, node) -> None:
+        self.status.depart(node)
 
     def create_block(self):
 
@@ -391,36 +454,62 @@ class SheetVisitor(docutils.nodes.NodeVisitor):
 
         section_directives = self.status.directives_for('section')
         LOGGER.info("... Adding section with directives = %s", section_directives)
-        section = Section(style=self.styles['default-section'])
+        section = Section(style=self.styles['default-section'], character=self.status.character)
+        self.status.character = None
         self.status.section = self.apply_options(section, section_directives)
         self.sheet.content.append(self.status.section)
 
 
-def read_sheet(file) -> Sheet:
+def read_sheet(file, native: bool = True, cache_dir: Path = None) -> Sheet:
+    """
+        Read the sheet from the file
+
+        If a cache directory is given, the sheet is stored there once read and used again if neither the
+        file nor the reader changes
+    """
     with open(file, 'r') as file:
         data = file.read()
-    return build_sheet(data)
+    if cache_dir is None:
+        return build_sheet(data, native)
+
+    key = sheet_cache.cache_key(data.encode('utf-8'))
+    sheet = sheet_cache.load_sheet(cache_dir, key)
+    if sheet is None:
+        sheet = build_sheet(data, native)
+        sheet_cache.save_sheet(cache_dir, key, sheet)
+    else:
+        LOGGER.info("Using stored sheet for '%s'", file.name)
+    return sheet
+
 
+def parse_document(data: str, native: bool = True):
+    """ The document tree, using the fast reader when the text only uses the subset it handles """
+    if native:
+        try:
+            return rst_subset.parse(data)
+        except rst_subset.Unsupported as ex:
+            LOGGER.info("Using docutils to read sheet: %s", ex)
+    return parse_rst(data)
 
-def build_sheet(data):
+
+def build_sheet(data: str, native: bool = True) -> Sheet:
     with warnings.catch_warnings(record=True) as warns:
         warnings.simplefilter("always")
-        doc = parse_rst(data)
-
-        last_visitor = FindLastTransitionVisitor(doc)
-        doc.walk(last_visitor)
-        last_transition = last_visitor.last_transition
+        doc = parse_document(data, native)
 
-        style_visitor = StyleVisitor(doc, last_transition)
-        doc.walkabout(style_visitor)
+        # Styles are needed to build the blocks, so are read first from the end of the document
+        last_transition, style_nodes, title = _style_section(doc)
+        style_visitor = StyleVisitor(title)
+        for node in style_nodes:
+            walkabout(node, style_visitor)
         styles = style_visitor.styles
 
-        if LOGGER.getEffectiveLevel() <= logging.DEBUG:
+        if LOGGER.isEnabledFor(logging.DEBUG):
             for k, v in styles.items.items():
                 LOGGER.debug('.. style %16s = %s', k, v)
 
-        sheet_visitor = SheetVisitor(doc, styles, last_transition)
-        doc.walkabout(sheet_visitor)
+        sheet_visitor = SheetVisitor(styles, last_transition)
+        walkabout(doc, sheet_visitor)
         sheet = sheet_visitor.sheet
         sheet.fixup()
 
@@ -0,0 +1,452 @@
+"""
+    A fast reader for the subset of reStructuredText that sheets are written in
+
+    It builds a tree of nodes with the same class names and structure as docutils would, so the reader's visitors
+    handle both the same way. Anything outside the subset raises 'Unsupported', and the caller falls back to
+    docutils. The subset is:
+
+        - the 'page', 'section', 'block', 'title' and 'character' directives, and images with simple options
+        - comments and transitions
+        - section titles (underlined only)
+        - paragraphs, definition lists, bullet lists and indented blocks
+        - strong and emphasis inline markup
+
+    Section nesting is not built, as nothing in the reader depends on it; titles are placed in document order.
+"""
+from __future__ import annotations
+
+import re
+from typing import Dict, List, Tuple
+
+
+class Unsupported(ValueError):
+    """ The text uses something outside the subset, so needs the full docutils parser """
+    pass
+
+
+class Node:
+    """ A node in the document tree, with the fields the reader uses from the docutils equivalent """
+
+    def __init__(self, children: List[Node] = None, rawsource: str = ''):
+        self.children = children or []
+        self.rawsource = rawsource
+        self.attributes = dict()
+
+    def astext(self) -> str:
+        return ''.join(c.astext() for c in self.children)
+
+
+class Text(Node):
+    def __init__(self, text: str):
+        super().__init__()
+        self.text = text
+
+    def astext(self) -> str:
+        return self.text
+
+
+class Command(Node):
+    def __init__(self, name: str, options: List[str]):
+        super().__init__()
+        self.name = name
+        self.options = options
+
+
+# The remaining nodes are named as docutils names them, as visitors dispatch on the class name
+# noinspection PyPep8Naming
+class document(Node): pass
+
+
+# noinspection PyPep8Naming
+class title(Node): pass
+
+
+# noinspection PyPep8Naming
+class paragraph(Node): pass
+
+
+# noinspection PyPep8Naming
+class strong(Node): pass
+
+
+# noinspection PyPep8Naming
+class emphasis(Node): pass
+
+
+# noinspection PyPep8Naming
+class bullet_list(Node): pass
+
+
+# noinspection PyPep8Naming
+class list_item(Node): pass
+
+
+# noinspection PyPep8Naming
+class definition_list(Node): pass
+
+
+# noinspection PyPep8Naming
+class definition_list_item(Node): pass
+
+
+# noinspection PyPep8Naming
+class term(Node): pass
+
+
+# noinspection PyPep8Naming
+class definition(Node): pass
+
+
+# noinspection PyPep8Naming
+class block_quote(Node): pass
+
+
+# noinspection PyPep8Naming
+class transition(Node): pass
+
+
+# noinspection PyPep8Naming
+class comment(Node): pass
+
+
+# noinspection PyPep8Naming
+class image(Node): pass
+
+
+COMMANDS = {'page', 'section', 'block', 'title', 'character'}
+MAX_ARGUMENTS = 100
+
+# A line of four or more of the same punctuation character
+_TRANSITION = re.compile(r'([!-/:-@\[-`{-~])\1{3,}$')
+_ADORNMENT = re.compile(r'([!-/:-@\[-`{-~])\1*$')
+_BULLET = re.compile(r'[-+*•‣⁃]( +|$)')
+_EXPLICIT = re.compile(r'\.\.( +|$)')
+_DIRECTIVE = re.compile(r'\.\. +((?:(?!_)\w)+(?:[-._+:](?:(?!_)\w)+)*) *::( +|$)')
+_OPTION = re.compile(r':([\w-]+): *(.*)$')
+
+# Starts of body elements that are not in the subset: enumerated, field and option lists, doctests, line blocks,
+# tables, anonymous targets and other explicit markup (targets, footnotes and substitutions)
+_OPTION_ARG = r'([a-zA-Z][\w-]*|<[^<>]+>)'
+_OPTION_NAME = r'((-|\+)[a-zA-Z0-9]( ?%s)?|(--|/)[a-zA-Z0-9][\w-]*([ =]%s)?)' % (_OPTION_ARG, _OPTION_ARG)
+_UNSUPPORTED_LINE = re.compile(r'\(?([0-9]+|[a-zA-Z#]|[ivxlcdmIVXLCDM]+)[.)]( +|$)'
+                               r'|:(?![: ])([^:\\]|\\.|:(?!([ `]|$)))*(?<! ):( +|$)'
+                               r'|%s(, %s)*(  +| ?$)' % (_OPTION_NAME, _OPTION_NAME) +
+                               r'|>>>( +|$)|\|( +|$)|\+-[-+]+-\+ *$|=+( +=+)+ *$|__( +|$)|\.\. +[_\[|]')
+
+# Inline markup other than strong and emphasis: literals, interpreted text, references, footnotes,
+# substitutions, standalone email addresses and escapes
+_UNSUPPORTED_INLINE = re.compile(r'[`\\]|[^\W_]__?(?!\w)|]_|\|(?![\s|]|$)|\w@\w')
+
+# Standalone links are recognized for these schemes
+_URI = re.compile(r'([a-zA-Z][a-zA-Z0-9.+-]*):(?=\S)')
+_URI_SCHEMES = set("""
+    about acap addbook afp afs aim callto castanet chttp cid crid data dav dict dns eid fax feed file finger freenet
+    ftp go gopher gsm-sms h323 h324 hdl hnews http https hydra iioploc ilu im imap info ior ipp irc iris.beep iseek
+    jar javascript jdbc ldap lifn livescript lrq mailbox mailserver mailto md5 mid mocha modem mtqp mupdate news nfs
+    nntp opaquelocktoken phone pop pop3 pres printer prospero rdar res rtsp rvp rwhois rx sdp service shttp sip sips
+    smb snews snmp soap.beep soap.beeps ssh t120 tag tcp tel telephone telnet tftp tip tn3270 tv urn uuid vemmi
+    videotex view-source wais whodp whois++ x-man-page xmlrpc.beep xmlrpc.beeps z39.50r z39.50s
+""".split())
+
+_START = re.compile(r'''(?:^|(?<=[\s"'(<\[{\-/:]))(\*\*|\*(?!\*))(?!\s)''')
+_END = {
+    '**': re.compile(r'''(?<!\s)(\*\*)(?:$|(?=[\s\\.,;!?\-/:"')>\]}]))'''),
+    '*': re.compile(r'''(?<!\s)(\*)(?:$|(?=[\s\\.,;!?\-/:"')>\]}]))''')
+}
+_INLINE_CLASS = {'**': strong, '*': emphasis}
+_QUOTES = {'"': '"', "'": "'", '(': ')', '<': '>', '[': ']', '{': '}'}
+
+_IMAGE_ALIGN = {'left', 'center', 'right'}
+_LENGTH = re.compile(r'([0-9.]+) *(em|ex|px|in|cm|mm|pt|pc|)$')
+_LENGTH_OR_PERCENT = re.compile(r'([0-9.]+) *(em|ex|px|in|cm|mm|pt|pc|%|)$')
+
+
+def parse(text: str) -> document:
+    """ Parse the text into a document tree, raising 'Unsupported' if it needs the full parser """
+    lines = [line.expandtabs(8).rstrip() for line in re.sub('[\v\f]', ' ', text).splitlines()]
+    return document(_Parser().body(lines, top=True))
+
+
+class _Parser:
+    def __init__(self):
+        # Adornment characters of the section titles in order of level, and the current level
+        self.title_styles: List[str] = []
+        self.level = 0
+
+    def body(self, lines: List[str], top: bool = False) -> List[Node]:
+        """ The body elements in lines that are all indented by at least zero """
+        result = []
+        i = 0
+        while i < len(lines):
+            line = lines[i]
+            if not line:
+                i += 1
+                continue
+
+            if line[0] == ' ':
+                block, i = _indented(lines, i)
+                quote = block_quote(self.body(_dedent(block)))
+                if any(isinstance(c, paragraph) and c.rawsource.startswith(('--', '—')) for c in quote.children):
+                    # Would be an attribution
+                    raise Unsupported("Block quote attribution")
+                result.append(quote)
+            elif _EXPLICIT.match(line):
+                node, i = self.explicit(lines, i)
+                result.append(node)
+            elif _TRANSITION.match(line):
+                if i + 1 < len(lines) and lines[i + 1]:
+                    raise Unsupported("Title with an overline")
+                if not top:
+                    raise Unsupported("Transition in a nested block")
+                result.append(transition(rawsource=line))
+                i += 1
+            elif _BULLET.match(line):
+                node, i = self.bullet_list(lines, i)
+                result.append(node)
+            else:
+                _check_line(line)
+                following = lines[i + 1] if i + 1 < len(lines) else ''
+                if following and _ADORNMENT.match(following) and following[0] != ' ':
+                    if not top:
+                        raise Unsupported("Section title in a nested block")
+                    result.append(self.title(line, following))
+                    i += 2
+                elif following and following[0] == ' ':
+                    node, i = self.definition_list(lines, i)
+                    result.append(node)
+                else:
+                    node, i = self.paragraph(lines, i)
+                    result.append(node)
+        return result
+
+    def title(self, line: str, underline: str) -> title:
+        if len(underline) < len(line):
+            raise Unsupported("Title underline too short")
+        style = underline[0]
+        if style in self.title_styles:
+            self.level = self.title_styles.index(style) + 1
+        elif self.level == len(self.title_styles):
+            self.title_styles.append(style)
+            self.level += 1
+        else:
+            raise Unsupported("Inconsistent title levels")
+        return title(_inline(line), rawsource=line)
+
+    def paragraph(self, lines: List[str], i: int) -> Tuple[paragraph, int]:
+        start = i
+        while i < len(lines) and lines[i]:
+            line = lines[i]
+            if line[0] == ' ':
+                raise Unsupported("Unexpected indentation")
+            if i > start and (_TRANSITION.match(line) or line.startswith('..')):
+                raise Unsupported("Markup within a paragraph")
+            i += 1
+        text = '\n'.join(lines[start:i])
+        if text.endswith('::'):
+            raise Unsupported("Literal block")
+        return paragraph(_inline(text), rawsource=text), i
+
+    def definition_list(self, lines: List[str], i: int) -> Tuple[definition_list, int]:
+        items = []
+        while True:
+            line = lines[i]
+            if ' : ' in line:
+                raise Unsupported("Definition list classifier")
+            block, i = _indented(lines, i + 1)
+            items.append(definition_list_item([term(_inline(line), rawsource=line),
+                                               definition(self.body(_dedent(block)))]))
+
+            # The list continues, after any blank lines, with another term followed by its definition
+            j = i
+            while j < len(lines) and not lines[j]:
+                j += 1
+            if j + 1 < len(lines) and _is_term(lines[j]) and lines[j + 1].startswith(' '):
+                _check_line(lines[j])
+                i = j
+            else:
+                return definition_list(items), i
+
+    def bullet_list(self, lines: List[str], i: int) -> Tuple[bullet_list, int]:
+        bullet = lines[i][0]
+        items = []
+        while True:
+            match = _BULLET.match(lines[i])
+            first = lines[i][match.end():]
+            if first:
+                # Following lines line up with the text after the bullet
+                block, i = _indented(lines, i + 1, match.end())
+                items.append(list_item(self.body([first] + [line[match.end():] for line in block])))
+            else:
+                block, i = _indented(lines, i + 1)
+                items.append(list_item(self.body(_dedent(block))))
+
+            # Skip blank lines between items
+            j = i
+            while j < len(lines) and not lines[j]:
+                j += 1
+            if j < len(lines) and lines[j][0] == bullet and _BULLET.match(lines[j]):
+                i = j
+            else:
+                return bullet_list(items), i
+
+    def explicit(self, lines: List[str], i: int) -> Tuple[Node, int]:
+        line = lines[i]
+        if _UNSUPPORTED_LINE.match(line):
+            raise Unsupported("Explicit markup '%s'" % line)
+        if line == '..' and (i + 1 == len(lines) or not lines[i + 1]):
+            # An empty comment ends at the blank line, and any indented text after it is a block quote
+            return comment(rawsource=''), i + 1
+        match = _DIRECTIVE.match(line)
+        block, end = _indented(lines, i + 1)
+        block = _dedent(block)
+        if not match:
+            # A comment holds all the text as it was written
+            text = [line[_EXPLICIT.match(line).end():]] + block
+            while text and not text[0]:
+                text.pop(0)
+            return comment([Text('\n'.join(text))] if any(text) else [], rawsource='\n'.join(text)), end
+
+        name = match.group(1)
+        first = line[match.end():]
+        if name == 'image':
+            return image_node(first, block), end
+        if name not in COMMANDS:
+            raise Unsupported("Directive '%s'" % name)
+
+        # All the lines up to a blank line are arguments; no content is allowed
+        arguments = [first]
+        for k, text in enumerate(block):
+            if not text:
+                if any(block[k:]):
+                    raise Unsupported("Content in directive '%s'" % name)
+                break
+            arguments.append(text)
+        arguments = ' '.join(arguments).split()
+        if len(arguments) > MAX_ARGUMENTS:
+            raise Unsupported("Too many arguments for directive '%s'" % name)
+        return Command(name, arguments), end
+
+
+def image_node(first: str, block: List[str]) -> image:
+    """ An image directive with the attributes docutils would give it """
+    uri_lines = [first]
+    k = 0
+    while k < len(block) and block[k] and not block[k].startswith(':'):
+        uri_lines.append(block[k])
+        k += 1
+    uri = ''.join(''.join(uri_lines).split())
+    if not uri:
+        raise Unsupported("Image without a URI")
+
+    options: Dict[str, object] = dict()
+    for text in block[k:]:
+        if not text:
+            raise Unsupported("Image content")
+        match = _OPTION.match(text)
+        if not match:
+            raise Unsupported("Image content '%s'" % text)
+        key, value = match.group(1), match.group(2).strip()
+        if key == 'align' and value in _IMAGE_ALIGN:
+            options[key] = value
+        elif key in {'height', 'width'}:
+            pattern = _LENGTH if key == 'height' else _LENGTH_OR_PERCENT
+            measure = pattern.match(value)
+            if not measure or not _is_number(measure.group(1)):
+                raise Unsupported("Image %s '%s'" % (key, value))
+            options[key] = measure.group(1) + measure.group(2)
+        elif key == 'scale' and value.rstrip(' %').isdigit():
+            options[key] = int(value.rstrip(' %'))
+        elif key == 'alt':
+            options[key] = value
+        else:
+            raise Unsupported("Image option '%s'" % text)
+
+    node = image(rawsource='\n'.join([first] + block))
+    node.attributes = dict(ids=[], classes=[], names=[], dupnames=[], **options, uri=uri)
+    return node
+
+
+def _is_number(txt: str) -> bool:
+    try:
+        float(txt)
+        return True
+    except ValueError:
+        return False
+
+
+def _is_term(line: str) -> bool:
+    return bool(line) and line[0] != ' ' and not _EXPLICIT.match(line) and not _BULLET.match(line) \
+           and not _TRANSITION.match(line)
+
+
+def _check_line(line: str):
+    if _UNSUPPORTED_LINE.match(line) or _ADORNMENT.match(line):
+        raise Unsupported("Unsupported element '%s'" % line)
+
+
+def _indented(lines: List[str], i: int, indent: int = 1) -> Tuple[List[str], int]:
+    """ The lines from i that are indented by at least 'indent' or blank, without trailing blank lines """
+    start = i
+    while i < len(lines) and (not lines[i] or not lines[i][:indent].strip()):
+        i += 1
+    end = i
+    while end > start and not lines[end - 1]:
+        end -= 1
+    return lines[start:end], end
+
+
+def _dedent(lines: List[str]) -> List[str]:
+    indents = [len(line) - len(line.lstrip(' ')) for line in lines if line]
+    if not indents:
+        return list(lines)
+    d = min(indents)
+    return [line[d:] for line in lines]
+
+
+def _inline(text: str) -> List[Node]:
+    """ Split text into text, strong and emphasis nodes the same way as docutils """
+    if _UNSUPPORTED_INLINE.search(text):
+        raise Unsupported("Inline markup in '%s'" % text)
+    if any(m.group(1).lower() in _URI_SCHEMES for m in _URI.finditer(text)):
+        raise Unsupported("Link in '%s'" % text)
+    for match in re.finditer(r'\*+', text):
+        for c in text[match.start() - 1:match.start()] + text[match.end():match.end() + 1]:
+            if ord(c) > 127 and not c.isalnum() and not c.isspace():
+                raise Unsupported("Punctuation around inline markup in '%s'" % text)
+
+    result = []
+    unprocessed = []
+    remaining = text
+    while remaining:
+        match = _START.search(remaining)
+        if not match:
+            break
+        marker = match.group(1)
+        start, end = match.start(), match.end()
+        if _quoted_start(remaining, start, end):
+            unprocessed.append(remaining[:end])
+            remaining = remaining[end:]
+            continue
+        end_match = _END[marker].search(remaining[end:])
+        if not end_match or not end_match.start(1):
+            raise Unsupported("Inline start-string without end-string in '%s'" % text)
+        unprocessed.append(remaining[:start])
+        if ''.join(unprocessed):
+            result.append(Text(''.join(unprocessed)))
+        unprocessed = []
+        content = remaining[end:end + end_match.start(1)]
+        result.append(_INLINE_CLASS[marker]([Text(content)], rawsource=marker + content + marker))
+        remaining = remaining[end + end_match.end(1):]
+    remaining = ''.join(unprocessed) + remaining
+    if remaining:
+        result.append(Text(remaining))
+    return result
+
+
+def _quoted_start(text: str, start: int, end: int) -> bool:
+    """ Start strings enclosed in matching brackets or quotes, or at the end of the text, are not markup """
+    if start == 0:
+        return False
+    if end >= len(text):
+        return True
+    return _QUOTES.get(text[start - 1]) == text[end]
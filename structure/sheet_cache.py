@@ -0,0 +1,70 @@
+""" Sheets stored after reading, so unchanged files need not be parsed again """
+from __future__ import annotations
+
+import copyreg
+import functools
+import hashlib
+import io
+import os
+import pickle
+from pathlib import Path
+from typing import Optional
+
+from colour import Color
+
+import util
+from util import configured_logger
+from .model import Sheet
+
+LOGGER = configured_logger(__name__)
+
+
+def cache_key(data: bytes) -> str:
+    """ The key for a sheet read from this text by this version of the reader """
+    return hashlib.sha1(_code_version().encode() + data).hexdigest()
+
+
+def load_sheet(cache_dir: Path, key: str) -> Optional[Sheet]:
+    """ The stored sheet, or None if there is none or it cannot be read """
+    path = Path(cache_dir).joinpath(key + '.pickle')
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as ex:
+        LOGGER.warning("Ignoring unreadable cached sheet '%s': %s", path.name, ex)
+        return None
+
+
+def save_sheet(cache_dir: Path, key: str, sheet: Sheet):
+    """ Store the sheet, replacing any previous copy in one step so readers never see a partial file """
+    path = Path(cache_dir).joinpath(key + '.pickle')
+    path.parent.mkdir(parents=True, exist_ok=True)
+    buffer = io.BytesIO()
+    pickler = pickle.Pickler(buffer, protocol=pickle.HIGHEST_PROTOCOL)
+    pickler.dispatch_table = copyreg.dispatch_table.copy()
+    pickler.dispatch_table[Color] = _reduce_color
+    pickler.dump(sheet)
+    temporary = path.with_suffix('.%d.tmp' % os.getpid())
+    temporary.write_bytes(buffer.getvalue())
+    os.replace(temporary, path)
+
+
+@functools.lru_cache(maxsize=None)
+def _code_version() -> str:
+    """ A hash of the code that builds sheets, so changing it invalidates stored sheets """
+    digest = hashlib.sha1()
+    for package in (Path(__file__).parent, Path(util.__file__).parent):
+        for path in sorted(package.glob('*.py')):
+            digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def _reduce_color(color: Color):
+    # Colors hold a lambda, so cannot be pickled directly
+    return _color, (tuple(color.hsl),)
+
+
+def _color(hsl) -> Color:
+    return Color(hsl=hsl)
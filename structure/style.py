@@ -1,16 +1,25 @@
 from __future__ import annotations
 
+import functools
+import hashlib
 import warnings
 from collections import OrderedDict
-from copy import copy
-from dataclasses import dataclass, field
-from typing import Collection, Dict
+from dataclasses import dataclass, fields, replace
+from typing import Collection, Dict, Iterator, Tuple
 
 from colour import Color
 
+from util import caches
 
-@dataclass
+
+@dataclass(frozen=True, eq=False)
 class Style:
+    """
+        A set of appearance values, which never changes once created
+
+        Styles compare and hash by their values (ignoring the name), so they can be used as keys for caches.
+        Derived styles are made by cloning, and equal styles of the same name share a single object
+    """
     name: str
     inherit: str = None
 
@@ -32,27 +41,53 @@ class Style:
 
     align: str = None
 
-    sub_styles: Dict[str, Style] = field(default_factory=OrderedDict)
+    sub_styles: Tuple[Tuple[str, Style], ...] = ()
+
+    def __post_init__(self):
+        if isinstance(self.sub_styles, dict):
+            object.__setattr__(self, 'sub_styles', tuple(self.sub_styles.items()))
+        key = tuple(v.rgb if isinstance(v, Color) else v for v in self._values())
+        object.__setattr__(self, '_key', key)
+        object.__setattr__(self, '_hash', hash(key))
+
+    @functools.cached_property
+    def fingerprint(self) -> str:
+        """ Unlike the hash, this is the same in every process, so can identify the style in stored results """
+        values = tuple(tuple((n, s.fingerprint) for n, s in v) if v is self.sub_styles else v for v in self._key)
+        return hashlib.sha1(repr(values).encode()).hexdigest()
+
+    def _values(self) -> Iterator:
+        return (getattr(self, f.name) for f in _VALUE_FIELDS)
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, Style):
+            return NotImplemented
+        return self._hash == other._hash and self._key == other._key
+
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        # The key and hash are worked out again when loaded, as string hashes differ between processes
+        return _restore, (self.name, tuple(self._values()))
 
     def has_border(self):
         return self.borderColor is not None and self.borderWidth > 0
 
     def clone_using(self, style: Style) -> Style:
-        return self.clone(**style.__dict__)
+        return _derive(self, style)
 
     def clone(self, **kwargs) -> Style:
-        cls = self.__class__
-        result = cls.__new__(cls)
-        result.__dict__.update(self.__dict__)
-
-        # Ensure we do not share the sub_style dictionary
-        result.sub_styles = copy(self.sub_styles)
-        result.name += "*"
-
-        for k, v in kwargs.items():
-            if v is not None and k not in {'name', 'sub_styles', 'inherit'}:
-                setattr(result, k, v)
-        return result
+        kwargs = {k: v for k, v in kwargs.items() if v is not None and k not in _FIXED_FIELDS}
+        # Colors cannot be hashed, so are keyed by their values
+        key = (self.name, self, tuple(sorted((k, v.rgb if isinstance(v, Color) else v) for k, v in kwargs.items())))
+        style = _CLONED.get(key)
+        if style is None:
+            style = _derive(self, Style('', **kwargs))
+            _CLONED.put(key, style)
+        return style
 
     def with_fontsize(self, multiplier=None, size=None) -> Style:
         if size is not None:
@@ -60,13 +95,59 @@ class Style:
         else:
             return self.clone(size=self.size * multiplier)
 
+    def with_sub_style(self, name: str, style: Style) -> Style:
+        """ A copy of this style using the given style for 'strong' or 'emphasis' text """
+        sub_styles = dict(self.sub_styles)
+        sub_styles[name] = style
+        return intern(replace(self, sub_styles=tuple(sub_styles.items())))
+
     def __repr__(self):
         def useful(v): return v is not None and (v or not isinstance(v, Collection))
 
-        return 'Style(' + ", ".join('%s=%s' % (k, v) for k, v in self.__dict__.items() if useful(v)) + ')'
+        values = ((f.name, getattr(self, f.name)) for f in fields(self))
+        return 'Style(' + ", ".join('%s=%s' % (k, v) for k, v in values if useful(v)) + ')'
 
     def sub_style(self, name):
-        return self.clone_using(self.sub_styles[name])
+        return _derive(self, dict(self.sub_styles)[name])
+
+
+# Fields that are not copied when cloning a style
+_FIXED_FIELDS = {'name', 'sub_styles', 'inherit'}
+
+_VALUE_FIELDS = [f for f in fields(Style) if f.name != 'name']
+
+# Fields a style definition can set
+_DEFINABLE = {f.name for f in fields(Style)} - {'name', 'sub_styles'}
+
+_INTERNED = caches.register('interned_styles', maxsize=4096)
+
+_CLONED = caches.register('cloned_styles', maxsize=4096)
+
+
+def intern(style: Style) -> Style:
+    """ The single shared style with this name and values """
+    key = (style.name, style)
+    shared = _INTERNED.get(key)
+    if shared is None:
+        _INTERNED.put(key, style)
+        shared = style
+    return shared
+
+
+def _derive(base: Style, overrides: Style) -> Style:
+    """ The base style with the values set in the overrides replacing its own """
+    # Styles are equal whatever their names, so the name is part of the key to keep it in the derived style
+    return _derive_named(base.name, base, overrides)
+
+
+@caches.cached('derived_styles', maxsize=4096)
+def _derive_named(name: str, base: Style, overrides: Style) -> Style:
+    values = {f.name: getattr(overrides, f.name) for f in _VALUE_FIELDS if f.name not in _FIXED_FIELDS}
+    return intern(replace(base, name=name + '*', **{k: v for k, v in values.items() if v is not None}))
+
+
+def _restore(name: str, values: Tuple) -> Style:
+    return intern(Style(name, *values))
 
 
 _MAPPINGS = {
@@ -88,25 +169,28 @@ DEFAULT = Style('default', inherit='---', color=Color('black'), borderWidth=0.5,
 
 
 class Stylesheet:
+    """
+        Named style definitions, each resolved through its chain of inherited styles once and then reused
+
+        Definitions are kept as they were written; looking one up gives the resolved style
+    """
+
     def __init__(self):
         super().__init__()
-        self.items = OrderedDict([('default', DEFAULT.clone()), ('bold', BOLD.clone()), ('italic', ITALIC.clone())])
+        self.items = OrderedDict([('default', DEFAULT), ('bold', BOLD), ('italic', ITALIC)])
+        self._resolved: Dict[str, Style] = dict()
         self.define('default-title', inherit='default', align='left', size=10, color='white', background='navy',
                     border='navy')
         self.define('default-section', inherit='default')
         self.define('default-page', inherit='default')
 
     def define(self, name, **kwargs) -> None:
-        if name in self:
-            s = self.items[name]
-        else:
-            s = self.items[name] = Style(name)
-
+        changes = dict()
         for k, value in kwargs.items():
-            if hasattr(Style, k):
+            if k in _DEFINABLE:
                 key = k
-            elif hasattr(Style, k.lower()):
-                key = k.lower
+            elif k.lower() in _DEFINABLE:
+                key = k.lower()
             elif k.lower() in _MAPPINGS:
                 key = _MAPPINGS[k.lower()]
             else:
@@ -114,26 +198,31 @@ class Stylesheet:
                 continue
             try:
                 if key in {'color', 'background', 'borderColor'}:
-                    setattr(s, key, Color(value))
+                    changes[key] = Color(value)
                 elif key in {'size', 'borderWidth', 'opacity', 'roughness', 'teeth', 'rounded'}:
-                    setattr(s, key, float(value))
+                    changes[key] = float(value)
                 elif key in {'bold', 'italic'}:
-                    setattr(s, key, bool(value))
+                    changes[key] = bool(value)
                 else:
-                    setattr(s, key, value)
+                    changes[key] = value
             except ValueError:
                 warnings.warn("Could not convert value '%s' to a value assignable to '%s'" % (value, k))
 
+        self.items[name] = replace(self.items.get(name) or Style(name), **changes)
+        # Any resolved style might inherit from this one
+        self._resolved.clear()
+
     def __getitem__(self, name) -> Style:
-        if name in self.items:
+        style = self._resolved.get(name)
+        if style is None:
+            if name not in self.items:
+                warnings.warn("Undefined style '%s' -- using default style" % name)
+                return self.items['default']
             style = self.items[name]
             if style.inherit != '---':
-                inherited = self[style.inherit or 'default']
-                style = inherited.clone_using(style)
-        else:
-            warnings.warn("Undefined style '%s' -- using default style" % name)
-            style = self.items['default']
-        return style.clone()
+                style = self[style.inherit or 'default'].clone_using(style)
+            style = self._resolved[name] = intern(style)
+        return style
 
     def __len__(self):
         return len(self.items)
@@ -1,7 +1,7 @@
 import subprocess
 
 from layout.pdf import PDF
-from content import Content
+from layout.content import Content
 
 
 def debug_placed_content(p: Content, pdf: PDF):
@@ -0,0 +1,45 @@
+import PIL.Image
+
+from layout import LayoutCache, make_book, make_sheet
+
+SHEET = """
+.. page:: size={size}
+.. section:: stack stack:columns=2 padding=10
+
+{name}
+ - Some text about the picture that is long enough to wrap over a couple of lines
+
+   .. image:: ../shared.png
+
+Details
+ - Name     | {name}
+ - Level    | 3
+"""
+
+
+def test_book_of_sheets_shares_images(tmp_path):
+    PIL.Image.new('RGB', (200, 300), 'blue').save(tmp_path.joinpath('shared.png'))
+    files = []
+    for name, size in (('Alpha', '8.5inx11in'), ('Beta', '11inx8.5in')):
+        tmp_path.joinpath(name).mkdir()
+        files.append(tmp_path.joinpath(name, name.lower() + '.rst'))
+        files[-1].write_text(SHEET.format(name=name, size=size))
+
+    data = make_book(files, tmp_path.joinpath('book.pdf'), workers=1).read_bytes()
+    assert data.count(b'/Subtype /Image') == 1
+    assert data.count(b'/Type /Page\n') + data.count(b'/Type /Page ') == 2
+    assert b'(Alpha)' in data and b'(Beta)' in data
+
+
+def test_units_laid_out_in_parallel_are_replayed(tmp_path):
+    PIL.Image.new('RGB', (200, 300), 'blue').save(tmp_path.joinpath('shared.png'))
+    tmp_path.joinpath('party').mkdir()
+    file = tmp_path.joinpath('party', 'party.rst')
+    file.write_text(SHEET.format(name='Alpha', size='8.5inx11in') + '\n.. character:: Beta\n\n'
+                    + SHEET.format(name='Beta', size='8.5inx11in').split('\n', 2)[2])
+
+    cache = LayoutCache(tmp_path.joinpath('layouts.sqlite'))
+    data = make_sheet(file, tmp_path.joinpath('party.pdf'), layout_cache=cache, workers=2).read_bytes()
+    # Everything drawn was laid out beforehand, by the other processes
+    assert len(cache) and cache.hits and not cache.misses
+    assert data.count(b'/Type /Page\n') + data.count(b'/Type /Page ') == 2
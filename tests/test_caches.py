@@ -0,0 +1,45 @@
+from util import caches
+from util.caches import Cache
+
+
+def test_evicts_least_recently_used():
+    cache = Cache('test', maxsize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert (cache.hits, cache.misses, cache.evictions) == (3, 1, 1)
+
+
+def test_byte_limit_remeasures_growing_values():
+    cache = Cache('test', maxsize=None, max_bytes=100, sizer=len)
+    first, second = [0] * 40, [0] * 40
+    cache.put('first', first)
+    cache.put('second', second)
+    assert cache.bytes == 80
+    second.extend([0] * 40)
+    cache.get('second')
+    assert len(cache) == 1 and cache.bytes == 80
+    assert cache.get('first') is None
+
+
+def test_section_scope_cleared_separately():
+    calls = []
+
+    @caches.cached('test_section_scope', caches.SECTION)
+    def square(x):
+        calls.append(x)
+        return x * x
+
+    try:
+        assert square(3) == 9 and square(3) == 9
+        assert calls == [3] and square.cache_info().hits == 1
+        caches.clear(caches.PROCESS)
+        assert square(3) == 9 and calls == [3]
+        caches.clear(caches.SECTION)
+        assert square(3) == 9 and calls == [3, 3]
+        assert 'test_section_scope' in caches.report()
+    finally:
+        del caches._REGISTRY['test_section_scope']
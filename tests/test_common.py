@@ -1,4 +1,9 @@
-from layout.common import Rect
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from util.common import Rect
 
 
 def test_modify_horizontal():
@@ -6,3 +11,41 @@ def test_modify_horizontal():
     assert rect.make_column(left=10, right=20) == Rect.make(left=10, right=20, top=7, bottom=777)
     assert rect.make_column(left=10, width=50) == Rect.make(left=10, right=60, top=7, bottom=777)
     assert rect.make_column(right=10, width=50) == Rect.make(left=-40, right=10, top=7, bottom=777)
+
+
+def test_union():
+    a = Rect.make(left=5, right=95, top=7, bottom=777)
+    b = Rect.make(left=-5, right=50, top=10, bottom=800)
+    c = Rect(left=0.4, right=100.6, top=7, bottom=20)
+    assert Rect.union([a]) is a
+    assert Rect.union(a, b) == Rect.make(left=-5, right=95, top=7, bottom=800)
+    assert Rect.union([a, b, c]) == Rect.make(left=-5, right=101, top=7, bottom=800)
+    assert Rect.union(r for r in (c, a)) == Rect(left=0, right=101, top=7, bottom=777)
+
+
+def test_rect_is_compact():
+    rect = Rect.make(left=5, right=95, top=7, bottom=777)
+    assert not hasattr(rect, '__dict__')
+    assert rect.move() is rect
+    assert rect.move(dx=1, dy=-1) == Rect(6, 96, 6, 776)
+
+
+def test_heavy_dependencies_imported_on_first_use():
+    code = "import sys, layout, structure; print(' '.join(m for m in ('scipy', 'numpy', 'docutils', 'yaml') " \
+           "if m in sys.modules))"
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=Path(__file__).parent.parent)
+    assert result.stdout.strip() == ''
+
+
+def test_log_level_replaces_configured_levels(tmp_path):
+    code = "import logging; from util import FINE, configure_logging; configure_logging(level=FINE); " \
+           "files = [h.level for h in logging.root.handlers if isinstance(h, logging.FileHandler)]; " \
+           "print(logging.getLogger('util.optimize').isEnabledFor(FINE), " \
+           "logging.getLogger('structure.reader').isEnabledFor(FINE), files)"
+    # The log file is written relative to the working directory
+    run_dir = tmp_path.joinpath('run')
+    run_dir.mkdir()
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True, cwd=run_dir,
+                            env=dict(os.environ, PYTHONPATH=str(Path(__file__).parent.parent)))
+    assert result.stdout.strip() == 'True True [8]'
@@ -0,0 +1,104 @@
+import gc
+import logging
+import weakref
+
+import PIL.Image
+import pytest
+
+from layout import PDF, layout_sheet
+from layout.content import GroupContent, RectContent
+from layout.layout_containers import ColumnWidthOptimizer, place_in_parts, stack_in_columns
+from structure import reader
+from util import Optimizer, Rect
+
+SHEET = """
+.. page:: size=8.5inx11in margin=20
+.. section:: stack stack:columns=2 padding=10
+
+Portrait
+ - Some text about the picture that is long enough to wrap over a couple of lines
+
+.. image:: picture.png
+
+"""
+
+TABLE = """
+Block {0}
+ - Name {0}  | Value {0} | Some longer text in the last column
+ - Other     | 12        | More text
+"""
+
+
+@pytest.fixture
+def sheet_file(tmp_path):
+    PIL.Image.new('RGB', (200, 300), 'blue').save(tmp_path.joinpath('picture.png'))
+    path = tmp_path.joinpath('draft.rst')
+    path.write_text(SHEET + ''.join(TABLE.format(i) for i in range(12)))
+    return path
+
+
+def test_draft_does_not_optimize(sheet_file, monkeypatch):
+    def fail(self):
+        raise AssertionError("Optimizer %s was run" % self.name)
+
+    monkeypatch.setattr(Optimizer, 'run', fail)
+    sheet = reader.read_sheet(sheet_file)
+    pdf = PDF(sheet_file.with_suffix('.pdf'), sheet.pagesize, draft=True)
+    layout_sheet(sheet, pdf)
+    assert sheet_file.with_suffix('.pdf').exists()
+
+
+class Fixed:
+    def __init__(self, height):
+        self.height = height
+
+    def __call__(self, bounds: Rect):
+        return RectContent(bounds.resize(height=self.height), None, PDF.FILL, None)
+
+
+def test_sequential_counts_balance_columns():
+    heights = [60, 60, 60, 60, 120, 120]
+    outer = Rect.make(left=0, right=300, top=0, bottom=1000)
+    optimizer = ColumnWidthOptimizer(3, [Fixed(h) for h in heights], outer, 0)
+    # Keeping the order, the only split with no column taller than 180
+    assert optimizer.sequential_counts(100) == [3, 2, 1]
+
+
+def test_stacked_pages_made_one_at_a_time():
+    page = Rect.make(left=0, right=300, top=0, bottom=1000)
+    bounds = Rect.make(left=0, right=300, top=800, bottom=1000)
+    pages = stack_in_columns(bounds, page, [Fixed(300) for _ in range(7)], 0, {'columns': 1}, False)
+    first = next(pages)
+    # Nothing fits below the earlier content, so the first part starts a new page
+    assert first.page_break_before and len(first.group) == 3
+    rest = list(pages)
+    assert [len(p.group) for p in rest] == [3, 1]
+    assert all(p.page_break_before for p in rest)
+
+
+def test_finished_sections_released(tmp_path):
+    text = SHEET + TABLE.format(1) + '\n----------\n' + TABLE.format(2) + '\n----------\n'
+    sheet = reader.build_sheet(text)
+    pdf = PDF(tmp_path.joinpath('released.pdf'), sheet.pagesize)
+    pdf.base_dir = tmp_path
+    PIL.Image.new('RGB', (200, 300), 'blue').save(tmp_path.joinpath('picture.png'))
+    parts = place_in_parts(sheet, Rect.make(left=20, top=20, right=592, bottom=772), pdf)
+
+    # The records kept by the test's log capture would hold on to the content they mention
+    logging.disable(logging.CRITICAL)
+    try:
+        first = next(parts)
+        groups = [weakref.ref(g) for g in _groups(first)]
+        del first
+        next(parts)
+    finally:
+        logging.disable(logging.NOTSET)
+    gc.collect()
+    assert groups and not any(g() for g in groups)
+
+
+def _groups(content):
+    if isinstance(content, GroupContent):
+        yield content
+        for child in content.group:
+            yield from _groups(child)
@@ -0,0 +1,57 @@
+from reportlab.lib.fonts import tt2ps
+from reportlab.pdfbase import pdfmetrics
+
+from util import fonts
+
+
+def test_metadata_without_loading():
+    assert fonts.leading_for('Tech') == 0.8
+    assert fonts.multiplier_for('tech') == 1.2
+    assert fonts.leading_for('courier') == 1.1
+    assert fonts.leading_for('NoSuchFont') == 1.2
+    assert fonts.multiplier_for('NoSuchFont') == 1.0
+    assert 'Western' not in fonts._installed
+
+
+def test_font_names():
+    names = fonts.font_names()
+    assert 'Helvetica' in names
+    assert 'Gotham-BoldItalic' in names
+    assert 'Symbol' not in names
+
+
+def test_family_loaded_on_first_use():
+    assert fonts.ensure_font('Medieval') == 'Medieval'
+    assert 'Medieval' in fonts._installed
+    assert pdfmetrics.getFont('Medieval').fontName == 'Medieval'
+    # Bold is not shipped, so the family uses the regular face
+    assert tt2ps('Medieval', 1, 0) == 'Medieval'
+
+
+def test_coverage_of_standard_font():
+    covered = fonts.coverage('Helvetica')
+    assert {'a', 'é', '€', '\xa0', '?'} <= covered
+    assert '✣' not in covered and '★' not in covered
+
+
+def test_coverage_of_truetype_font():
+    covered = fonts.coverage('Symbola')
+    assert '★' in covered
+    assert fonts.coverage('Symbola') is covered
+
+
+def test_uncovered_characters_become_symbols():
+    from structure.model import Element, ElementType, _ensure_representable
+    items = _ensure_representable([Element(ElementType.TEXT, 'a✣b'), Element(ElementType.TEXT, 'plain')])
+    assert [(e.which, e.value) for e in items] == [
+        (ElementType.TEXT, 'a'), (ElementType.SYMBOL, '✣'), (ElementType.TEXT, 'b'), (ElementType.TEXT, 'plain')]
+
+
+def test_coverage_checked_against_the_style_font():
+    from structure import Style
+    from structure.model import Element, ElementType, _ensure_representable
+    symbols = Style('symbols', font='Symbola')
+    items = _ensure_representable([Element(ElementType.TEXT, 'a★b', symbols), Element(ElementType.TEXT, 'a★b')])
+    assert [(e.which, e.value) for e in items] == [
+        (ElementType.TEXT, 'a★b'), (ElementType.TEXT, 'a'), (ElementType.SYMBOL, '★'), (ElementType.TEXT, 'b')]
+    assert fonts.face('Gotham', bold=True) == 'Gotham-Bold'
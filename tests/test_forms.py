@@ -0,0 +1,56 @@
+import re
+
+from colour import Color
+
+from layout.content import FormContent, RectContent
+from layout.pdf import PDF
+from structure import Style
+from util import Rect
+
+
+def make_shape(pdf, style, key):
+    r = Rect.make(left=0, top=0, width=40, height=20)
+    return FormContent([RectContent(r, style, PDF.FILL, pdf, rounded=5)], r, key)
+
+
+def test_repeated_shapes_drawn_once(tmp_path):
+    output = tmp_path.joinpath('forms.pdf')
+    pdf = PDF(output, (200, 200))
+    pdf.setPageCompression(0)
+    style = Style('s', background=Color('red'))
+
+    for page in range(2):
+        for i in range(3):
+            make_shape(pdf, style, ('shape', 40)).move(dx=10, dy=30 * i).draw()
+        make_shape(pdf, style, ('other', 40)).move(dx=100).draw()
+        pdf.showPage()
+    pdf.save()
+
+    data = output.read_bytes()
+    assert data.count(b'/Subtype /Form') == 2
+    assert data.count(b'/FormXob.Shape1 Do') == 6
+    assert data.count(b'/FormXob.Shape2 Do') == 2
+
+
+def test_moving_form_keeps_children(tmp_path):
+    pdf = PDF(tmp_path.joinpath('forms.pdf'), (200, 200))
+    shape = make_shape(pdf, Style('s'), ('shape',))
+    child = shape.group[0]
+    shape.move(dx=10, dy=20)
+    assert shape.actual == Rect.make(left=10, top=20, width=40, height=20)
+    assert child.actual == Rect.make(left=0, top=0, width=40, height=20)
+
+
+def test_moved_form_is_visible(tmp_path):
+    output = tmp_path.joinpath('forms.pdf')
+    pdf = PDF(output, (200, 200))
+    pdf.setPageCompression(0)
+    # Moved much further than the bleed around the form's bounds
+    make_shape(pdf, Style('s', background=Color('red')), ('shape', 40)).move(dx=100, dy=100).draw()
+    pdf.showPage()
+    pdf.save()
+
+    # The form clips to its bounding box, which must hold the shape as drawn inside the form: 40x20 at the top left
+    box = re.search(rb'/BBox \[ *([-\d.]+) +([-\d.]+) +([-\d.]+) +([-\d.]+) *\]', output.read_bytes())
+    left, bottom, right, top = (float(v) for v in box.groups())
+    assert left <= 0 and right >= 40 and bottom <= 180 and top >= 200
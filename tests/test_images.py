@@ -0,0 +1,78 @@
+import PIL.Image
+
+from layout.images import ImageAsset, image_asset
+from layout.pdf import PDF
+
+
+def make_file(tmp_path, name, size, mode='RGB'):
+    path = tmp_path.joinpath(name)
+    PIL.Image.new(mode, size, 'red').save(path)
+    return path
+
+
+def test_size_read_without_decoding(tmp_path):
+    asset = ImageAsset(make_file(tmp_path, 'a.png', (300, 200)))
+    assert (asset.width, asset.height) == (300, 200)
+    assert asset._pixels is None
+
+
+def test_small_images_used_directly(tmp_path):
+    path = make_file(tmp_path, 'a.jpg', (300, 200))
+    asset = ImageAsset(path)
+    # 300 pixels at 300dpi is 72 points
+    assert asset.source_for(72, 48) == str(path)
+    assert asset._pixels is None
+
+
+def test_large_images_downsampled_once(tmp_path):
+    asset = ImageAsset(make_file(tmp_path, 'a.jpg', (3000, 2000)))
+    source = asset.source_for(72, 48)
+    assert source.getSize() == (300, 200)
+    assert source._image.format == 'JPEG'
+    assert asset.source_for(72, 48) is source
+
+
+def test_alpha_kept(tmp_path):
+    asset = ImageAsset(make_file(tmp_path, 'a.png', (3000, 2000), mode='RGBA'))
+    assert asset.source_for(36, 24)._image.mode == 'RGBA'
+
+
+def test_assets_shared(tmp_path):
+    path = make_file(tmp_path, 'a.png', (30, 20))
+    assert image_asset(path) is image_asset(str(path))
+
+
+def test_images_embedded_once_per_document(tmp_path):
+    first = make_file(tmp_path, 'a.png', (40, 30))
+    copy = tmp_path.joinpath('b.png')
+    copy.write_bytes(first.read_bytes())
+
+    out = tmp_path.joinpath('out.pdf')
+    pdf = PDF(out, (200, 200))
+    pdf.setPageCompression(0)
+    for page in range(3):
+        pdf.drawImage(image_asset(first), 10, 10, 40, 30)
+        pdf.drawImage(image_asset(copy), 60, 10, 40, 30)
+        pdf.showPage()
+    pdf.save()
+
+    data = out.read_bytes()
+    assert data.count(b'/Subtype /Image') == 1
+    # The image is drawn once into a form, which each page then uses twice
+    assert data.count(b'/Subtype /Form') == 1
+    assert data.count(b' Do') == 7
+
+
+def test_transparent_images_embedded_once(tmp_path):
+    path = make_file(tmp_path, 'a.png', (40, 30), mode='RGBA')
+    out = tmp_path.joinpath('out.pdf')
+    pdf = PDF(out, (200, 200))
+    pdf.setPageCompression(0)
+    for page in range(2):
+        pdf.drawImage(image_asset(path), 10, 10, 40, 30)
+        pdf.showPage()
+    pdf.save()
+
+    data = out.read_bytes()
+    assert data.count(b'/Subtype /Image') == 2
+    assert data.count(b'/SMask') == 1
@@ -0,0 +1,112 @@
+import sqlite3
+import time
+
+import PIL.Image
+import pytest
+
+from layout import LayoutCache, PDF, layout_sheet
+from structure import reader
+from util import Optimizer
+from util.optimize import Solution, Solutions, recording
+
+SHEET = """
+.. section:: stack stack:columns=2 padding=10
+
+Portrait
+ - Some text about the picture that is long enough to wrap over a couple of lines
+
+   .. image:: picture.png
+
+"""
+
+TABLE = """
+Block {0}
+ - Name {0}  | Value {0} | Some longer text in the last column
+ - Other     | 12        | More text
+"""
+
+
+class Split(Optimizer):
+    """ Best when the first part is a quarter of the whole """
+
+    def __init__(self):
+        super().__init__(2)
+        self.made = 0
+
+    def make(self, x):
+        self.made += 1
+        return x
+
+    def score(self, x):
+        return (x[0] - 0.25) ** 2
+
+
+def test_solutions_are_replayed():
+    solutions = Solutions()
+    with recording(solutions):
+        searched, (score, x) = Split().run()
+    assert len(solutions.found) == 1
+    assert searched[0] == pytest.approx(0.25, abs=0.01)
+
+    optimizer = Split()
+    with recording(Solutions(solutions.found)) as replayed:
+        item, (score, x) = optimizer.run()
+    assert item == searched
+    assert optimizer.made == 1
+    assert replayed.found == solutions.found
+
+
+def test_stored_layouts_are_evicted_oldest_first(tmp_path):
+    cache = LayoutCache(tmp_path.joinpath('layouts.sqlite'), max_bytes=1000)
+    for i in range(10):
+        cache.put('key%d' % i, [Solution((i / 100,))])
+    assert cache.get('key0') == [Solution((0.0,))]
+    # Storing more than the limit evicts without waiting for the cache to be closed
+    for i in range(10, 20):
+        cache.put('key%d' % i, [Solution((i / 100,))])
+    assert 0 < len(cache) < 20
+    assert cache.get('key0') is not None
+    assert cache.get('key1') is None
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_reading_layouts_writes_nothing_until_closed(tmp_path):
+    path = tmp_path.joinpath('layouts.sqlite')
+    cache = LayoutCache(path)
+    cache.put('key', [Solution((0.5,))])
+    other = sqlite3.connect(str(path))
+    stored = other.execute('SELECT used FROM layouts').fetchone()[0]
+    time.sleep(0.01)
+    assert cache.get('key') == [Solution((0.5,))]
+    assert other.execute('SELECT used FROM layouts').fetchone()[0] == stored
+    cache.close()
+    assert other.execute('SELECT used FROM layouts').fetchone()[0] > stored
+    other.close()
+
+
+def test_layout_reuses_stored_solutions(tmp_path, monkeypatch):
+    PIL.Image.new('RGB', (200, 300), 'blue').save(tmp_path.joinpath('picture.png'))
+    path = tmp_path.joinpath('sheet.rst')
+    path.write_text(SHEET + ''.join(TABLE.format(i) for i in range(4)))
+    sheet = reader.read_sheet(path)
+
+    searched = []
+    search = Optimizer._search
+
+    def recorded_search(self):
+        searched.append(self.name)
+        return search(self)
+
+    monkeypatch.setattr(Optimizer, '_search', recorded_search)
+
+    cache = LayoutCache(tmp_path.joinpath('layouts.sqlite'))
+    layout_sheet(sheet, PDF(tmp_path.joinpath('first.pdf'), sheet.pagesize, layout_cache=cache))
+    assert {'ImagePlacement', 'TableColumnsOptimizer'} <= set(searched)
+    assert cache.misses and not cache.hits
+
+    searched.clear()
+    layout_sheet(sheet, PDF(tmp_path.joinpath('second.pdf'), sheet.pagesize, layout_cache=cache))
+    # Both the blocks and the columns of the section are made from stored solutions
+    assert not searched
+    assert cache.hits
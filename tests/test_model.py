@@ -0,0 +1,106 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from layout import PDF
+from layout.layout_content import make_block_layout
+from structure import reader
+
+SHEET = """
+.. section:: stack stack:columns=2
+
+Block
+ - [ ] one | [ ] two
+ - some *text*
+
+Block
+ - [ ] one | [ ] two
+ - some *text*
+
+Block
+ - [ ] one | [ ] two
+ - other *text*
+
+-----
+
+big
+    size=20
+"""
+
+
+def test_identical_blocks_share_fingerprints():
+    a, b, c = reader.build_sheet(SHEET).content[0].content
+    assert a is not b
+    assert a.fingerprint == b.fingerprint and hash(a) == hash(b)
+    assert a.content[0].fingerprint == c.content[0].fingerprint
+    assert a.fingerprint != c.fingerprint
+    assert a.content[1].fingerprint != c.content[1].fingerprint
+
+
+def test_fingerprints_do_not_depend_on_the_process():
+    code = 'from structure import reader; print(reader.build_sheet(%r).content[0].fingerprint)' % SHEET
+    prints = {subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                             cwd=Path(__file__).parent, env=dict(os.environ, PYTHONHASHSEED=seed,
+                                                                 PYTHONPATH=str(Path(__file__).parent.parent))
+                             ).stdout for seed in ('1', '2')}
+    assert len(prints) == 1
+
+
+def test_identical_blocks_share_layouts(tmp_path):
+    a, b, c = reader.build_sheet(SHEET).content[0].content
+    pdf = PDF(tmp_path.joinpath('out.pdf'), (600, 800))
+    hits = make_block_layout.cache_info().hits
+    make_block_layout(a, 300, pdf)
+    make_block_layout(b, 300, pdf)
+    assert make_block_layout.cache_info().hits == hits + 1
+
+
+PARTY = """
+.. section:: stack stack:columns=2
+.. block:: style=big
+
+First
+ - one
+
+Notes
+ - more about the first
+
+===========
+
+Second
+ - two
+
+===========
+
+Third
+ - three
+
+-----
+
+big
+    size=20
+"""
+
+
+@pytest.mark.parametrize('native', [True, False])
+def test_hard_breaks_divide_sheet_into_units(native):
+    sheet = reader.build_sheet(PARTY, native=native)
+    units = sheet.units()
+    assert [[b.title.as_text() for s in u.content for b in s.content] for u in units] == [
+        ['First', 'Notes'], ['Second'], ['Third']]
+    assert all(u.pagesize == sheet.pagesize for u in units)
+    assert units[2].content[0].content[0].style.size == 20
+
+
+@pytest.mark.parametrize('native', [True, False])
+def test_character_directive_starts_unit(native):
+    text = PARTY.replace('===========\n\nSecond', '.. character:: Second Person\n\nSecond')
+    sheet = reader.build_sheet(text.replace('===========\n\nThird', '.. character::\n\nThird'), native=native)
+    units = sheet.units()
+    assert [u.content[0].character for u in units] == [None, 'Second Person', '']
+    # Directives are still in force after the character starts
+    assert units[1].content[0].content[0].style.size == 20
+    assert all(s.page_break_after for s in sheet.content[:-1])
@@ -0,0 +1,62 @@
+from reportlab.pdfgen.canvas import Canvas
+
+from util import LineModifier
+from util.roughen import _mangled_code
+
+
+def coordinates(path):
+    terms = path.getCode().split()
+    return [(float(terms[i - 2]), float(terms[i - 1])) for i, t in enumerate(terms) if t in {'m', 'l'}]
+
+
+def test_rough_is_same_at_same_location(tmp_path):
+    canvas = Canvas(str(tmp_path.joinpath('a.pdf')))
+    a = LineModifier(canvas, 'rough', 2).rect_to_path(10, 20, 100, 50).getCode()
+    b = LineModifier(canvas, 'rough', 2).rect_to_path(10, 20, 100, 50).getCode()
+    assert a == b
+
+    canvas.translate(30, 0)
+    c = LineModifier(canvas, 'rough', 2).rect_to_path(10, 20, 100, 50).getCode()
+    assert a != c
+
+
+def test_rough_stays_close(tmp_path):
+    canvas = Canvas(str(tmp_path.joinpath('a.pdf')))
+    points = coordinates(LineModifier(canvas, 'rough', 2).rect_to_path(0, 0, 100, 50))
+    # Sampled every 10 units; σ is half the roughness and noise is limited to 2σ, but the segments next to the
+    # start run to or from the moved start point, so can be moved twice
+    assert len(points) == 1 + 2 * 10 + 2 * 5
+    for x, y in points:
+        assert -4.05 <= x <= 104.05 and -4.05 <= y <= 54.05
+        assert min(abs(x), abs(x - 100)) <= 4.05 or min(abs(y), abs(y - 50)) <= 4.05
+
+
+def test_teeth(tmp_path):
+    canvas = Canvas(str(tmp_path.joinpath('a.pdf')))
+    path = LineModifier(canvas, 'teeth', 2).rect_to_path(0, 0, 100, 50)
+    points = coordinates(path)
+    # Teeth every 10 units, each drawn with five points
+    assert len(points) == 1 + 5 * (2 * 10 + 2 * 5)
+    assert points[5] == (10, 0)
+    assert path.getCode().endswith('h')
+
+
+def test_curves_sampled(tmp_path):
+    canvas = Canvas(str(tmp_path.joinpath('a.pdf')))
+    path = canvas.beginPath()
+    path.moveTo(0, 0)
+    path.curveTo(0, 50, 100, 50, 100, 0)
+    points = coordinates(LineModifier(canvas, 'teeth', 2).roughen_path(path))
+    assert points[-1] == (100, 0)
+    assert max(y for x, y in points) > 30
+
+
+def test_same_path_calculated_once(tmp_path):
+    canvas = Canvas(str(tmp_path.joinpath('a.pdf')))
+    canvas.translate(17, 23)
+    modifier = LineModifier(canvas, 'rough', 1.5)
+    first = modifier.rect_to_path(10, 20, 100, 50)
+    hits = _mangled_code.cache_info().hits
+    second = modifier.rect_to_path(10, 20, 100, 50)
+    assert _mangled_code.cache_info().hits == hits + 1
+    assert first.getCode() == second.getCode()
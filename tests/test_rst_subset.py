@@ -0,0 +1,113 @@
+import logging
+from pathlib import Path
+
+import pytest
+
+from structure import reader, rst_subset
+from util import FINE
+
+SAMPLES = Path(__file__).parent.parent.joinpath('_characters')
+
+SHEET = """
+.. page:: size=8.5inx11in margin=20
+.. section:: stack stack:columns=2 padding=10
+.. block:: style=big strong=huge
+   padding=4
+
+Heading
+=======
+ - first item with **strong** text -- and *emphasis*
+ - [ ] a checkbox | a divider
+
+.. a comment
+   spread over two lines
+
+Description
+ - is a **Chaotic Dwarven Adept**
+ - who **Crafts Unique Objects** (*really*)
+
+ - 2 * 3 is six, and *not* * this
+
+Just a paragraph
+spread over lines
+
+.. image:: picture.png
+   :align: left
+   :height: 100
+
+=================
+
+Second page
+ -
+
+----------------
+
+big
+    size=20
+
+huge
+    size=30 bold=true
+"""
+
+
+def tree(node):
+    """ The structure of a tree, ignoring section nesting and warnings, which the reader does not use """
+    name = node.__class__.__name__
+    if name == 'system_message':
+        return []
+    if name == 'section':
+        return [t for c in node.children for t in tree(c)]
+    detail = node.astext() if name == 'Text' else getattr(node, 'options', None)
+    return [(name, detail)] + [t for c in node.children for t in tree(c)] + ['/' + name]
+
+
+@pytest.mark.parametrize('text', [
+    SHEET,
+    'a*b* and *c*d and (*) and "*" and *e*, x**',
+    '**strong**:*emphasis* and (**b**)',
+    'Term\n  definition text\n\nOther term\n - item\n\n  more',
+])
+def test_same_tree_as_docutils(text):
+    assert tree(rst_subset.parse(text)) == tree(reader.parse_rst(text))
+
+
+def test_same_sheet_as_docutils():
+    assert reader.build_sheet(SHEET) == reader.build_sheet(SHEET, native=False)
+
+
+@pytest.mark.parametrize('file', ['Ethik/ethik.rst', 'Three Rocketeers/musketeer.rst'])
+def test_samples_read_natively(file):
+    data = SAMPLES.joinpath(file).read_text()
+    assert tree(rst_subset.parse(data)) == tree(reader.parse_rst(data))
+    assert reader.build_sheet(data) == reader.build_sheet(data, native=False)
+
+
+@pytest.mark.parametrize('text', [
+    'Some ``literal`` text',
+    'A link to http://example.com',
+    '| a line block',
+    'A reference_ to something',
+    '.. note:: An unknown directive',
+    'Title\n==\n',
+])
+def test_unsupported_falls_back(text):
+    with pytest.raises(rst_subset.Unsupported):
+        rst_subset.parse(text)
+    assert reader.build_sheet(text) == reader.build_sheet(text, native=False)
+
+
+@pytest.mark.parametrize('native', [True, False])
+def test_styles_come_from_after_the_last_transition(native):
+    text = '.. block:: style=big\n\nFirst\n - one\n\n-----\n\nSecond\n - two\n\n-----\n\nbig\n    size=20\n'
+    sheet = reader.build_sheet(text, native=native)
+    assert len(sheet.content) == 2
+    assert sheet.content[1].content[0].style.size == 20
+
+
+def test_traversal_traced_only_at_fine(caplog):
+    with caplog.at_level(logging.DEBUG, logger='structure.reader'):
+        reader.build_sheet(SHEET)
+    assert not any('Entering' in r.message for r in caplog.records)
+    with caplog.at_level(FINE, logger='structure.reader'):
+        reader.build_sheet(SHEET)
+    assert any(r.message == "Entering 'list_item < bullet_list < block_quote < document'" for r in caplog.records)
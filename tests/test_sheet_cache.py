@@ -0,0 +1,40 @@
+import pytest
+
+from structure import reader
+from structure.sheet_cache import cache_key
+
+SHEET = """
+.. block:: style=big
+
+Title
+ - one **two**
+
+----------
+
+big
+    size=20 color=navy
+"""
+
+
+def test_cached_sheet_skips_parsing(tmp_path, monkeypatch):
+    sheet_file = tmp_path.joinpath('a.rst')
+    sheet_file.write_text(SHEET)
+    cache_dir = tmp_path.joinpath('cache')
+    first = reader.read_sheet(sheet_file, cache_dir=cache_dir)
+
+    def fail(*args):
+        raise AssertionError("Sheet was parsed")
+
+    monkeypatch.setattr(reader, 'build_sheet', fail)
+    second = reader.read_sheet(sheet_file, cache_dir=cache_dir)
+    assert second == first
+    assert second.content[0].content[0].style.color == first.content[0].content[0].style.color
+
+    sheet_file.write_text(SHEET.replace('one', 'three'))
+    with pytest.raises(AssertionError):
+        reader.read_sheet(sheet_file, cache_dir=cache_dir)
+
+
+def test_key_depends_on_content():
+    assert cache_key(b'abc') == cache_key(b'abc')
+    assert cache_key(b'abc') != cache_key(b'abd')
@@ -0,0 +1,67 @@
+import dataclasses
+import pickle
+
+import pytest
+from colour import Color
+
+from structure import Style, Stylesheet
+from structure.style import intern
+
+
+def test_lookup_is_resolved_once():
+    styles = Stylesheet()
+    styles.define('big', size=20)
+    assert styles['big'] is styles['big']
+    assert styles['big'].size == 20
+    assert styles['big'].font == 'Gotham'
+
+
+def test_define_replaces_resolved_styles():
+    styles = Stylesheet()
+    styles.define('big', size=20)
+    styles.define('bigger', inherit='big', bold=True)
+    assert styles['bigger'].size == 20
+    styles.define('big', size=30)
+    assert styles['bigger'].size == 30
+
+
+def test_styles_are_frozen_and_interned():
+    style = Stylesheet()['default']
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        style.size = 12
+    assert style.clone(size=12) is style.clone(size=12)
+    assert style.clone(size=12) is style.with_fontsize(size=12)
+    assert style.clone(size=12) != style
+    assert len({style, style.clone(), style.clone(size=12)}) == 2
+
+
+def test_sub_styles_are_not_shared():
+    styles = Stylesheet()
+    styles.define('loud', size=20)
+    base = styles['default']
+    loud = base.with_sub_style('strong', styles.items['loud'])
+    assert loud.sub_style('strong').size == 20
+    assert base.sub_style('strong').size == 9
+    assert base.sub_style('strong').bold
+
+
+def test_interned_styles_keep_their_names():
+    first = intern(Style('first', size=30))
+    second = intern(Style('second', size=30))
+    assert first == second and first is not second
+    assert intern(Style('second', size=30)) is second
+    assert pickle.loads(pickle.dumps(second)) is second
+
+
+def test_repeated_clones_made_once(monkeypatch):
+    style = Stylesheet()['default']
+    cloned = style.clone(size=14, color=Color('red'))
+    monkeypatch.setattr(Style, '__post_init__', lambda s: pytest.fail("Made a style for a repeated clone"))
+    assert style.clone(color=Color('red'), size=14) is cloned
+
+
+def test_derived_styles_keep_their_names():
+    first, second = Style('first', size=30), Style('second', size=30)
+    assert first.clone(size=10).name == 'first*' and second.clone(size=10).name == 'second*'
+    overrides = Style('', bold=True)
+    assert first.clone_using(overrides).name == 'first*' and second.clone_using(overrides).name == 'second*'
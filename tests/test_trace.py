@@ -0,0 +1,46 @@
+from util import Optimizer, divide_space, trace
+
+
+class Split(Optimizer):
+    """ Divides 100 into two, best at a quarter, optionally running another optimizer for each evaluation """
+
+    def __init__(self, inner: bool = False):
+        super().__init__(2, 'Inner' if not inner else 'Outer')
+        self.inner = inner
+
+    def make(self, x):
+        if self.inner:
+            Split().run()
+        return divide_space(x, 100, 10)
+
+    def score(self, widths):
+        return (widths[0] - 25) ** 2
+
+    def score_components(self, widths):
+        return {'first': widths[0]}
+
+
+def test_trace_records_nested_evaluations(tmp_path):
+    path = tmp_path.joinpath('trace.jsonl.gz')
+    with trace.tracing(path):
+        Split(inner=True).run()
+    assert trace.current() is None
+
+    records = list(trace.read(path))
+    outer = [r for r in records if r['o'] == 'Outer']
+    inner = [r for r in records if r['o'] == 'Inner']
+    assert outer and inner
+    assert {r['d'] for r in outer} == {1} and {r['d'] for r in inner} == {2}
+    assert all(r['u'] in {o['i'] for o in outer} for r in inner)
+    assert all(len(r['a']) == 1 and sum(r['a'][0]) == 100 for r in records)
+    assert all(r['c'] == {'first': r['a'][0][0]} for r in records)
+    assert all(r['t'] >= sum(i['t'] for i in inner if i['u'] == r['i']) for r in outer)
+
+    summary = trace.summarize(records)
+    assert 'Outer' in summary and 'Inner' in summary
+
+
+def test_no_trace_by_default(tmp_path):
+    assert trace.current() is None
+    widths, _ = Split().run()
+    assert abs(widths[0] - 25) <= 1
@@ -1,3 +1,10 @@
-from .common import Extent, Margins, Point, Rect, configured_logger, parse_options, FINE
+from .common import Extent, Margins, Point, Rect, configure_logging, configured_logger, parse_options, set_log_level, FINE
 from .optimize import BadParametersError, Optimizer, divide_space
-from .roughen import LineModifier
+
+
+def __getattr__(name):
+    # Roughening needs numpy, so is only imported when first used
+    if name == 'LineModifier':
+        from .roughen import LineModifier
+        return LineModifier
+    raise AttributeError("module '%s' has no attribute '%s'" % (__name__, name))
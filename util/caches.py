@@ -0,0 +1,215 @@
+"""
+    Named caches kept in one registry, so their limits and lifetimes are set in one way and they can be reported on
+
+    Every cache has a scope that says how long its entries may live:
+
+        process     for as long as the process runs; entries depend only on their arguments
+        section     until the section being placed is finished; entries hold the laid-out content of its blocks,
+                    which is tied to a single PDF
+
+    'clear' empties all the caches of a scope, and 'report' describes how well each cache has worked. Caches are
+    limited in number of entries and optionally in bytes, evicting the least recently used entries first, so a
+    long-running process uses a bounded amount of memory however many sheets it renders.
+"""
+from __future__ import annotations
+
+import functools
+import sys
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+PROCESS = 'process'
+SECTION = 'section'
+
+SCOPES = (PROCESS, SECTION)
+
+# Separates positional from keyword arguments in keys
+_KEYWORDS = object()
+
+_REGISTRY: Dict[str, Cache] = dict()
+
+
+class CacheInfo(NamedTuple):
+    """ The same fields as the statistics of a functools cache, so either can be used the same way """
+    hits: int
+    misses: int
+    maxsize: Optional[int]
+    currsize: int
+
+
+class Cache:
+    """
+        A least-recently-used cache with statistics
+
+        Fields
+        ------
+
+        name
+            Identifies the cache in reports
+        scope
+            How long entries may live: PROCESS or SECTION
+        maxsize
+            The most entries kept, or None for no limit
+        max_bytes
+            The most bytes kept, as measured by the sizer, or None for no limit
+        sizer
+            Approximates the bytes an entry holds. Entries of caches with a byte limit are measured again when
+            they are used, as values such as images may grow after they have been stored
+    """
+
+    def __init__(self, name: str, scope: str = PROCESS, maxsize: Optional[int] = 128,
+                 max_bytes: Optional[int] = None, sizer: Callable[[object], int] = None):
+        if scope not in SCOPES:
+            raise ValueError("Unknown cache scope '%s'" % scope)
+        self.name = name
+        self.scope = scope
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.sizer = sizer or approximate_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._entries: OrderedDict[object, List] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            if self.max_bytes is not None:
+                self._measure(entry)
+                self._evict()
+            return entry[0]
+
+    def put(self, key, value):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            entry = [value, 0]
+            self._measure(entry)
+            self._entries[key] = entry
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._entries))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _measure(self, entry: List):
+        size = self.sizer(entry[0])
+        self.bytes += size - entry[1]
+        entry[1] = size
+
+    def _evict(self):
+        # Always keep the newest entry, even if it is over the byte limit on its own
+        while len(self._entries) > 1 and (self.maxsize is not None and len(self._entries) > self.maxsize
+                                          or self.max_bytes is not None and self.bytes > self.max_bytes):
+            _, (_, size) = self._entries.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+
+
+def register(name: str, scope: str = PROCESS, maxsize: Optional[int] = 128, max_bytes: Optional[int] = None,
+             sizer: Callable[[object], int] = None) -> Cache:
+    """ Create a cache and add it to the registry; names must be unique """
+    if name in _REGISTRY:
+        raise ValueError("A cache named '%s' already exists" % name)
+    cache = _REGISTRY[name] = Cache(name, scope, maxsize, max_bytes, sizer)
+    return cache
+
+
+def cached(name: str, scope: str = PROCESS, maxsize: Optional[int] = 128, max_bytes: Optional[int] = None,
+           sizer: Callable[[object], int] = None):
+    """
+        Decorator that caches the results of a function in a registered cache
+
+        Like functools.lru_cache, the arguments must be hashable and the wrapped function has 'cache_info',
+        'cache_clear' and '__wrapped__'; the cache itself is 'cache'
+    """
+
+    def decorator(function: Callable):
+        cache = register(name, scope, maxsize, max_bytes, sizer)
+        missing = object()
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            key = args + (_KEYWORDS,) + tuple(sorted(kwargs.items())) if kwargs else args
+            result = cache.get(key, missing)
+            if result is missing:
+                result = function(*args, **kwargs)
+                cache.put(key, result)
+            return result
+
+        wrapper.cache = cache
+        wrapper.cache_info = cache.info
+        wrapper.cache_clear = cache.clear
+        return wrapper
+
+    return decorator
+
+
+def get(name: str) -> Cache:
+    return _REGISTRY[name]
+
+
+def clear(scope: str = None):
+    """ Empty every cache of the scope, or every cache if no scope is given """
+    for cache in _REGISTRY.values():
+        if scope is None or cache.scope == scope:
+            cache.clear()
+
+
+def statistics() -> Dict[str, Dict[str, object]]:
+    """ The counts for each cache, suitable for writing as JSON """
+    return {c.name: dict(scope=c.scope, entries=len(c), hits=c.hits, misses=c.misses, evictions=c.evictions,
+                         bytes=c.bytes) for c in _REGISTRY.values()}
+
+
+def report() -> str:
+    """ A table of the caches, with how often they were used and roughly how much memory they hold """
+    lines = ['%-24s %-8s %8s %10s %10s %8s %10s %10s' % ('cache', 'scope', 'entries', 'hits', 'misses', 'hit rate',
+                                                         'evictions', 'KiB')]
+    for c in sorted(_REGISTRY.values(), key=lambda c: c.name):
+        calls = c.hits + c.misses
+        rate = '%7.1f%%' % (100 * c.hits / calls) if calls else '%8s' % '-'
+        lines.append('%-24s %-8s %8d %10d %10d %s %10d %10.1f' % (c.name, c.scope, len(c), c.hits, c.misses, rate,
+                                                                  c.evictions, c.bytes / 1024))
+    return '\n'.join(lines)
+
+
+def approximate_size(value) -> int:
+    """
+        The size of an object and the objects it directly holds
+
+        Objects shared between entries -- such as the PDF content is drawn on -- would be counted many times if
+        references were followed further, so this is a lower bound rather than an exact measure
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, (str, bytes, int, float, bool)) or value is None:
+        return size
+    if isinstance(value, dict):
+        parts = list(value.keys()) + list(value.values())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        parts = value
+    else:
+        attributes = getattr(value, '__dict__', None)
+        if attributes is not None:
+            size += sys.getsizeof(attributes)
+            parts = attributes.values()
+        else:
+            slots = getattr(type(value), '__slots__', ())
+            parts = [getattr(value, s, None) for s in ((slots,) if isinstance(slots, str) else slots)]
+    return size + sum(sys.getsizeof(p) for p in parts)
@@ -2,14 +2,12 @@
 from __future__ import annotations
 
 import logging
-import logging.config
 import math
 import os
 from collections import namedtuple
 from pathlib import Path
 from typing import Dict, NamedTuple
 
-import yaml
 
 def _simplify(txt):
     txt = txt.strip()
@@ -107,6 +105,8 @@ class Extent(NamedTuple):
 
 
 class Rect(namedtuple('Rect', 'left right top bottom')):
+    # No per-instance dictionary; rectangles are created in very large numbers during layout
+    __slots__ = ()
 
     @classmethod
     def make(cls, left=None, right=None, top=None, bottom=None, width=None, height=None):
@@ -118,16 +118,28 @@ class Rect(namedtuple('Rect', 'left right top bottom')):
             bottom = top + height
         elif top is None:
             top = bottom - height
-        return cls(round(left), round(right), round(top), round(bottom))
+        return _new_tuple(cls, (_to_int(left), _to_int(right), _to_int(top), _to_int(bottom)))
 
     @classmethod
     def union(cls, *args):
-        mix = list(args[0]) if len(args) == 1 else list(args)
-        u = mix[0]
-        for r in mix[1:]:
-            u = Rect.make(left=min(r.left, u.left), top=min(r.top, u.top),
-                          right=max(r.right, u.right), bottom=max(r.bottom, u.bottom))
-        return u
+        """ Bounding rectangle of the rectangles passed in, either as arguments or as a single iterable """
+        items = iter(args[0]) if len(args) == 1 else iter(args)
+        first = next(items)
+        left, right, top, bottom = first
+        single = True
+        for r in items:
+            single = False
+            if r[0] < left:
+                left = r[0]
+            if r[1] > right:
+                right = r[1]
+            if r[2] < top:
+                top = r[2]
+            if r[3] > bottom:
+                bottom = r[3]
+        if single:
+            return first
+        return _new_tuple(cls, (_to_int(left), _to_int(right), _to_int(top), _to_int(bottom)))
 
     @property
     def width(self):
@@ -146,18 +158,18 @@ class Rect(namedtuple('Rect', 'left right top bottom')):
         return Extent(self.width, self.height)
 
     def __add__(self, off: Margins) -> Rect:
-        return Rect(self.left - off.left, self.right + off.right,
-                    self.top - off.top, self.bottom + off.bottom)
+        return _new_tuple(Rect, (self[0] - off.left, self[1] + off.right, self[2] - off.top, self[3] + off.bottom))
 
     def __sub__(self, off: Margins) -> Rect:
-        return Rect(self.left + off.left, self.right - off.right,
-                    self.top + off.top, self.bottom - off.bottom)
+        return _new_tuple(Rect, (self[0] + off.left, self[1] - off.right, self[2] + off.top, self[3] - off.bottom))
 
     def __str__(self):
         return "[l=%d r=%d t=%d b=%d]" % (self.left, self.right, self.top, self.bottom)
 
     def move(self, *, dx=0, dy=0) -> Rect:
-        return Rect(self.left + dx, self.right + dx, self.top + dy, self.bottom + dy)
+        if not dx and not dy:
+            return self
+        return _new_tuple(Rect, (self[0] + dx, self[1] + dx, self[2] + dy, self[3] + dy))
 
     def resize(self, *, width=None, height=None) -> Rect:
         return Rect(self.left, self.right if width is None else self.left + width,
@@ -171,6 +183,14 @@ class Rect(namedtuple('Rect', 'left right top bottom')):
         return Rect(left, left + width, self.top, self.bottom)
 
 
+# Creating the tuple directly avoids the keyword handling in the namedtuple constructor
+_new_tuple = tuple.__new__
+
+
+def _to_int(v) -> int:
+    return v if type(v) is int else round(v)
+
+
 def _consistent(low, high, size, description):
     n = (low is None) + (high is None) + (size is None)
     if n == 0 and low + size != high:
@@ -187,22 +207,63 @@ def _consistent(low, high, size, description):
 
 # LOGGING #######################################################################################################
 
+LOGGING_CONFIG = Path(__file__).parent.parent.joinpath('resources', 'logging.yaml')
+
 _logging_initialized = False
+
+# Tracing level for hot paths -- every node read, paragraph measured or optimizer evaluation. It is below DEBUG, so is
+# off unless a logger is set to it in resources/logging.yaml. Where making the message costs anything, guard the call
+# with 'if LOGGER.isEnabledFor(FINE)'; logging caches that check, so a disabled trace costs a dictionary lookup
 FINE = 8
 
 
-def _initialize_logging():
-    logging.FINE = FINE
-    logging.addLevelName(FINE, "FINE")
+def _fine(self, message, *args, **kws):
+    if self.isEnabledFor(FINE):
+        self._log(FINE, message, args, **kws)
+
+
+logging.FINE = FINE
+logging.addLevelName(FINE, "FINE")
+logging.Logger.fine = _fine
 
-    def fine(self, message, *args, **kws):
-        if self.isEnabledFor(FINE):
-            self._log(FINE, message, args, **kws)
 
-    logging.Logger.fine = fine
+def configure_logging(path: Path = LOGGING_CONFIG, level: int = None):
+    """
+        Set up handlers and levels from the logging configuration file
 
-    path = Path(__file__).parent.parent.joinpath('resources','logging.yaml')
+        Programs call this once when they start. Reading the configuration and opening the log file are too slow to
+        do whenever a module is imported, and a library should leave logging to the program using it.
+        If a level is given, it replaces the levels in the configuration; see 'set_log_level'
+    """
+    global _logging_initialized
+    if _logging_initialized:
+        return
+    _logging_initialized = True
+    _read_logging_configuration(path)
+    if level is not None:
+        set_log_level(level)
+
+
+def set_log_level(level: int):
+    """
+        Log messages at this level and above from every logger, whatever the logging configuration says
+
+        Messages below the level are not even made. The log file is sent every message logged, so FINE traces can be
+        read there; the console still only shows what the configuration sends it
+    """
+    logging.disable(level - 1)
+    loggers = [logging.root] + [g for g in logging.root.manager.loggerDict.values() if isinstance(g, logging.Logger)]
+    for logger in loggers:
+        logger.setLevel(level)
+        for handler in logger.handlers:
+            if isinstance(handler, logging.FileHandler) and handler.level > level:
+                handler.setLevel(level)
+
+
+def _read_logging_configuration(path: Path):
     if os.path.exists(path):
+        import logging.config
+        import yaml
         with open(path, 'rt') as f:
             try:
                 config = yaml.safe_load(f.read())
@@ -221,8 +282,5 @@ def _initialize_logging():
 
 
 def configured_logger(name: str):
-    global _logging_initialized
-    if not _logging_initialized:
-        _initialize_logging()
-        _logging_initialized = True
+    """ The logger for a module; messages go nowhere but the console until 'configure_logging' is called """
     return logging.getLogger(name)
@@ -0,0 +1,173 @@
+""" Registry of the fonts available for styles, shared by the whole process """
+from __future__ import annotations
+
+import functools
+import hashlib
+from pathlib import Path
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Set
+
+from reportlab.lib.fonts import tt2ps
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+from . import caches
+from .common import configured_logger
+
+LOGGER = configured_logger(__name__)
+
+FONT_DIR = Path(__file__).parent.parent.joinpath('resources', 'fonts')
+
+
+class FontFamily(NamedTuple):
+    """
+        Metadata for a font family
+
+        Fields
+        ------
+
+        name
+            The name styles use to refer to the family
+        resource
+            Base name of the TTF files in the fonts directory; None for fonts built into reportlab
+        leading
+            Line spacing as a multiple of the font size
+        multiplier
+            Scaling applied to the font size, to make the families visually similar in size
+    """
+    name: str
+    resource: Optional[str] = None
+    leading: float = 1.2
+    multiplier: float = 1.0
+
+
+_FAMILIES: Dict[str, FontFamily] = {f.name.lower(): f for f in [
+    FontFamily('Gotham', 'Gotham', multiplier=0.9),
+    FontFamily('Baskerville', 'Baskerville'),
+
+    FontFamily('Adventure', 'Adventure', leading=1.0),
+    FontFamily('Steampunk', 'Zalora', leading=1.1, multiplier=0.95),
+    FontFamily('Steamship', 'Starship', leading=1.15),
+    FontFamily('LoveYou', 'I Love What You Do', leading=1.1, multiplier=1.2),
+    FontFamily('Comics', 'back-issues-bb', multiplier=0.9),
+    FontFamily('Tech', 'oceanicdrift', leading=0.8, multiplier=1.2),
+    FontFamily('Space', 'Starjedi', leading=1.1),
+    FontFamily('Western', 'Carnevalee Freakshow', leading=1.0, multiplier=1.15),
+    FontFamily('ArtDeco', 'CaviarDreams', leading=1.1),
+    FontFamily('Radioactive', '28 Days Later', leading=1.1),
+    FontFamily('Typewriter', 'SpecialElite'),
+    FontFamily('Monster', 'mrsmonster', leading=1.1),
+    FontFamily('Script', 'Parisienne', leading=1.1),
+    FontFamily('Medieval', 'Seagram', leading=1.25, multiplier=1.1),
+
+    FontFamily('MotionPicture', 'MotionPicture', leading=1.0, multiplier=1.2),
+    FontFamily('Symbola', 'Symbola'),
+
+    # Leading adjustments to standard fonts
+    FontFamily('Courier', leading=1.1),
+]}
+
+_DEFAULT = FontFamily('default')
+
+# Families whose files have been parsed and registered with reportlab
+_installed: Set[str] = set()
+
+
+def family(name: str) -> FontFamily:
+    """ Metadata for a font or font family; unknown names get the default metadata """
+    return _FAMILIES.get(name.lower(), _DEFAULT)
+
+
+def leading_for(name: str) -> float:
+    return family(name).leading
+
+
+def multiplier_for(name: str) -> float:
+    return family(name).multiplier
+
+
+def ensure_font(name: str) -> str:
+    """
+        Make sure a font family is registered with reportlab, loading its files the first time it is used
+
+        Names that are not families we know about are left for reportlab to handle
+        :return: the name passed in
+    """
+    if name in _installed:
+        return name
+    f = _FAMILIES.get(name.lower())
+    if f and f.resource and f.name == name:
+        _install(f)
+    _installed.add(name)
+    return name
+
+
+def face(name: str, bold: bool = False, italic: bool = False) -> str:
+    """ The font that draws a family in the given weight and slant, as paragraphs choose it """
+    ensure_font(name)
+    try:
+        return tt2ps(name, int(bool(bold)), int(bool(italic)))
+    except ValueError:
+        # Not a family reportlab knows; it is used as it is
+        return name
+
+
+@functools.lru_cache(maxsize=None)
+def version() -> str:
+    """ Identifies the set of font files, so results that depend on font metrics can tell when they change """
+    digest = hashlib.sha1()
+    for path in sorted(FONT_DIR.glob('*.ttf')):
+        stat = path.stat()
+        digest.update(('%s:%d:%d;' % (path.name, stat.st_size, stat.st_mtime_ns)).encode())
+    return digest.hexdigest()
+
+
+@caches.cached('font_coverage', maxsize=64)
+def coverage(name: str) -> FrozenSet[str]:
+    """
+        The characters a font can draw, worked out once per font
+
+        Standard fonts can draw whatever their single-byte encoding maps; TrueType fonts whatever has a glyph
+    """
+    font = pdfmetrics.getFont(ensure_font(name))
+    face = getattr(font, 'face', None)
+    if hasattr(face, 'charToGlyph'):
+        return frozenset(chr(c) for c in face.charToGlyph)
+    # Encode every character at once; those that cannot be encoded are replaced by '?'
+    chars = ''.join(chr(c) for c in range(0x10000) if not 0xD800 <= c < 0xE000)
+    encoded = chars.encode(font.encName, 'replace')
+    return frozenset(c for c, b in zip(chars, encoded) if b != ord('?')) | {'?'}
+
+
+def font_names() -> List[str]:
+    """ Names of all fonts that can be used, without loading any of them """
+    standard = [f for f in pdfmetrics.standardFonts if f not in {'Symbol', 'ZapfDingbats'}]
+    user = [f.name + suffix for f in _FAMILIES.values() if f.resource
+            for suffix in ('', '-Bold', '-Italic', '-BoldItalic') if _font_file(f.resource, suffix).exists()]
+    return sorted(standard + user)
+
+
+def _font_file(resource: str, suffix: str) -> Path:
+    return FONT_DIR.joinpath((resource + (suffix or '-Regular')) + '.ttf')
+
+
+def _register(name: str, resource: str, suffix: str, default_font_name: Optional[str]) -> Optional[str]:
+    loc = _font_file(resource, suffix)
+    if loc.exists():
+        pdfmetrics.registerFont(TTFont(name, loc))
+        return name
+    else:
+        return default_font_name
+
+
+def _install(f: FontFamily):
+    try:
+        pdfmetrics.getFont(f.name)
+        return
+    except KeyError:
+        pass
+    LOGGER.debug("Loading font family '%s'", f.name)
+    regular = _register(f.name, f.resource, '', None)
+    bold = _register(f.name + '-Bold', f.resource, '-Bold', regular)
+    italic = _register(f.name + '-Italic', f.resource, '-Italic', regular)
+    bold_italic = _register(f.name + '-BoldItalic', f.resource, '-BoldItalic', bold)
+    pdfmetrics.registerFontFamily(f.name, normal=f.name, bold=bold, italic=italic, boldItalic=bold_italic)
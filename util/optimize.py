@@ -1,13 +1,11 @@
 """ Optimize a layout"""
+import contextlib
 import math
 import time
-from functools import lru_cache
-from typing import Generic, Iterable, Tuple, TypeVar
+from contextvars import ContextVar
+from typing import Dict, Generic, Iterable, List, NamedTuple, Optional, Tuple, TypeVar
 
-import numpy as np
-import scipy.optimize
-
-from util import configured_logger
+from util import FINE, caches, configured_logger, trace
 
 T = TypeVar('T')
 
@@ -23,6 +21,61 @@ class BadParametersError(RuntimeError):
         self.badness = badness
 
 
+class Solution(NamedTuple):
+    """
+        What an optimizer chose, so it can be made again without searching
+
+        Fields
+        ------
+
+        params
+            The parameters of the best item found, or None if no item could be made
+        nested
+            The solutions of optimizers run while making the best item
+    """
+    params: Optional[Tuple[float, ...]]
+    nested: Tuple['Solution', ...] = ()
+
+
+class Solutions:
+    """
+        The solutions found by the optimizers run for some piece of work, in the order they were run
+
+        Solutions that are already known are replayed by optimizers instead of searching; once they run out,
+        or an optimizer does not match the next one, optimizers go back to searching
+    """
+
+    def __init__(self, known: Iterable[Solution] = ()):
+        self.known = list(known)
+        self.found: List[Solution] = []
+        self.diverged = False
+
+    def next(self, k: int) -> Optional[Solution]:
+        """ The known solution for the next optimizer, which has 'k' dimensions """
+        if self.diverged or len(self.found) >= len(self.known):
+            return None
+        solution = self.known[len(self.found)]
+        if solution.params is not None and len(solution.params) != k - 1:
+            LOGGER.debug("Stored solution has %d parameters, but expected %d", len(solution.params), k - 1)
+            self.diverged = True
+            return None
+        return solution
+
+
+# The solutions being replayed and recorded; None when not recording
+_SOLUTIONS: ContextVar[Optional[Solutions]] = ContextVar('solutions', default=None)
+
+
+@contextlib.contextmanager
+def recording(solutions: Optional[Solutions]):
+    """ Record the solutions of optimizers run in this context, replaying any that are already known """
+    token = _SOLUTIONS.set(solutions)
+    try:
+        yield solutions
+    finally:
+        _SOLUTIONS.reset(token)
+
+
 class Optimizer(Generic[T]):
     """
         Solve an optimization problem
@@ -56,9 +109,20 @@ class Optimizer(Generic[T]):
         """ Score the item """
         raise NotImplementedError()
 
+    def score_components(self, item: T) -> Dict[str, float]:
+        """ The measures that go into the score of an item, for traces; by default those of its content """
+        items = item if isinstance(item, (list, tuple)) else [item]
+        return {name: sum(getattr(i, name, 0) for i in items)
+                for name in ('bad_breaks', 'ok_breaks', 'unused_width', 'internal_variance')}
+
     def score_params(self, p: Tuple[float]) -> (float, T):
         """ scoring function, also returns created object """
+        tracer = trace.current()
+        if tracer is not None:
+            return tracer.evaluate(self, p, self._score_params)
+        return self._score_params(p)
 
+    def _score_params(self, p: Tuple[float]) -> (float, T):
         try:
             x = params_to_x(p)
             item = self.make(x)
@@ -66,10 +130,46 @@ class Optimizer(Generic[T]):
             return BAD_PARAMS_FACTOR * (1 + err.badness), None
 
         f = self.score(item) if item else BAD_PARAMS_FACTOR
-        LOGGER.fine("[%s] %s -> %s -> %1.3f", self.name, _pretty(x), item, f)
+        if LOGGER.isEnabledFor(FINE):
+            LOGGER.fine("[%s] %s -> %s -> %1.3f", self.name, _pretty(x), item, f)
         return f, item
 
     def run(self) -> (T, (float, [float])):
+        tracer = trace.current()
+        if tracer is None:
+            return self._run()
+        with tracer.run():
+            return self._run()
+
+    def _run(self) -> (T, (float, [float])):
+        solutions = _SOLUTIONS.get()
+        known = solutions.next(self.k) if solutions is not None else None
+        if known is None:
+            # Optimizers used while searching are not recorded, only those used to make the final result
+            with recording(None):
+                params, best = self._search()
+        else:
+            params, best = known.params, None
+            LOGGER.debug("[%s]: Using stored solution %s", self.name, params and _pretty(params))
+
+        nested = Solutions(known.nested if known else ())
+        if params is None:
+            results = None, (math.inf, None)
+        else:
+            with recording(nested):
+                f, item = self.score_params(params)
+            assert best is None or f == best
+            results = item, (f, params_to_x(params))
+        if solutions is not None:
+            solutions.found.append(Solution(params, tuple(nested.found)))
+        return results
+
+    def _search(self) -> (Optional[Tuple[float, ...]], float):
+        """ The best parameters found and their score, or None if the search failed """
+        # Only imported when a search is made, as they take longer to import than many sheets take to lay out
+        import numpy as np
+        import scipy.optimize
+
         x0 = np.asarray((1.0 / self.k,) * (self.k - 1))
 
         start = time.perf_counter()
@@ -82,19 +182,17 @@ class Optimizer(Generic[T]):
         if hasattr(solution, 'success') and not solution.success:
             LOGGER.info("[%s]: Failed using nelder-mead in %1.2fs after %d evaluations: %s", self.name, duration,
                         solution.nfev, solution.message)
-            results = None, (math.inf, None)
+            result = None, math.inf
         else:
-            f, item = self.score_params(tuple(solution.x))
-            assert f == solution.fun
-            results = item, (f, params_to_x(solution.x))
-            LOGGER.info("[%s]: Solved using nelder-mead in %1.2fs with %d evaluations: %s -> %s -> %1.3f",
-                        self.name, duration, solution.nfev, _pretty(solution.x), item, f)
+            result = tuple(float(v) for v in solution.x), solution.fun
+            LOGGER.info("[%s]: Solved using nelder-mead in %1.2fs with %d evaluations: %s -> %1.3f",
+                        self.name, duration, solution.nfev, _pretty(solution.x), solution.fun)
 
-        if hasattr(_score, 'cache_info'):
-            LOGGER.fine("Optimizer cache info = %s", str(_score.cache_info()).replace('CacheInfo', ''))
-            _score.cache_clear()
+        # Scores are only for this run's optimizer, so are no use once it has finished
+        LOGGER.fine("Optimizer cache info = %s", _score.cache_info())
+        _score.cache_clear()
 
-        return results
+        return result
 
     def _unit_simplex(self):
         if self.k == 2:
@@ -144,10 +242,13 @@ def divide_space(x: [float], total: int, minval: int, granularity=1) -> Tuple[in
 
     result[-1] = total - sum(result)
     assert result[-1] >= minval
+    tracer = trace.current()
+    if tracer is not None:
+        tracer.allocated(result)
     return tuple(result)
 
 
-@lru_cache
+@caches.cached('optimizer_scores', maxsize=1024)
 def _score(x: [float], optimizer: Optimizer) -> float:
     return optimizer.score_params(x)[0]
 
@@ -1,13 +1,17 @@
-import functools
-import math
-import random
+""" Hand-drawn effects for lines: a rough, wobbly line or a line of small teeth """
+from __future__ import annotations
+
 from copy import copy
-from typing import Callable, List, Sequence
+from typing import List, Sequence, Tuple
 
+import numpy as np
 from reportlab.pdfgen.canvas import Canvas
 from reportlab.pdfgen.pathobject import PDFPathObject
 
-from .common import Point
+from . import caches
+
+# Codes that close the current sub-path
+_CLOSING = {'h', 's', 'b', 'b*'}
 
 
 class LineModifier:
@@ -26,7 +30,6 @@ class LineModifier:
             self.step = self.σ * 10
         else:
             self.step = 10
-        self.rand = random.Random()
 
     def rect_to_path(self, x, y, width, height, rounded=0, inset=False) -> PDFPathObject:
         p = self.canvas.beginPath()
@@ -53,102 +56,222 @@ class LineModifier:
         return self.mangle(copy(path))
 
     def _mangle_path_code(self, path: Sequence[str]) -> List[str]:
-        self._offset = Point(*self.canvas.absolutePosition(0, 0))
-        result = []
-        start = None
-        last = None
+        """
+            Modify the drawing operations of a path
+
+            The result only depends on the path, where it is on the page and the effect, so identical shapes
+            drawn at the same place -- such as the same frame on several pages -- are only calculated once
+        """
+        offset = self.canvas.absolutePosition(0, 0)
+        return list(_mangled_code(tuple(path), offset, self.method, self.σ, self.step))
+
+
+@caches.cached('roughened_paths', maxsize=1024)
+def _mangled_code(path: Tuple[str], offset: Tuple[float, float], method: str, σ: float, step: float) -> Tuple[str]:
+    """
+        The modified drawing operations of a path
+
+        The path is split into segments, which are all sampled together as arrays. The resulting points are
+        written out in a single formatting step
+    """
+    segments = _Segments(path)
+    if not segments.count:
+        return path
+
+    offset = np.array(offset, dtype=float)
+    if method == 'teeth':
+        starts = segments.moves
+    else:
+        starts = _jitter(segments.moves, offset, np.full(len(segments.moves), σ))
+
+    segments.start_at(starts)
+    steps, factor = segments.steps(step, min_steps=1 if method == 'teeth' else 5)
+    owner, t = _sample_positions(steps)
+    points = segments.at(owner, t)
+
+    if method == 'teeth':
+        # Each tooth runs from the previous point, which for the first in a segment is the segment start
+        before = np.empty_like(points)
+        before[1:] = points[:-1]
+        before[np.cumsum(steps) - steps] = segments.controls[:, 0]
+        points = _teeth(before, points, σ)
+        steps = steps * 5
+    else:
+        points = _jitter(points, offset, (σ / factor)[owner])
+
+    return segments.format(starts, points, steps),
+
+
+def _jitter(points: np.ndarray, offset: np.ndarray, σ: np.ndarray) -> np.ndarray:
+    """
+        Move points by a random amount
+
+        The noise depends only on the absolute location of each point, so redrawing at the same location gives
+        the same amount
+    """
+    location = np.round(points + offset).astype(np.int64)
+    noise = np.clip(_gaussian(location) * σ[:, None], -2 * σ[:, None], 2 * σ[:, None])
+    return points + noise
+
+
+def _teeth(a: np.ndarray, b: np.ndarray, σ: float) -> np.ndarray:
+    """ Five points making a single tooth between each pair of points """
+    d = b - a
+    θ = np.arctan2(d[:, 1], d[:, 0]) - np.pi / 2
+    v = np.stack([σ * np.cos(θ), σ * np.sin(θ)], axis=1)
+    c1 = 0.95 * a + 0.05 * b
+    c2 = 0.55 * a + 0.45 * b
+    c3 = 0.45 * a + 0.55 * b
+    c4 = 0.05 * a + 0.95 * b
+    return np.stack([c1 + v, c2 + v, c3 - v, c4 - v, b], axis=1).reshape(-1, 2)
+
+
+class _Segments:
+    """
+        The drawing segments of a path, as arrays of bezier control points
+
+        Straight lines are held as beziers with both control points at the start, but flagged so they are evaluated
+        as lines.
+    """
+
+    def __init__(self, path: Sequence[str]):
+        # The output terms: (code, None) for unchanged codes, ('m', index of move) or ('l', index of segment)
+        self.terms: List[Tuple[str, int]] = []
+        moves = []
+        controls = []
+        lines = []
+        owner_moves = []
+        # Which control points are the start of the sub-path
+        from_start = []
+
+        start = last = None
+        follows = False
         for term in path:
             parts = term.split()
             code = parts[-1]
-            coords = [Point(float(parts[i]), float(parts[i + 1])) for i in range(0, len(parts) - 1, 2)]
+            coords = [(float(parts[i]), float(parts[i + 1])) for i in range(0, len(parts) - 1, 2)]
             if code == 'm':
-                if self.method == 'teeth':
-                    start = last = coords[0]
-                else:
-                    start = last = self.jitter(coords[0])
-                result.append(join(code, last))
-            elif not coords and code not in {'h', 's', 'b', 'b*'}:
+                start = last = coords[0]
+                self.terms.append(('m', len(moves)))
+                moves.append(start)
+                follows = True
+                continue
+            elif not coords and code not in _CLOSING:
                 # Drawing operations that do not close the path
-                result.append(code)
+                self.terms.append((code, None))
+                continue
+            elif code == 'l':
+                segment = (last, last, last, coords[0])
+                starts = (follows, False, False, False)
+            elif code in _CLOSING:
+                segment = (last, last, last, start)
+                starts = (follows, False, False, True)
+            elif code == 'c':
+                segment = (last, coords[0], coords[1], coords[2])
+                starts = (follows, False, False, False)
+            elif code == 'v':
+                segment = (last, last, coords[0], coords[1])
+                starts = (follows, follows, False, False)
+            elif code == 'y':
+                segment = (last, coords[0], coords[1], coords[1])
+                starts = (follows, False, False, False)
+            else:
+                raise ValueError("Unhandled PDF path code: '%s'" % code)
+
+            self.terms.append(('l', len(controls)))
+            controls.append(segment)
+            from_start.append(starts)
+            lines.append(code == 'l' or code in _CLOSING)
+            owner_moves.append(len(moves) - 1)
+            follows = False
+            last = segment[3]
+
+            # Need to add close after the other interpolations
+            if code == 'h':
+                self.terms.append(('h', None))
+
+        self.count = len(controls)
+        self.moves = np.array(moves, dtype=float).reshape(-1, 2)
+        self.controls = np.array(controls, dtype=float).reshape(-1, 4, 2)
+        self.lines = np.array(lines, dtype=bool)
+        self.owner_moves = np.array(owner_moves, dtype=int)
+        self.from_start = np.array(from_start, dtype=bool).reshape(-1, 4)
+
+    def start_at(self, starts: np.ndarray):
+        """ Use modified positions for the starts of the sub-paths """
+        segment, control = np.nonzero(self.from_start)
+        self.controls[segment, control] = starts[self.owner_moves[segment]]
+
+    def steps(self, step: float, min_steps: int) -> (np.ndarray, np.ndarray):
+        """
+            How many points to sample each segment with
+
+            Segments shorter than a point are just drawn to their end.
+            :return: the number of points for each segment and how much shorter than 'step' the sampled steps are
+        """
+        t = np.linspace(0, 1, 6)
+        v = self.at(np.repeat(np.arange(self.count), 6), np.tile(t, self.count)).reshape(-1, 6, 2)
+        d = np.hypot(*np.moveaxis(np.diff(v, axis=1), 2, 0)).sum(axis=1)
+        tiny = d < 1
+        steps = np.where(tiny, 1, np.maximum(min_steps, np.round(d / step))).astype(int)
+        factor = np.where(tiny, 1, steps * step / np.where(tiny, 1, d))
+        return steps, factor
+
+    def at(self, owner: np.ndarray, t: np.ndarray) -> np.ndarray:
+        """ Points on the segments """
+        a, c1, c2, b = np.moveaxis(self.controls[owner], 1, 0)
+        t = t[:, None]
+        s = 1 - t
+        curve = s ** 3 * a + 3 * t * s * s * c1 + 3 * t * t * s * c2 + t ** 3 * b
+        line = a * s + b * t
+        return np.where(self.lines[owner][:, None], line, curve)
+
+    def format(self, starts: np.ndarray, points: np.ndarray, counts: np.ndarray) -> str:
+        """ The PDF code for the path with the segments replaced by the points """
+        ends = np.cumsum(counts).tolist()
+        counts = counts.tolist()
+        templates = []
+        for code, index in self.terms:
+            if code == 'm':
+                templates.append('%.1f %.1f m')
+            elif code == 'l':
+                templates.append(' '.join(['%.1f %.1f l'] * counts[index]))
             else:
-                if code == 'l':
-                    f = functools.partial(linear, last, coords[0])
-                elif code in {'h', 's', 'b', 'b*'}:
-                    # These all close the path
-                    f = functools.partial(linear, last, start)
-                elif code == 'c':
-                    f = functools.partial(bezier, last, coords[0], coords[1], coords[2])
-                elif code == 'v':
-                    f = functools.partial(bezier, last, last, coords[0], coords[1])
-                elif code == 'y':
-                    f = functools.partial(bezier, last, coords[0], coords[1], coords[1])
-                else:
-                    raise ValueError("Unhandled PDF path code: '%s'" % code)
-
-                if self.method == 'teeth':
-                    pts, _ = self.interpolate(f, min_steps=1)
-                    for pt in pts:
-                        result += self.teeth(last, pt)
-                        last = pt
-                else:
-                    pts, factor = self.interpolate(f)
-                    self.σ /= factor
-                    for pt in pts:
-                        p = self.jitter(pt)
-                        result.append(join('l', p))
-                    last = pts[-1]
-                    self.σ *= factor
-
-                # Need to add close after the other interpolations
-                if code == 'h':
-                    result.append('h')
-
-        return result
-
-    def jitter(self, p: Point):
-        # Randomize the seed based on the absolute location, so any new values at this location get the same amount
-        self.rand.seed(round(p + self._offset))
-        return Point(p[0] + self._noise(), p[1] + self._noise())
-
-    def _noise(self):
-        return min(2 * self.σ, max(-2 * self.σ, self.rand.gauss(0, self.σ)))
-
-    def interpolate(self, func: Callable, min_steps=5) -> (Sequence[Point], float):
-        v = [func(i / 5) for i in range(0, 6)]
-        d = sum(abs(v[i] - v[i + 1]) for i in range(0, 5))
-        if d < 1:
-            return v[:-1:], 1
-        steps = max(min_steps, round(d / self.step))
-
-        # This is the factor by which our steps are smaller than expected
-        # We use this to reduce the sigma value proportionally
-        factor = steps * self.step / d
-
-        return [func(i / steps) for i in range(1, steps + 1)], factor
-
-    def teeth(self, a: Point, b: Point) -> List[str]:
-        θ, d = (b - a).to_polar()
-        c1 = 0.95 * a + 0.05 * b
-        c2 = 0.55 * a + 0.45 * b
-        c3 = 0.45 * a + 0.55 * b
-        c4 = 0.05 * a + 0.95 * b
-        v = Point.from_polar(θ - math.pi / 2, self.σ)
-        return [
-            join('l', c1 + v),
-            join('l', c2 + v),
-            join('l', c3 - v),
-            join('l', c4 - v),
-            join('l', b),
-        ]
-
-
-def join(code, *args):
-    return ' '.join("{0:0.1f} {1:0.1f}".format(p.x, p.y) for p in args) + ' ' + code
-
-
-def linear(a, b, t) -> Point:
-    return a * (1 - t) + b * t
-
-
-def bezier(a, c1, c2, b, t) -> Point:
-    return (1 - t) ** 3 * a + 3 * t * (1 - t) * (1 - t) * c1 + 3 * t * t * (1 - t) * c2 + t ** 3 * b
+                templates.append(code)
+
+        # The values are in the same order as the templates use them
+        values = []
+        points = points.tolist()
+        starts = starts.tolist()
+        for code, index in self.terms:
+            if code == 'm':
+                values += starts[index]
+            elif code == 'l':
+                for p in points[ends[index] - counts[index]:ends[index]]:
+                    values += p
+        return ' '.join(templates) % tuple(values)
+
+
+def _sample_positions(steps: np.ndarray) -> (np.ndarray, np.ndarray):
+    """ For each sample, the segment it belongs to and its parameter, t = 1/n, 2/n ... 1 """
+    owner = np.repeat(np.arange(len(steps)), steps)
+    index = np.arange(len(owner)) - np.repeat(np.cumsum(steps) - steps, steps) + 1
+    return owner, index / steps[owner]
+
+
+def _gaussian(location: np.ndarray) -> np.ndarray:
+    """ A pair of normally distributed values for each integer location, always the same for the same location """
+    with np.errstate(over='ignore'):
+        h = location[:, 0].astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+        h ^= location[:, 1].astype(np.uint64) * np.uint64(0xC2B2AE3D27D4EB4F)
+        # Finalizer from SplitMix64, to spread the bits
+        h ^= h >> np.uint64(30)
+        h *= np.uint64(0xBF58476D1CE4E5B9)
+        h ^= h >> np.uint64(27)
+        h *= np.uint64(0x94D049BB133111EB)
+        h ^= h >> np.uint64(31)
+    # Two uniform values in (0, 1] from the two halves, then Box-Muller
+    u1 = ((h >> np.uint64(32)).astype(float) + 1) / 2 ** 32
+    u2 = (h & np.uint64(0xFFFFFFFF)).astype(float) / 2 ** 32
+    r = np.sqrt(-2 * np.log(u1))
+    return np.stack([r * np.cos(2 * np.pi * u2), r * np.sin(2 * np.pi * u2)], axis=1)
@@ -0,0 +1,135 @@
+"""
+    Records of every evaluation the optimizers make, for finding out where layout time goes
+
+    Tracing is off unless a trace is started with 'tracing'; each evaluation is then written as a line of JSON
+    (compressed if the file name ends in '.gz'), with these fields:
+
+        i   the number of the evaluation, counting from one, in the order evaluations started
+        u   the number of the evaluation this one was made within, or zero if none
+        r   the number of the optimizer run the evaluation was made for
+        o   the name of the optimizer
+        d   how many optimizer runs were active, counting this one
+        p   the parameters being evaluated
+        a   the integer divisions (widths or counts) made from the parameters
+        s   the score; bad parameters have a score of at least 1e12
+        c   the parts of the score the optimizer reports
+        t   the time taken in seconds, including evaluations made within this one
+
+    benchmarks/optimizer_trace.py summarizes traces
+"""
+from __future__ import annotations
+
+import contextlib
+import gzip
+import json
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Callable, Dict, IO, Iterator, List, Optional, Tuple
+
+# The trace being written, or None when not tracing
+_TRACE: Optional[OptimizerTrace] = None
+
+
+class OptimizerTrace:
+    """ Writes evaluation records to a file """
+
+    def __init__(self, file: IO[str]):
+        self.file = file
+        self.evaluations = 0
+        self.runs = 0
+        # The runs in progress, innermost last
+        self.run_stack: List[int] = []
+        # The records of the evaluations in progress, innermost last
+        self.stack: List[Dict] = []
+
+    @contextlib.contextmanager
+    def run(self):
+        """ Mark an optimizer run, so evaluations know how deeply they are nested """
+        self.runs += 1
+        self.run_stack.append(self.runs)
+        try:
+            yield
+        finally:
+            self.run_stack.pop()
+
+    def evaluate(self, optimizer, params: Tuple[float, ...], evaluation: Callable) -> Tuple[float, object]:
+        """ Call the evaluation, recording it """
+        self.evaluations += 1
+        record = dict(i=self.evaluations, u=self.stack[-1]['i'] if self.stack else 0,
+                      r=self.run_stack[-1] if self.run_stack else 0, o=optimizer.name, d=len(self.run_stack),
+                      p=[round(float(v), 6) for v in params], a=[])
+        self.stack.append(record)
+        start = time.perf_counter()
+        try:
+            f, item = evaluation(params)
+        finally:
+            record['t'] = round(time.perf_counter() - start, 6)
+            self.stack.pop()
+        record['s'] = float(f)
+        record['c'] = optimizer.score_components(item) if item is not None else {}
+        self.file.write(json.dumps(record, separators=(',', ':')) + '\n')
+        return f, item
+
+    def allocated(self, division: Tuple[int, ...]):
+        """ Note the integer division made from the parameters of the current evaluation """
+        if self.stack:
+            self.stack[-1]['a'].append(list(division))
+
+
+def current() -> Optional[OptimizerTrace]:
+    return _TRACE
+
+
+@contextlib.contextmanager
+def tracing(path: Path):
+    """ Record every optimizer evaluation made within this context to the file """
+    global _TRACE
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    previous = _TRACE
+    with _open(path, 'wt') as file:
+        _TRACE = OptimizerTrace(file)
+        try:
+            yield _TRACE
+        finally:
+            _TRACE = previous
+
+
+def read(path: Path) -> Iterator[Dict]:
+    with _open(Path(path), 'rt') as file:
+        for line in file:
+            yield json.loads(line)
+
+
+def summarize(records: List[Dict]) -> str:
+    """ Evaluations and time per optimizer, repeated evaluations of the same division, and time per nesting level """
+    by_id = {r['i']: r for r in records}
+    nested_time = defaultdict(float)
+    for r in records:
+        if r['u'] in by_id:
+            nested_time[r['u']] += r['t']
+
+    lines = ['%-28s %8s %8s %8s %10s %10s' % ('optimizer', 'runs', 'evals', 'repeats', 'time (s)', 'own (s)')]
+    names = sorted({r['o'] for r in records}, key=lambda n: -sum(r['t'] for r in records if r['o'] == n))
+    for name in names:
+        mine = [r for r in records if r['o'] == name]
+        # The same division evaluated again in the same run cannot give a different result
+        seen = Counter((r['r'], json.dumps(r['a'] or r['p'])) for r in mine)
+        repeats = sum(n - 1 for n in seen.values())
+        top_level = [r for r in mine if r['u'] not in by_id or by_id[r['u']]['o'] != name]
+        lines.append('%-28s %8d %8d %8d %10.3f %10.3f' % (
+            name, len({r['r'] for r in mine}), len(mine), repeats, sum(r['t'] for r in top_level),
+            sum(r['t'] - nested_time[r['i']] for r in mine)))
+
+    lines.append('')
+    lines.append('%-8s %8s %10s %10s' % ('depth', 'evals', 'time (s)', 'own (s)'))
+    for depth in sorted({r['d'] for r in records}):
+        level = [r for r in records if r['d'] == depth]
+        lines.append('%-8d %8d %10.3f %10.3f' % (depth, len(level), sum(r['t'] for r in level),
+                                                  sum(r['t'] - nested_time[r['i']] for r in level)))
+    return '\n'.join(lines)
+
+
+def _open(path: Path, mode: str):
+    return gzip.open(path, mode) if path.suffix == '.gz' else open(path, mode)
@@ -1,15 +1,42 @@
+"""
+    Makes PDF character sheets from the ReStructuredText files in the character directories
+
+    Usage: python zeesheet.py [OPTIONS] [NAME ...]
+
+    Makes a sheet for each named directory in '_characters', or for every directory if none are named. Character
+    files exported from other tools (*.dnd4e, *.json) are converted to ReStructuredText first.
+
+    A file may hold several characters, each starting at a '.. character::' directive or, without those, after a
+    hard page break ('====' transition); the characters are laid out in parallel and share the file's styles.
+
+    With --party, the sheets are made into one PDF, '_characters/party.pdf', with a bookmark for each character.
+    The sheets are laid out in parallel, and fonts and images they share are stored once.
+
+    Options
+    -------
+
+    --draft                 Quick layout without optimization, for checking content
+    --no-cache              Read and lay out everything afresh, storing nothing
+    --clear-layout-cache    Remove all stored block layouts before starting, even with --no-cache
+    --trace                 Record every optimizer evaluation in '_tmp/traces'; stored layouts are not used,
+                            so every search runs
+    --party                 Make one PDF holding all the sheets
+    --log-level=LEVEL       Log messages at this level and above (such as DEBUG), whatever resources/logging.yaml
+                            says, writing them all to the log file. FINE, below DEBUG, also traces reading, layout
+                            and the optimizers in detail
+    --help                  Show this message
+"""
 from __future__ import annotations
 
+import logging
 import subprocess
 import sys
+import textwrap
 import time
 from pathlib import Path
 from typing import Optional
 
-import converters
-from layout import PDF, layout_sheet
-from structure import reader
-from util import configured_logger
+from util import configure_logging, configured_logger, trace
 
 LOGGER = configured_logger(__name__)
 
@@ -28,12 +55,51 @@ if __name__ == '__main__':
 
     DEBUG = False
 
+    # Options start with '--'; everything else names a character directory
+    options = {a for a in sys.argv[1:] if a.startswith('--')}
+    names = [a for a in sys.argv[1:] if not a.startswith('--')]
+    if '--help' in options:
+        print(textwrap.dedent(__doc__).strip())
+        sys.exit(0)
+
+    # Log level names are those of the logging module, with FINE below DEBUG
+    LEVEL = next((o.split('=', 1)[1] for o in options if o.startswith('--log-level=')), None)
+    LOG_LEVEL = logging.getLevelName(LEVEL.upper()) if LEVEL else None
+    if LEVEL and not isinstance(LOG_LEVEL, int):
+        print("Unknown log level '%s'" % LEVEL)
+        sys.exit(2)
+    configure_logging(level=LOG_LEVEL)
+
+    # Imported only once it is known sheets will be made, as the layout code takes a while to import
+    from layout import LayoutCache, PDF, layout_sheet, make_book, make_sheet
+    from structure import reader
+
+    # Quick layout without optimization, for checking content
+    DRAFT = '--draft' in options
+    # Sheets and block layouts are stored once made, and only made again when they change
+    CACHE_DIR = None if '--no-cache' in options else Path(__file__).parent.joinpath('_tmp', 'cache', 'sheets')
+    LAYOUT_CACHE_FILE = Path(__file__).parent.joinpath('_tmp', 'cache', 'layouts.sqlite')
+    LAYOUT_CACHE = None if '--no-cache' in options else LayoutCache(LAYOUT_CACHE_FILE)
+    if '--clear-layout-cache' in options:
+        # Cleared even when not used for this run, so the stored layouts are gone as asked
+        if LAYOUT_CACHE is None:
+            cleared = LayoutCache(LAYOUT_CACHE_FILE)
+            cleared.clear()
+            cleared.close()
+        else:
+            LAYOUT_CACHE.clear()
+        print("Removed all stored block layouts")
+    # Record every optimizer evaluation; summarize with benchmarks/optimizer_trace.py
+    TRACE_DIR = Path(__file__).parent.joinpath('_tmp', 'traces') if '--trace' in options else None
+    # Sheets for the party book, made once all are found
+    PARTY = [] if '--party' in options else None
+
     character_dir = Path(__file__).parent.joinpath('_characters')
     if not character_dir.exists():
         raise ValueError("character director '%s' does not exist", character_dir)
 
-    if len(sys.argv) > 1:
-        target_directories = [character_dir.joinpath(name) for name in sys.argv[1:]]
+    if names:
+        target_directories = [character_dir.joinpath(name) for name in names]
     else:
         target_directories = [f for f in character_dir.glob('*') if f.is_dir()]
 
@@ -43,24 +109,46 @@ if __name__ == '__main__':
 
         file_4e = find_file(d, 'dnd4e')
         if file_4e:
+            import converters
             print("  .. Converting '%s' to ReStructuredText file" % file_4e.name)
             result = converters.convert_dnd4e(file_4e)
             print("  .. ReStructuredText file = %s" % result)
 
         file_pf2 = find_file(d, 'json')
         if file_pf2:
+            import converters
             print("  .. Converting '%s' to ReStructuredText file" % file_pf2.name)
             result = converters.convert_pf2(file_pf2)
             print("  .. ReStructuredText file = %s" % result)
 
         file_rst = find_file(d, 'rst')
-        if file_rst:
-            sheet = reader.read_sheet(file_rst)
+        if file_rst and PARTY is not None:
+            PARTY.append(file_rst)
+        elif file_rst:
             out = file_rst.parent.joinpath(file_rst.stem + '.pdf')
-            context = PDF(out, sheet.pagesize, debug=DEBUG)
-            layout_sheet(sheet, context)
+            if TRACE_DIR:
+                # Traced in this process and without stored layouts, so the trace holds every evaluation
+                sheet = reader.read_sheet(file_rst, cache_dir=CACHE_DIR)
+                context = PDF(out, sheet.pagesize, debug=DEBUG, draft=DRAFT, layout_cache=None)
+                trace_file = TRACE_DIR.joinpath(file_rst.stem + '.jsonl.gz')
+                with trace.tracing(trace_file):
+                    layout_sheet(sheet, context)
+                print("  .. Optimizer trace written to %s" % trace_file)
+            else:
+                make_sheet(file_rst, out, layout_cache=LAYOUT_CACHE, cache_dir=CACHE_DIR, debug=DEBUG, draft=DRAFT)
             subprocess.run(['open', out], check=True)
         else:
             print(" .. No ReStructuredText file (*.rst) found, skipping directory")
 
         print("  .. Completed '%s' in %1.1f seconds" % (d.name, time.time() - t))
+
+    if PARTY:
+        t = time.time()
+        print("Making party book of %d sheets" % len(PARTY))
+        out = make_book(PARTY, character_dir.joinpath('party.pdf'), layout_cache=LAYOUT_CACHE, cache_dir=CACHE_DIR,
+                        draft=DRAFT)
+        subprocess.run(['open', out], check=True)
+        print("  .. Completed party book in %1.1f seconds" % (time.time() - t))
+
+    if LAYOUT_CACHE is not None:
+        LAYOUT_CACHE.close()